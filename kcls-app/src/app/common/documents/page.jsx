@@ -11,6 +11,7 @@ import { alpha } from '@mui/material/styles';
 import DocumentFormModal from '../../../components/DocumentFormModal.jsx';
 import DocumentPDFViewer from '../../../components/DocumentPDFViewer.jsx';
 import { logAudit } from '../../../utils/auditLogger.js'; // NEW
+import { CHUNKED_UPLOAD_THRESHOLD, uploadInChunks } from '../../../utils/chunkedUpload.js';
 
 const DocumentManagementPage = () => {
   const theme = useTheme(), API_BASE = import.meta.env.VITE_API_BASE;
@@ -114,6 +115,11 @@ const DocumentManagementPage = () => {
         showToast('Document updated');
         logAudit('DOC_UPDATE', 'Document', docId, { title: payload.Title || editDoc.Title });
       } else {
+        const file = formData.get ? formData.get('file') : null;
+        if (file instanceof File && file.size > CHUNKED_UPLOAD_THRESHOLD) {
+          formData.delete('file');
+          formData.append('upload_id', await uploadInChunks(file));
+        }
         const res = await axios.post(`${API_BASE}/documents/upload`, formData, {
           headers: { 'Content-Type': 'multipart/form-data' }
         });
@@ -346,8 +352,22 @@ const DocumentManagementPage = () => {
                         <React.Fragment key={doc.Document_ID}>
                           <TableRow hover>
                             <TableCell sx={{ maxWidth: 320 }}>
-                              <Typography variant="subtitle2" sx={{ fontWeight: 800 }}>{doc.Title || 'Untitled Document'}</Typography>
-                              <Typography variant="caption" color="text.secondary">{doc.Classification || ''}</Typography>
+                              <Stack direction="row" spacing={1.5} alignItems="center">
+                                {doc.File_Path && (
+                                  <Box
+                                    component="img"
+                                    src={`${API_BASE}/documents/${doc.Document_ID}/thumbnail`}
+                                    alt=""
+                                    loading="lazy"
+                                    onError={e => { e.currentTarget.style.display = 'none'; }}
+                                    sx={{ width: 40, height: 52, objectFit: 'cover', borderRadius: 0.5, border: `1px solid ${theme.palette.divider}`, flexShrink: 0 }}
+                                  />
+                                )}
+                                <Box sx={{ minWidth: 0 }}>
+                                  <Typography variant="subtitle2" sx={{ fontWeight: 800 }}>{doc.Title || 'Untitled Document'}</Typography>
+                                  <Typography variant="caption" color="text.secondary">{doc.Classification || ''}</Typography>
+                                </Box>
+                              </Stack>
                             </TableCell>
                             <TableCell>{doc.Author || '—'}</TableCell>
                             <TableCell>{doc.Category || '—'}</TableCell>
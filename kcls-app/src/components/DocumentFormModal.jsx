@@ -35,6 +35,7 @@ import {
 import axios from "axios";
 import { formatDate } from '../utils/date';
 import DocumentPDFViewer from "./DocumentPDFViewer"; // NEW
+import { CHUNKED_UPLOAD_THRESHOLD, uploadInChunks } from "../utils/chunkedUpload";
 
 const initialForm = {
   title: "", author: "", category: "", department: "", classification: "",
@@ -416,7 +417,11 @@ function DocumentFormModal({ open, onClose, onSave, isEdit, documentData, locati
     setUploadProgress(0);
     try {
       const fd = new FormData();
-      fd.append("file", file);
+      if (file.size > CHUNKED_UPLOAD_THRESHOLD) {
+        fd.append("upload_id", await uploadInChunks(file, { onProgress: setUploadProgress }));
+      } else {
+        fd.append("file", file);
+      }
       const res = await axios.put(`${API_BASE}/upload/edit/${documentData.Document_ID}`, fd, {
         headers: { "Content-Type": "multipart/form-data" },
         onUploadProgress: (pe) =>
@@ -439,10 +444,20 @@ function DocumentFormModal({ open, onClose, onSave, isEdit, documentData, locati
     try {
       const fd = new FormData();
       fd.append("file", file);
-      const res = await axios.post(`${API_BASE}/analyze`, fd, {
+      // Analysis runs as a background job; poll until it settles.
+      const submit = await axios.post(`${API_BASE}/analyze/jobs`, fd, {
         headers: { "Content-Type": "multipart/form-data" }
       });
-      const record = res.data?.record || {};
+      const jobId = submit.data?.job_id;
+      let job = null;
+      for (let attempt = 0; attempt < 200; attempt++) {
+        await new Promise(resolve => setTimeout(resolve, 1500));
+        const res = await axios.get(`${API_BASE}/analyze/jobs/${jobId}`);
+        job = res.data;
+        if (!["queued", "running"].includes(job?.status)) break;
+      }
+      if (job?.status !== "done") throw new Error(job?.error || `analysis ${job?.status || "timed out"}`);
+      const record = job.record || {};
       setForm(prev => ({
         ...prev,
         title: record.Title || prev.title,
@@ -51,7 +51,7 @@ const Section = ({ title, subtitle, children }) => {
 const UserDetailsModal = ({ open, onClose, user, onEdit }) => {
   const theme = useTheme();
   const borrower = user?.borrower;
-  const hasAttachment = Boolean(borrower?.AttachmentPdfBase64 || borrower?.AttachmentPath);
+  const hasAttachment = Boolean(borrower?.Attachment || borrower?.AttachmentPdfBase64 || borrower?.AttachmentPath);
   const [viewerOpen, setViewerOpen] = useState(false);
   const [viewerUrl, setViewerUrl] = useState('');
   const [viewerTitle, setViewerTitle] = useState('');
@@ -85,7 +85,11 @@ const UserDetailsModal = ({ open, onClose, user, onEdit }) => {
     try {
       let nextUrl = '';
       let nextObjectUrl = null;
-      if (borrower.AttachmentPdfBase64) {
+      if (borrower.Attachment?.url) {
+        // Streamed on demand; user lists no longer inline the PDF.
+        const base = (import.meta.env?.VITE_API_BASE || '').replace(/\/+$/, '');
+        nextUrl = `${base}${borrower.Attachment.url}`;
+      } else if (borrower.AttachmentPdfBase64) {
         const binaryString = window.atob(borrower.AttachmentPdfBase64);
         const len = binaryString.length;
         const bytes = new Uint8Array(len);
@@ -0,0 +1,44 @@
+import axios from 'axios';
+const API_BASE = import.meta.env.VITE_API_BASE;
+
+// Files above this size go through a resumable upload session instead of a
+// single multipart request.
+export const CHUNKED_UPLOAD_THRESHOLD = 32 * 1024 * 1024;
+
+const sessionUrl = (uploadId) => `${API_BASE}/documents/upload-sessions/${uploadId}`;
+
+// Uploads `file` in chunks and resolves to the session's upload_id, which
+// /documents/upload and /upload/edit/<id> accept in place of a `file` part.
+export async function uploadInChunks(file, { onProgress, retries = 3 } = {}) {
+  const { data: session } = await axios.post(`${API_BASE}/documents/upload-sessions`, {
+    filename: file.name,
+    size: file.size
+  });
+  const chunkSize = session.chunk_size;
+  let offset = session.offset || 0;
+  let failures = 0;
+  while (offset < file.size) {
+    try {
+      const { data } = await axios.patch(sessionUrl(session.upload_id), file.slice(offset, offset + chunkSize), {
+        headers: { 'Content-Type': 'application/offset+octet-stream', 'Upload-Offset': String(offset) }
+      });
+      offset = data.offset;
+      failures = 0;
+      if (onProgress) onProgress(Math.round((offset * 100) / file.size));
+    } catch (err) {
+      const status = err.response?.status;
+      if (status === 409 && typeof err.response.data?.offset === 'number') {
+        offset = err.response.data.offset;
+        continue;
+      }
+      if ((status && status < 500) || ++failures > retries) throw err;
+      // Dropped connection: ask the server how far it got and resume there.
+      await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+      try {
+        const { data } = await axios.get(sessionUrl(session.upload_id));
+        offset = data.offset;
+      } catch { /* retry from the same offset */ }
+    }
+  }
+  return session.upload_id;
+}
@@ -1,22 +1,49 @@
+from threading import Thread
+
 from flask import Flask
 from .config import Config
 from .cors import init_cors
+from .db import init_db
 from .routes import register_routes
-from app.services.auto_return import start_auto_return_service
-from app.services.auto_overdue import start_auto_overdue_service
-from app.services.auto_backup import start_auto_backup_service
+from app.services.scheduler import start_scheduler
+from app.services.analysis_jobs import resume_pending_jobs
+from app.services.active_loans import ensure_active_loans
+from app.services.user_indexes import ensure_indexes
+from app.services import blob_store, borrower_attachments, upload_catalog
+from app.services.document_classifier import warm_up as warm_up_classifier
 from .extensions import mail
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
     mail.init_app(app)
+    init_db(app)
     # Modular CORS setup
     init_cors(app, Config.CORS_ORIGINS)
     # Modular route registration
     register_routes(app)
-    start_auto_return_service(app)
-    start_auto_overdue_service(app)
-    start_auto_backup_service(app)
+    # Best-effort: logs and retries on first use if the database is down
+    try:
+        ensure_active_loans()
+    except Exception as e:
+        print(f"[active_loans] Startup check skipped: {e}")
+    try:
+        ensure_indexes()
+    except Exception as e:
+        print(f"[user_indexes] Startup check skipped: {e}")
+    # Tables written inside route transactions are created here, on their own
+    # connection, because DDL would commit the route's work half-way.
+    for service in (blob_store, upload_catalog, borrower_attachments):
+        try:
+            service.ensure_table()
+        except Exception as e:
+            print(f"[{service.__name__.rsplit('.', 1)[-1]}] Startup check skipped: {e}")
+    start_scheduler(app)
+    try:
+        resume_pending_jobs()
+    except Exception as e:
+        print(f"[analysis_jobs] Could not resume queued jobs: {e}")
+    if Config.MODEL_WARMUP:
+        Thread(target=warm_up_classifier, name="model-warmup", daemon=True).start()
 
     return app
\ No newline at end of file
@@ -21,6 +21,15 @@ def _get_int(name: str, default: int | None = None) -> int | None:
     except (TypeError, ValueError):
         return default
 
+def _get_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
 class Config:
     DB_CONFIG = {
         'host': os.getenv('DB_HOST'),
@@ -29,6 +38,44 @@ class Config:
         'password': os.getenv('DB_PASSWORD'),
         'database': os.getenv('DB_NAME'),
     }
+    # Connection pool: HTTP workers share DB_POOL_SIZE connections; scheduled
+    # jobs draw from their own DB_POOL_BACKGROUND_SIZE slice (each running job
+    # also holds one connection for its cluster lock).
+    DB_POOL_SIZE = _get_int('DB_POOL_SIZE', 10)
+    DB_POOL_BACKGROUND_SIZE = _get_int('DB_POOL_BACKGROUND_SIZE', 6)
+    DB_POOL_TIMEOUT = _get_int('DB_POOL_TIMEOUT', 10)
+    DB_POOL_RECYCLE = _get_int('DB_POOL_RECYCLE', 1800)
+    DB_POOL_PRE_PING = _get_bool('DB_POOL_PRE_PING', True)
+    # Scheduled jobs running at once per process (each uses background connections)
+    SCHEDULER_MAX_CONCURRENT_JOBS = _get_int('SCHEDULER_MAX_CONCURRENT_JOBS', 2)
+    # Background document analysis (POST /api/analyze/jobs)
+    ANALYSIS_WORKERS = _get_int('ANALYSIS_WORKERS', 2)
+    ANALYSIS_MAX_PENDING = _get_int('ANALYSIS_MAX_PENDING', 50)
+    ANALYSIS_JOB_RETENTION_DAYS = _get_int('ANALYSIS_JOB_RETENTION_DAYS', 7)
+    ANALYSIS_CACHE_ENABLED = _get_bool('ANALYSIS_CACHE_ENABLED', True)
+    ANALYSIS_CACHE_MAX_BYTES = _get_int('ANALYSIS_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+    # Page-parallel OCR; 0 workers means one process per CPU core
+    OCR_WORKERS = _get_int('OCR_WORKERS', 0)
+    OCR_PAGE_BUDGET = _get_int('OCR_PAGE_BUDGET', 50)
+    OCR_PAGE_TIMEOUT = _get_int('OCR_PAGE_TIMEOUT', 60)
+    OCR_TEXT_MIN_CHARS = _get_int('OCR_TEXT_MIN_CHARS', 200)
+    OCR_RENDER_DPI = _get_int('OCR_RENDER_DPI', 200)
+    # 'zero-shot' (BART-MNLI) or 'local' (python -m app.services.local_classifier train)
+    DOCUMENT_CLASSIFIER_BACKEND = os.getenv('DOCUMENT_CLASSIFIER_BACKEND', 'zero-shot')
+    # The local model abstains when its top label scores below this
+    LOCAL_CLASSIFIER_MIN_CONFIDENCE = _get_float('LOCAL_CLASSIFIER_MIN_CONFIDENCE', 0.40)
+    # Zero-shot classifier inference (CPU); 0 threads keeps torch's default
+    ZERO_SHOT_BATCH_SIZE = _get_int('ZERO_SHOT_BATCH_SIZE', 8)
+    ZERO_SHOT_TORCH_THREADS = _get_int('ZERO_SHOT_TORCH_THREADS', 0)
+    # Load the model at start-up instead of on the first request
+    MODEL_WARMUP = _get_bool('MODEL_WARMUP', False)
+    # One shared model-server subprocess instead of a model copy per worker
+    MODEL_SERVER_ENABLED = _get_bool('MODEL_SERVER_ENABLED', False)
+    MODEL_SERVER_PORT = _get_int('MODEL_SERVER_PORT', 8765)
+    MODEL_SERVER_AUTHKEY = os.getenv('MODEL_SERVER_AUTHKEY')
+    MODEL_SERVER_TIMEOUT = _get_int('MODEL_SERVER_TIMEOUT', 300)
+    MODEL_SERVER_BATCH_WINDOW_MS = _get_int('MODEL_SERVER_BATCH_WINDOW_MS', 15)
+    MODEL_SERVER_FALLBACK = _get_bool('MODEL_SERVER_FALLBACK', False)
     CORS_ORIGINS = [
         "https://koronadal-library.site",
         "https://api.koronadal-library.site",
@@ -37,6 +84,38 @@ class Config:
         "https://koronadal-library.vercel.app"
     ]
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', os.path.join(os.getcwd(), 'uploads'))
+    # Per-file limit, and chunk size for resumable upload sessions
+    UPLOAD_MAX_BYTES = _get_int('UPLOAD_MAX_BYTES', 512 * 1024 * 1024)
+    UPLOAD_CHUNK_BYTES = _get_int('UPLOAD_CHUNK_BYTES', 8 * 1024 * 1024)
+    # Unreferenced document blobs are deleted this long after their last use
+    BLOB_GC_GRACE_HOURS = _get_int('BLOB_GC_GRACE_HOURS', 24)
+    # How often the uploads catalog is re-scanned against the folder
+    UPLOAD_CATALOG_RESCAN_SECONDS = _get_int('UPLOAD_CATALOG_RESCAN_SECONDS', 900)
+    # Hand file bytes to the front proxy: '', 'x-accel-redirect' (nginx) or 'x-sendfile'
+    UPLOAD_SENDFILE = os.getenv('UPLOAD_SENDFILE', '')
+    UPLOAD_ACCEL_PREFIX = os.getenv('UPLOAD_ACCEL_PREFIX', '/protected-uploads/')
+    # Page previews: widths in pixels, pages rendered ahead on upload, render threads
+    PREVIEW_THUMB_WIDTH = _get_int('PREVIEW_THUMB_WIDTH', 240)
+    PREVIEW_PAGE_WIDTH = _get_int('PREVIEW_PAGE_WIDTH', 800)
+    PREVIEW_PAGES = _get_int('PREVIEW_PAGES', 3)
+    PREVIEW_WORKERS = _get_int('PREVIEW_WORKERS', 1)
+    PREVIEW_BACKFILL_BATCH = _get_int('PREVIEW_BACKFILL_BATCH', 200)
+
+    # Login lockout: failures within the window that lock a username, lock length,
+    # and the store ('database' is shared by all workers, 'memory' is per process)
+    LOGIN_LOCKOUT_ATTEMPTS = _get_int('LOGIN_LOCKOUT_ATTEMPTS', 5)
+    LOGIN_LOCKOUT_WINDOW_MINUTES = _get_int('LOGIN_LOCKOUT_WINDOW_MINUTES', 15)
+    LOGIN_LOCKOUT_MINUTES = _get_int('LOGIN_LOCKOUT_MINUTES', 5)
+    LOGIN_LOCKOUT_BACKEND = os.getenv('LOGIN_LOCKOUT_BACKEND', 'database')
+    LOGIN_LOCKOUT_MAX_KEYS = _get_int('LOGIN_LOCKOUT_MAX_KEYS', 10000)
+    # Password hashing: fixed PBKDF2 iterations, or a per-hash cost target in ms
+    # (measured at start-up, never below the minimum), and hashing threads
+    PASSWORD_HASH_ITERATIONS = _get_int('PASSWORD_HASH_ITERATIONS', 600000)
+    PASSWORD_HASH_TARGET_MS = _get_int('PASSWORD_HASH_TARGET_MS', 0)
+    PASSWORD_HASH_MIN_ITERATIONS = _get_int('PASSWORD_HASH_MIN_ITERATIONS', 600000)
+    PASSWORD_HASH_WORKERS = _get_int('PASSWORD_HASH_WORKERS', 0)
+    # Key for reset-code digests; defaults to one derived from the DB credentials
+    PASSWORD_RESET_SECRET = os.getenv('PASSWORD_RESET_SECRET')
 
     # Email / SMTP (Flask-Mail)
     MAIL_SERVER = os.getenv('MAIL_SERVER', '')
@@ -5,6 +5,7 @@ def init_cors(app, origins):
         app,
         origins=origins,
         supports_credentials=True,
-        allow_headers=["Content-Type", "Authorization"],
-        methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"]
+        allow_headers=["Content-Type", "Authorization", "Upload-Offset", "Range", "If-Range"],
+        expose_headers=["X-Next-Cursor", "X-Total-Count", "ETag", "Accept-Ranges", "Content-Range", "Content-Length"],
+        methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
     )
@@ -1,11 +1,215 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
 import mysql.connector
+from flask import jsonify
 from mysql.connector import Error
+from werkzeug.exceptions import ServiceUnavailable
+
 from .config import Config
 
-def get_db_connection():
-    try:
-        conn = mysql.connector.connect(**Config.DB_CONFIG)
-        return conn
-    except Error as e:
-        print(f"Error connecting to MariaDB: {e}")
-        return None
\ No newline at end of file
+WEB_POOL = 'web'
+BACKGROUND_POOL = 'background'
+
+
+class DatabaseUnavailable(ServiceUnavailable):
+    """Raised when no pooled connection could be borrowed in time."""
+
+    description = 'database_unavailable'
+
+
+class PooledConnection:
+    """
+    Thin proxy around a mysql.connector connection.
+    close() hands the connection back to its pool instead of closing the socket,
+    so existing `finally: conn.close()` blocks keep working unchanged.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', raw: Any, created_at: float):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool.release(self._raw, self._created_at)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    def __init__(self, name: str, size: int, timeout: float, recycle: int, pre_ping: bool, config: Dict[str, Any]):
+        self.name = name
+        self.size = max(1, int(size))
+        self.timeout = max(0.0, float(timeout))
+        self.recycle = max(0, int(recycle))
+        self.pre_ping = pre_ping
+        self._config = config
+        self._idle: deque = deque()
+        self._cond = threading.Condition()
+        self._open = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._created = 0
+        self._recycled = 0
+        self._timeouts = 0
+        self._errors = 0
+
+    def acquire(self) -> PooledConnection:
+        deadline = time.monotonic() + self.timeout
+        entry = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise DatabaseUnavailable()
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._in_use += 1
+
+        try:
+            raw, created_at = self._checkout(entry)
+        except Error as e:
+            print(f"Error connecting to MariaDB: {e}")
+            with self._cond:
+                self._errors += 1
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise DatabaseUnavailable() from e
+        return PooledConnection(self, raw, created_at)
+
+    def _connect(self):
+        raw = mysql.connector.connect(**self._config)
+        with self._cond:
+            self._created += 1
+        return raw, time.monotonic()
+
+    def _checkout(self, entry):
+        if entry is None:
+            return self._connect()
+        raw, created_at = entry
+        stale = bool(self.recycle) and time.monotonic() - created_at > self.recycle
+        if not stale and self.pre_ping:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                stale = True
+        if not stale:
+            return raw, created_at
+        self._discard(raw)
+        with self._cond:
+            self._recycled += 1
+        return self._connect()
+
+    def release(self, raw: Any, created_at: float):
+        reusable = True
+        try:
+            # End any open (possibly implicit) transaction so the next borrower
+            # does not inherit locks or a stale REPEATABLE READ snapshot.
+            if raw.in_transaction:
+                raw.rollback()
+        except Exception:
+            reusable = False
+            self._discard(raw)
+        with self._cond:
+            self._in_use -= 1
+            if reusable:
+                self._idle.append((raw, created_at))
+            else:
+                self._open -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _discard(raw: Any):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'size': self.size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiting': self._waiting,
+                'created': self._created,
+                'recycled': self._recycled,
+                'timeouts': self._timeouts,
+                'errors': self._errors,
+            }
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+_thread_pool = threading.local()
+
+
+def _pool_size(name: str) -> int:
+    if name == BACKGROUND_POOL:
+        return Config.DB_POOL_BACKGROUND_SIZE
+    return Config.DB_POOL_SIZE
+
+
+def _get_pool(name: str) -> ConnectionPool:
+    pool = _pools.get(name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                pool = ConnectionPool(
+                    name,
+                    _pool_size(name),
+                    Config.DB_POOL_TIMEOUT,
+                    Config.DB_POOL_RECYCLE,
+                    Config.DB_POOL_PRE_PING,
+                    Config.DB_CONFIG,
+                )
+                _pools[name] = pool
+    return pool
+
+
+def use_pool(name: str) -> None:
+    """Route every get_db_connection() made on the current thread to the named pool."""
+    _thread_pool.name = name
+
+
+def get_db_connection(pool: Optional[str] = None):
+    name = pool or getattr(_thread_pool, 'name', None) or WEB_POOL
+    return _get_pool(name).acquire()
+
+
+def get_pool_stats() -> Dict[str, Dict[str, Any]]:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {p.name: p.stats() for p in pools}
+
+
+def init_db(app):
+    @app.errorhandler(DatabaseUnavailable)
+    def _database_unavailable(_exc):
+        return jsonify({'error': 'database_unavailable'}), 503
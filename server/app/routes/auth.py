@@ -1,11 +1,13 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from typing import Any, Dict, Tuple, cast
 
 from flask import Blueprint, current_app, jsonify, request
 
+from ..config import Config
 from ..db import get_db_connection
+from ..services import login_lockout
 from ..services.password_reset import (
     consume_reset_code,
     request_password_reset,
@@ -15,39 +17,22 @@ from ..services.passwords import hash_password, verify_password, needs_rehash
 
 auth_bp = Blueprint('auth', __name__)
 
-LOCKOUT_ATTEMPT_LIMIT = 5
-LOCKOUT_DURATION = timedelta(minutes=5)
-_FAILED_LOGIN_ATTEMPTS: Dict[str, Dict[str, Any]] = {}
+def _locked_response(locked_until: datetime, now: datetime):
+    minutes = max(1, Config.LOGIN_LOCKOUT_MINUTES)
+    return jsonify({
+        'error': f"Too many failed attempts. Account locked for {minutes} minute{'s' if minutes != 1 else ''}.",
+        'code': 'account_locked',
+        'lockedUntil': locked_until.isoformat(),
+        'retryAfterSeconds': max(1, int((locked_until - now).total_seconds()))
+    }), 423
 
 
 def _record_failed_login(key: str, now: datetime) -> Tuple[Any, int]:
-    record = _FAILED_LOGIN_ATTEMPTS.get(key)
-    if record:
-        locked_until = record.get('locked_until')
-        if isinstance(locked_until, datetime) and now >= locked_until:
-            record = None
-
-    if not record:
-        record = {'count': 0, 'locked_until': None}
-
-    count = int(record.get('count', 0)) + 1
-    record['count'] = count
-
-    if count >= LOCKOUT_ATTEMPT_LIMIT:
-        locked_until = now + LOCKOUT_DURATION
-        record['locked_until'] = locked_until
-        _FAILED_LOGIN_ATTEMPTS[key] = record
-        retry_seconds = max(1, int((locked_until - now).total_seconds()))
-        return jsonify({
-            'error': 'Too many failed attempts. Account locked for 5 minutes.',
-            'code': 'account_locked',
-            'lockedUntil': locked_until.isoformat(),
-            'retryAfterSeconds': retry_seconds
-        }), 423
-
-    record['locked_until'] = None
-    _FAILED_LOGIN_ATTEMPTS[key] = record
-    remaining = LOCKOUT_ATTEMPT_LIMIT - count
+    count, locked_until = login_lockout.record_failure(key)
+    if locked_until is not None:
+        return _locked_response(locked_until, now)
+
+    remaining = login_lockout.attempt_limit() - count
     payload: Dict[str, Any] = {
         'error': 'Invalid username or password',
         'code': 'invalid_credentials'
@@ -73,26 +58,15 @@ def login_user():
     key = username.lower()
     now = datetime.now(timezone.utc)
 
-    existing = _FAILED_LOGIN_ATTEMPTS.get(key)
-    if existing:
-        locked_until = existing.get('locked_until')
-        if isinstance(locked_until, datetime) and now < locked_until:
-            remaining = max(1, int((locked_until - now).total_seconds()))
-            return jsonify({
-                'error': 'Too many failed attempts. Account locked for 5 minutes.',
-                'code': 'account_locked',
-                'lockedUntil': locked_until.isoformat(),
-                'retryAfterSeconds': remaining
-            }), 423
-        if isinstance(locked_until, datetime) and now >= locked_until:
-            _FAILED_LOGIN_ATTEMPTS.pop(key, None)
+    locked_until = login_lockout.locked_until(key)
+    if locked_until is not None:
+        return _locked_response(locked_until, now)
 
     conn = get_db_connection()
     if not conn:
         return jsonify({'error': 'database_unavailable'}), 500
 
     cursor = conn.cursor(dictionary=True)
-
     try:
         cursor.execute(
             """
@@ -110,57 +84,67 @@ def login_user():
             (username,),
         )
         raw_user = cursor.fetchone()
+    finally:
+        # The hash check below takes a while; do not hold the connection for it.
+        try:
+            cursor.close()
+        finally:
+            conn.close()
 
-        user_dict: Dict[str, Any] = cast(Dict[str, Any], raw_user) if raw_user else {}
-        password_hash = user_dict.get('Password')
+    user_dict: Dict[str, Any] = cast(Dict[str, Any], raw_user) if raw_user else {}
+    password_hash = user_dict.get('Password')
 
-        if not password_hash or not isinstance(password_hash, str) or not verify_password(password_hash, password):
-            response, status = _record_failed_login(key, now)
-            return response, status
+    if not password_hash or not isinstance(password_hash, str) or not verify_password(password_hash, password):
+        response, status = _record_failed_login(key, now)
+        return response, status
 
-        _FAILED_LOGIN_ATTEMPTS.pop(key, None)
+    login_lockout.clear(key)
 
-        if needs_rehash(password_hash):
-            try:
-                new_hash = hash_password(password)
-                up_cur = conn.cursor()
-                up_cur.execute(
-                    "UPDATE Users SET Password=%s WHERE UserID=%s",
-                    (new_hash, user_dict.get('UserID')),
-                )
-                conn.commit()
-                up_cur.close()
-            except Exception:
+    if needs_rehash(password_hash):
+        new_hash = hash_password(password)
+        conn = get_db_connection()
+        up_cur = conn.cursor() if conn else None
+        try:
+            if up_cur is None:
+                raise RuntimeError('database_unavailable')
+            # Only replace the hash that was verified, not a concurrent change.
+            up_cur.execute(
+                "UPDATE Users SET Password=%s WHERE UserID=%s AND Password=%s",
+                (new_hash, user_dict.get('UserID'), password_hash),
+            )
+            conn.commit()
+        except Exception:
+            # The old hash still works; the upgrade is retried next login.
+            if up_cur is not None:
                 conn.rollback()
+        finally:
+            if up_cur is not None:
+                up_cur.close()
+                conn.close()
+
+    user_payload: Dict[str, Any] = {
+        k: v for k, v in user_dict.items()
+        if k not in {'Password', 'Position', 'Type', 'Department', 'AccountStatus', 'BorrowerID', 'AttachmentPath'}
+    }
 
-        user_payload: Dict[str, Any] = {
-            k: v for k, v in user_dict.items()
-            if k not in {'Password', 'Position', 'Type', 'Department', 'AccountStatus', 'BorrowerID', 'AttachmentPath'}
+    role = user_dict.get('Role')
+    if role == 'Staff':
+        user_payload['staff'] = {'Position': user_dict.get('Position')}
+        user_payload['borrower'] = None
+    elif role == 'Borrower':
+        user_payload['borrower'] = {
+            'BorrowerID': user_dict.get('BorrowerID'),
+            'Type': user_dict.get('Type'),
+            'Department': user_dict.get('Department'),
+            'AccountStatus': user_dict.get('AccountStatus'),
+            'AttachmentPath': user_dict.get('AttachmentPath'),
         }
+        user_payload['staff'] = None
+    else:
+        user_payload['staff'] = None
+        user_payload['borrower'] = None
 
-        role = user_dict.get('Role')
-        if role == 'Staff':
-            user_payload['staff'] = {'Position': user_dict.get('Position')}
-            user_payload['borrower'] = None
-        elif role == 'Borrower':
-            user_payload['borrower'] = {
-                'BorrowerID': user_dict.get('BorrowerID'),
-                'Type': user_dict.get('Type'),
-                'Department': user_dict.get('Department'),
-                'AccountStatus': user_dict.get('AccountStatus'),
-                'AttachmentPath': user_dict.get('AttachmentPath'),
-            }
-            user_payload['staff'] = None
-        else:
-            user_payload['staff'] = None
-            user_payload['borrower'] = None
-
-        return jsonify(user_payload)
-    finally:
-        try:
-            cursor.close()
-        finally:
-            conn.close()
+    return jsonify(user_payload)
 
 
 @auth_bp.route('/auth/password/forgot', methods=['POST'])
@@ -170,6 +154,13 @@ def forgot_password_request():
     if not email:
         return jsonify({'error': 'email_required'}), 400
 
+    # Each new code restarts its guess count, so cap how often one can be
+    # issued; the answer stays the same to avoid revealing anything.
+    throttle_key = f"reset:{email.lower()}"
+    if login_lockout.locked_until(throttle_key) is not None:
+        return jsonify({'message': 'If the account exists, a reset code has been sent.'}), 200
+    login_lockout.record_failure(throttle_key)
+
     conn = get_db_connection()
     if not conn:
         return jsonify({'error': 'database_unavailable'}), 500
@@ -203,6 +194,9 @@ def reset_password():
     if not new_password or len(new_password) < 6:
         return jsonify({'error': 'password_too_short', 'minLength': 6}), 400
 
+    # Verify and spend the code in one short transaction before hashing, so
+    # a flood of bad guesses never reaches the shared hash pool and no
+    # connection is held while the hash runs.
     conn = get_db_connection()
     if not conn:
         return jsonify({'error': 'database_unavailable'}), 500
@@ -210,15 +204,32 @@ def reset_password():
     cursor = conn.cursor(dictionary=True)
     try:
         user_id = verify_reset_code(cursor, email, code)
-        if not user_id:
-            return jsonify({'error': 'invalid_or_expired_code'}), 400
+        if user_id:
+            consume_reset_code(cursor, user_id)
+        # Commit either way: a failed guess keeps its counted attempt.
+        conn.commit()
+    except Exception as exc:  # pragma: no cover - external dependency
+        conn.rollback()
+        current_app.logger.exception('Password reset failed: %s', exc)
+        return jsonify({'error': 'internal_error'}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+    if not user_id:
+        return jsonify({'error': 'invalid_or_expired_code'}), 400
+
+    hashed = hash_password(new_password)
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'database_unavailable'}), 500
 
-        hashed = hash_password(new_password)
+    cursor = conn.cursor(dictionary=True)
+    try:
         cursor.execute(
             "UPDATE Users SET Password=%s WHERE UserID=%s",
             (hashed, user_id),
         )
-        consume_reset_code(cursor, user_id)
         conn.commit()
     except Exception as exc:  # pragma: no cover - external dependency
         conn.rollback()
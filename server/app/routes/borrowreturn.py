@@ -1,13 +1,15 @@
 # pyright: reportGeneralTypeIssues=false
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify
 from app.db import get_db_connection
 from app.services.notifications import (
     notify_submit, notify_approved, notify_rejected, notify_retrieved, notify_return_recorded
 )
+from app.services.active_loans import sync_active_loans
 from app.services.audit import log_event  # NEW
 from decimal import Decimal, InvalidOperation  # NEW
-from datetime import datetime  # NEW
+from datetime import date, datetime  # NEW
+import json
 import logging  # NEW
 from typing import Any, Dict, List, Optional, cast  # NEW
 
@@ -141,6 +143,8 @@ def add_borrow_transaction():
         else:
             results.append({**create_tx(doc_items,  'Pending', False), 'route': 'admin'})
 
+        sync_active_loans(cursor, [res['transaction']['BorrowID'] for res in results])
+
         # Create notifications for each newly created transaction
         for res in results:
             borrow_id = res['transaction']['BorrowID']
@@ -167,80 +171,314 @@ def add_borrow_transaction():
         conn.close()
 
 
-# --- List all borrow transactions and their items (role filter: ?role=librarian|admin) ---
+BORROW_LIST_CHUNK = 200
+BORROW_LIST_MAX_LIMIT = 500
+BORROW_STATUSES = ('Pending', 'Approved', 'Rejected')
+BORROW_RETURN_STATUSES = ('Returned', 'Not Returned')
+
+
+def _parse_flag(value) -> bool:
+    return str(value or '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _parse_positive_int(value, name):
+    if value is None or value == '':
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a whole number.')
+    if number <= 0:
+        raise ValueError(f'{name} must be positive.')
+    return number
+
+
+def _parse_iso_date(value, name):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'{name} must be a YYYY-MM-DD date.')
+
+
+def _borrow_list_filters(args):
+    """Translate query-string filters into a WHERE clause over BorrowTransactions bt."""
+    clauses = []
+    params: List[Any] = []
+
+    role = (args.get('role') or '').lower()
+    has_document = "EXISTS (SELECT 1 FROM BorrowedItems bi WHERE bi.BorrowID=bt.BorrowID AND bi.ItemType='Document')"
+    if role == 'librarian':
+        clauses.append(f"NOT {has_document}")
+    elif role == 'admin':
+        clauses.append(has_document)
+
+    status = (args.get('status') or '').strip()
+    if status:
+        match = next((s for s in BORROW_STATUSES if s.lower() == status.lower()), None)
+        if not match:
+            raise ValueError(f"status must be one of: {', '.join(BORROW_STATUSES)}.")
+        clauses.append('bt.ApprovalStatus=%s')
+        params.append(match)
+
+    return_status = (args.get('returnStatus') or '').strip()
+    if return_status:
+        match = next((s for s in BORROW_RETURN_STATUSES if s.lower() == return_status.lower()), None)
+        if not match:
+            raise ValueError(f"returnStatus must be one of: {', '.join(BORROW_RETURN_STATUSES)}.")
+        clauses.append('bt.ReturnStatus=%s')
+        params.append(match)
+
+    borrower_id = _parse_positive_int(args.get('borrowerId'), 'borrowerId')
+    if borrower_id is not None:
+        clauses.append('bt.BorrowerID=%s')
+        params.append(borrower_id)
+
+    date_from = _parse_iso_date(args.get('from'), 'from')
+    if date_from:
+        clauses.append('bt.BorrowDate >= %s')
+        params.append(date_from)
+    date_to = _parse_iso_date(args.get('to'), 'to')
+    if date_to:
+        clauses.append('bt.BorrowDate <= %s')
+        params.append(date_to)
+
+    return clauses, params
+
+
+def _attach_borrow_details(cursor, transactions):
+    """Nest items, per-item return history and the latest return into each transaction."""
+    borrow_ids = [tx.get('BorrowID') for tx in transactions if tx.get('BorrowID') is not None]
+    items_by_borrow: Dict[Optional[int], List[Dict[str, Any]]] = {}
+    returns_by_borrow: Dict[Optional[int], Dict[str, Any]] = {}
+    returned_items_by_borrowed: Dict[Optional[int], List[Dict[str, Any]]] = {}
+
+    if borrow_ids:
+        fmt = ','.join(['%s'] * len(borrow_ids))
+        cursor.execute(f"SELECT * FROM BorrowedItems WHERE BorrowID IN ({fmt})", tuple(borrow_ids))
+        for item in cast(List[Dict[str, Any]], cursor.fetchall() or []):
+            items_by_borrow.setdefault(item.get('BorrowID'), []).append(item)
+        cursor.execute(f"""
+            SELECT BorrowID, ReturnID, ReturnDate, Remarks
+            FROM ReturnTransactions
+            WHERE BorrowID IN ({fmt})
+            ORDER BY BorrowID ASC, ReturnDate DESC, ReturnID DESC
+        """, tuple(borrow_ids))
+        for ret in cast(List[Dict[str, Any]], cursor.fetchall() or []):
+            returns_by_borrow.setdefault(ret.get('BorrowID'), ret)
+        cursor.execute(f"""
+            SELECT
+                ri.ReturnedItemID,
+                ri.ReturnID,
+                ri.BorrowedItemID,
+                ri.ReturnCondition,
+                ri.Fine,
+                ri.FinePaid,
+                rt.BorrowID,
+                rt.ReturnDate,
+                rt.Remarks AS ReturnRemarks
+            FROM ReturnedItems ri
+            JOIN ReturnTransactions rt ON rt.ReturnID = ri.ReturnID
+            WHERE rt.BorrowID IN ({fmt})
+            ORDER BY rt.ReturnDate DESC, ri.ReturnedItemID DESC
+        """, tuple(borrow_ids))
+        for row in cast(List[Dict[str, Any]], cursor.fetchall() or []):
+            fine_value = row.get('Fine')
+            if isinstance(fine_value, Decimal):
+                row['Fine'] = float(fine_value)
+            returned_items_by_borrowed.setdefault(row.get('BorrowedItemID'), []).append(row)
+
+    for tx in transactions:
+        item_list = items_by_borrow.get(tx.get('BorrowID'), [])
+        for item in item_list:
+            history = returned_items_by_borrowed.get(item.get('BorrowedItemID'), [])
+            item['returnHistory'] = history
+            item['latestReturn'] = history[0] if history else None
+        tx['items'] = item_list
+        latest_return = returns_by_borrow.get(tx.get('BorrowID')) or {}
+        tx['ReturnDate'] = latest_return.get('ReturnDate')
+        tx['ReturnRemarks'] = latest_return.get('Remarks')
+    return transactions
+
+
+# --- List borrow transactions and their items ---
+# Filters: ?role=librarian|admin, status, returnStatus, borrowerId, from/to (BorrowDate)
+# Keyset paging: ?limit=N&cursor=<last BorrowID>; the next cursor is returned in X-Next-Cursor.
+# ?count=1 adds X-Total-Count. The body stays a JSON array and is streamed chunk by chunk.
 @borrowreturn_bp.route('/borrow', methods=['GET'])
 def list_borrow_transactions():
-    role = (request.args.get('role') or '').lower()
+    try:
+        clauses, params = _borrow_list_filters(request.args)
+        after_id = _parse_positive_int(request.args.get('cursor'), 'cursor') or 0
+        limit = _parse_positive_int(request.args.get('limit'), 'limit')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if limit is not None:
+        limit = min(limit, BORROW_LIST_MAX_LIMIT)
+    where = ' AND '.join(clauses) if clauses else '1=1'
 
     conn: Any = get_db_connection()
     cursor = conn.cursor(dictionary=True)
+
+    def _close():
+        cursor.close()
+        conn.close()
+
+    headers = {}
+    upper_id = None
     try:
-        cursor.execute("SELECT * FROM BorrowTransactions")
-        transactions = cast(List[Dict[str, Any]], cursor.fetchall() or [])
-
-        borrow_ids = [tx.get('BorrowID') for tx in transactions if tx.get('BorrowID') is not None]
-        items_by_borrow: Dict[Optional[int], List[Dict[str, Any]]] = {}
-        returns_by_borrow: Dict[Optional[int], Dict[str, Any]] = {}
-        returned_items_by_borrowed: Dict[Optional[int], List[Dict[str, Any]]] = {}
-
-        if borrow_ids:
-            fmt = ','.join(['%s'] * len(borrow_ids))
-            cursor.execute(f"SELECT * FROM BorrowedItems WHERE BorrowID IN ({fmt})", tuple(borrow_ids))
-            for item in cast(List[Dict[str, Any]], cursor.fetchall() or []):
-                items_by_borrow.setdefault(item.get('BorrowID'), []).append(item)
+        if _parse_flag(request.args.get('count')):
+            cursor.execute(f"SELECT COUNT(*) AS c FROM BorrowTransactions bt WHERE {where}", tuple(params))
+            headers['X-Total-Count'] = str((cursor.fetchone() or {}).get('c', 0))
+        if limit is not None:
             cursor.execute(f"""
-                SELECT BorrowID, ReturnID, ReturnDate, Remarks
-                FROM ReturnTransactions
-                WHERE BorrowID IN ({fmt})
-                ORDER BY BorrowID ASC, ReturnDate DESC, ReturnID DESC
-            """, tuple(borrow_ids))
-            for ret in cast(List[Dict[str, Any]], cursor.fetchall() or []):
-                returns_by_borrow.setdefault(ret.get('BorrowID'), ret)
-            cursor.execute(f"""
-                SELECT
-                    ri.ReturnedItemID,
-                    ri.ReturnID,
-                    ri.BorrowedItemID,
-                    ri.ReturnCondition,
-                    ri.Fine,
-                    ri.FinePaid,
-                    rt.BorrowID,
-                    rt.ReturnDate,
-                    rt.Remarks AS ReturnRemarks
-                FROM ReturnedItems ri
-                JOIN ReturnTransactions rt ON rt.ReturnID = ri.ReturnID
-                WHERE rt.BorrowID IN ({fmt})
-                ORDER BY rt.ReturnDate DESC, ri.ReturnedItemID DESC
-            """, tuple(borrow_ids))
-            for row in cast(List[Dict[str, Any]], cursor.fetchall() or []):
-                fine_value = row.get('Fine')
-                if isinstance(fine_value, Decimal):
-                    row['Fine'] = float(fine_value)
-                returned_items_by_borrowed.setdefault(row.get('BorrowedItemID'), []).append(row)
-
-        # Role filtering
-        if role == 'librarian':
-            transactions = [tx for tx in transactions
-                             if not any((it.get('ItemType') == 'Document') for it in items_by_borrow.get(tx.get('BorrowID'), []))]
-        elif role == 'admin':
-            transactions = [tx for tx in transactions
-                             if any((it.get('ItemType') == 'Document') for it in items_by_borrow.get(tx.get('BorrowID'), []))]
+                SELECT bt.BorrowID FROM BorrowTransactions bt
+                WHERE {where} AND bt.BorrowID > %s
+                ORDER BY bt.BorrowID ASC
+                LIMIT %s
+            """, tuple(params) + (after_id, limit + 1))
+            page_ids = [r['BorrowID'] for r in cursor.fetchall() or []]
+            if len(page_ids) > limit:
+                headers['X-Next-Cursor'] = str(page_ids[limit - 1])
+            upper_id = page_ids[min(limit, len(page_ids)) - 1] if page_ids else after_id
+    except Exception:
+        _close()
+        raise
 
-        for tx in transactions:
-            item_list = items_by_borrow.get(tx.get('BorrowID'), [])
-            for item in item_list:
-                history = returned_items_by_borrowed.get(item.get('BorrowedItemID'), [])
-                item['returnHistory'] = history
-                item['latestReturn'] = history[0] if history else None
-            tx['items'] = item_list
-            latest_return = returns_by_borrow.get(tx.get('BorrowID')) or {}
-            tx['ReturnDate'] = latest_return.get('ReturnDate')
-            tx['ReturnRemarks'] = latest_return.get('Remarks')
+    dumps = current_app.json.dumps
 
-        return jsonify(transactions), 200
-    finally:
-        cursor.close()
-        conn.close()
+    def _generate():
+        try:
+            yield '['
+            first = True
+            last_id = after_id
+            while upper_id is None or last_id < upper_id:
+                bound_sql = '' if upper_id is None else ' AND bt.BorrowID <= %s'
+                bound_params = () if upper_id is None else (upper_id,)
+                cursor.execute(f"""
+                    SELECT bt.* FROM BorrowTransactions bt
+                    WHERE {where} AND bt.BorrowID > %s{bound_sql}
+                    ORDER BY bt.BorrowID ASC
+                    LIMIT %s
+                """, tuple(params) + (last_id,) + bound_params + (BORROW_LIST_CHUNK,))
+                transactions = cast(List[Dict[str, Any]], cursor.fetchall() or [])
+                if not transactions:
+                    break
+                _attach_borrow_details(cursor, transactions)
+                for tx in transactions:
+                    yield ('' if first else ',') + dumps(tx)
+                    first = False
+                last_id = transactions[-1]['BorrowID']
+                if len(transactions) < BORROW_LIST_CHUNK:
+                    break
+            yield ']'
+        finally:
+            _close()
+
+    response = Response(_generate(), mimetype='application/json', headers=headers)
+    # Covers clients that disconnect before the generator starts.
+    response.call_on_close(_close)
+    return response
+
+
+# One round-trip: items and their return history are nested with JSON_ARRAYAGG.
+# JSON_EXTRACT(..., '$') keeps MariaDB from escaping the nested arrays as strings.
+BORROWER_HISTORY_SQL = """
+    SELECT
+        bt.*,
+        lr.ReturnDate AS LatestReturnDate,
+        lr.Remarks AS LatestReturnRemarks,
+        COALESCE(f.FineTotal, 0) AS FineTotal,
+        COALESCE(f.FineUnpaid, 0) AS FineUnpaid,
+        (
+            SELECT JSON_ARRAYAGG(
+                JSON_OBJECT(
+                    'BorrowedItemID', bi.BorrowedItemID,
+                    'BorrowID', bi.BorrowID,
+                    'ItemType', bi.ItemType,
+                    'BookCopyID', bi.BookCopyID,
+                    'DocumentStorageID', bi.DocumentStorageID,
+                    'Document_ID', bi.Document_ID,
+                    'InitialCondition', bi.InitialCondition,
+                    'returnHistory', JSON_EXTRACT(COALESCE((
+                        SELECT JSON_ARRAYAGG(
+                            JSON_OBJECT(
+                                'ReturnedItemID', ri.ReturnedItemID,
+                                'ReturnID', ri.ReturnID,
+                                'BorrowedItemID', ri.BorrowedItemID,
+                                'ReturnCondition', ri.ReturnCondition,
+                                'Fine', ri.Fine,
+                                'FinePaid', ri.FinePaid,
+                                'BorrowID', rt.BorrowID,
+                                'ReturnDate', rt.ReturnDate,
+                                'ReturnRemarks', rt.Remarks
+                            )
+                            ORDER BY rt.ReturnDate DESC, ri.ReturnedItemID DESC
+                        )
+                        FROM ReturnedItems ri
+                        JOIN ReturnTransactions rt ON rt.ReturnID = ri.ReturnID
+                        WHERE ri.BorrowedItemID = bi.BorrowedItemID
+                    ), '[]'), '$')
+                )
+                ORDER BY bi.BorrowedItemID
+            )
+            FROM BorrowedItems bi
+            WHERE bi.BorrowID = bt.BorrowID
+        ) AS ItemsJson
+    FROM BorrowTransactions bt
+    LEFT JOIN ReturnTransactions lr ON lr.ReturnID = (
+        SELECT r.ReturnID
+        FROM ReturnTransactions r
+        WHERE r.BorrowID = bt.BorrowID
+        ORDER BY r.ReturnDate DESC, r.ReturnID DESC
+        LIMIT 1
+    )
+    LEFT JOIN (
+        SELECT
+            rt.BorrowID,
+            SUM(ri.Fine) AS FineTotal,
+            SUM(CASE WHEN ri.FinePaid='Yes' THEN 0 ELSE ri.Fine END) AS FineUnpaid
+        FROM BorrowTransactions b
+        JOIN ReturnTransactions rt ON rt.BorrowID = b.BorrowID
+        JOIN ReturnedItems ri ON ri.ReturnID = rt.ReturnID
+        WHERE b.BorrowerID = %s
+        GROUP BY rt.BorrowID
+    ) f ON f.BorrowID = bt.BorrowID
+    WHERE bt.BorrowerID = %s
+    ORDER BY bt.BorrowID ASC
+"""
+
+
+def _as_date(value):
+    if isinstance(value, str):
+        try:
+            return date.fromisoformat(value[:10])
+        except ValueError:
+            return value
+    return value
+
+
+def _fetch_borrower_history(cursor, borrower_id):
+    cursor.execute(BORROWER_HISTORY_SQL, (borrower_id, borrower_id))
+    transactions = cast(List[Dict[str, Any]], cursor.fetchall() or [])
+    for tx in transactions:
+        raw_items = tx.pop('ItemsJson', None)
+        if isinstance(raw_items, (bytes, bytearray)):
+            raw_items = raw_items.decode('utf-8')
+        items = json.loads(raw_items) if raw_items else []
+        for item in items:
+            history = item.get('returnHistory') or []
+            for entry in history:
+                entry['ReturnDate'] = _as_date(entry.get('ReturnDate'))
+            item['returnHistory'] = history
+            item['latestReturn'] = history[0] if history else None
+        tx['items'] = items
+        tx['ReturnDate'] = tx.pop('LatestReturnDate', None)
+        tx['ReturnRemarks'] = tx.pop('LatestReturnRemarks', None)
+        tx['FineTotal'] = float(tx.get('FineTotal') or 0)
+        tx['FineUnpaid'] = float(tx.get('FineUnpaid') or 0)
+    return transactions
 
 
 # --- Get all borrow transactions for a specific borrower ---
@@ -249,63 +487,7 @@ def get_borrower_transactions(borrower_id):
     conn: Any = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("SELECT * FROM BorrowTransactions WHERE BorrowerID=%s", (borrower_id,))
-        transactions = cast(List[Dict[str, Any]], cursor.fetchall() or [])
-
-        borrow_ids = [tx.get('BorrowID') for tx in transactions if tx.get('BorrowID') is not None]
-        items_by_borrow: Dict[Optional[int], List[Dict[str, Any]]] = {}
-        returns_by_borrow: Dict[Optional[int], Dict[str, Any]] = {}
-        returned_items_by_borrowed: Dict[Optional[int], List[Dict[str, Any]]] = {}
-
-        if borrow_ids:
-            fmt = ','.join(['%s'] * len(borrow_ids))
-            cursor.execute(f"SELECT * FROM BorrowedItems WHERE BorrowID IN ({fmt})", tuple(borrow_ids))
-            for item in cast(List[Dict[str, Any]], cursor.fetchall() or []):
-                items_by_borrow.setdefault(item.get('BorrowID'), []).append(item)
-
-            cursor.execute(f"""
-                SELECT BorrowID, ReturnID, ReturnDate, Remarks
-                FROM ReturnTransactions
-                WHERE BorrowID IN ({fmt})
-                ORDER BY BorrowID ASC, ReturnDate DESC, ReturnID DESC
-            """, tuple(borrow_ids))
-            for ret in cast(List[Dict[str, Any]], cursor.fetchall() or []):
-                returns_by_borrow.setdefault(ret.get('BorrowID'), ret)
-
-            cursor.execute(f"""
-                SELECT
-                    ri.ReturnedItemID,
-                    ri.ReturnID,
-                    ri.BorrowedItemID,
-                    ri.ReturnCondition,
-                    ri.Fine,
-                    ri.FinePaid,
-                    rt.BorrowID,
-                    rt.ReturnDate,
-                    rt.Remarks AS ReturnRemarks
-                FROM ReturnedItems ri
-                JOIN ReturnTransactions rt ON rt.ReturnID = ri.ReturnID
-                WHERE rt.BorrowID IN ({fmt})
-                ORDER BY rt.ReturnDate DESC, ri.ReturnedItemID DESC
-            """, tuple(borrow_ids))
-            for row in cast(List[Dict[str, Any]], cursor.fetchall() or []):
-                fine_value = row.get('Fine')
-                if isinstance(fine_value, Decimal):
-                    row['Fine'] = float(fine_value)
-                returned_items_by_borrowed.setdefault(row.get('BorrowedItemID'), []).append(row)
-
-        for tx in transactions:
-            item_list = items_by_borrow.get(tx.get('BorrowID'), [])
-            for item in item_list:
-                history = returned_items_by_borrowed.get(item.get('BorrowedItemID'), [])
-                item['returnHistory'] = history
-                item['latestReturn'] = history[0] if history else None
-            tx['items'] = item_list
-            latest_return = returns_by_borrow.get(tx.get('BorrowID')) or {}
-            tx['ReturnDate'] = latest_return.get('ReturnDate')
-            tx['ReturnRemarks'] = latest_return.get('Remarks')
-
-        return jsonify(transactions), 200
+        return jsonify(_fetch_borrower_history(cursor, borrower_id)), 200
     finally:
         cursor.close()
         conn.close()
@@ -359,6 +541,7 @@ def approve_borrow_transaction(borrow_id):
                         VALUES (%s, %s)
                     """, (borrow_id, due_date))
 
+        sync_active_loans(cursor, [borrow_id])
         notify_approved(cursor, borrow_id)
         conn.commit()
         return jsonify({'message': 'Borrow transaction approved.'}), 200
@@ -437,6 +620,7 @@ def reject_borrow_transaction(borrow_id):
                 tuple(storage_ids)
             )
 
+        sync_active_loans(cursor, [borrow_id])
         notify_rejected(cursor, borrow_id)
         conn.commit()
         return jsonify({'message': 'Borrow transaction rejected.'}), 200
@@ -571,6 +755,7 @@ def add_return_transaction():
 
         final_status = 'Returned' if not still_borrowed else 'Not Returned'
         cursor.execute("UPDATE BorrowTransactions SET ReturnStatus=%s WHERE BorrowID=%s", (final_status, borrow_id))
+        sync_active_loans(cursor, [borrow_id])
 
         notify_return_recorded(cursor, data['borrowId'])
         conn.commit()
@@ -893,6 +1078,8 @@ def mark_items_lost():
             # Close the transaction: mark as 'Returned' when no items are left in Borrowed state
             cursor.execute("UPDATE BorrowTransactions SET ReturnStatus=%s WHERE BorrowID=%s", ('Returned', borrow_id))
 
+        # The [LOST] return row also moves the loan's due date, so refresh either way
+        sync_active_loans(cursor, [borrow_id])
         conn.commit()
         return jsonify({
             'message': 'Marked as lost',
@@ -1,5 +1,6 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, url_for
 from ..services.document_ai_service import process_upload
+from ..services import analysis_jobs
 import traceback, re
 
 try:
@@ -82,13 +83,9 @@ def _json_error(code, error, detail=None, trace=None):
 
 @bp.route("/analyze", methods=["POST"])
 def analyze_document():
-    if "file" not in request.files:
-        return _json_error(400, "file_field_required")
-    f = request.files["file"]
-    if not f.filename:
-        return _json_error(400, "empty_filename")
-    if not f.filename.lower().endswith(".pdf"):
-        return _json_error(400, "only_pdf_supported")
+    f, err = _validate_pdf_upload()
+    if err:
+        return err
 
     save_flag = request.args.get("save", "false").lower() == "true"
 
@@ -104,6 +101,10 @@ def analyze_document():
         if not fields:
             return _json_error(500, "processing_failed", str(e), traceback.format_exc())
 
+    return jsonify(_analysis_payload(fields))
+
+
+def _analysis_payload(fields):
     # Normalize + enforce allowed values + fallbacks
     norm = {
         "Title": fields.get("Title") or None,
@@ -115,11 +116,58 @@ def analyze_document():
         "Sensitivity": _normalize_sensitivity(fields.get("Sensitivity")),
     }
 
-    return jsonify({
+    return {
         "record": norm,
         "extracted_fields": fields,
         "allowed": {
             "sensitivity": ALLOWED_SENSITIVITY,
             "classification": ALLOWED_CLASSIFICATIONS
         }
-    })
\ No newline at end of file
+    }
+
+
+def _validate_pdf_upload():
+    if "file" not in request.files:
+        return None, _json_error(400, "file_field_required")
+    f = request.files["file"]
+    if not f.filename:
+        return None, _json_error(400, "empty_filename")
+    if not f.filename.lower().endswith(".pdf"):
+        return None, _json_error(400, "only_pdf_supported")
+    return f, None
+
+
+@bp.route("/analyze/jobs", methods=["POST"])
+def submit_analysis_job():
+    f, err = _validate_pdf_upload()
+    if err:
+        return err
+    save_flag = request.args.get("save", "false").lower() == "true"
+    try:
+        job_id = analysis_jobs.submit_job(f, save_original=save_flag)
+    except analysis_jobs.QueueFull:
+        return _json_error(503, "analysis_queue_full")
+    resp = jsonify({"job_id": job_id, "status": "queued"})
+    resp.status_code = 202
+    resp.headers["Location"] = url_for("document_ai.get_analysis_job", job_id=job_id)
+    return resp
+
+
+@bp.route("/analyze/jobs/<job_id>", methods=["GET"])
+def get_analysis_job(job_id):
+    job = analysis_jobs.get_job(job_id)
+    if not job:
+        return _json_error(404, "job_not_found")
+    result = job.pop("result", None)
+    if job["status"] == "done" and result is not None:
+        job.update(_analysis_payload((result or {}).get("extracted_fields", {}) or {}))
+    return jsonify(job)
+
+
+@bp.route("/analyze/jobs/<job_id>", methods=["DELETE"])
+def cancel_analysis_job(job_id):
+    outcome = analysis_jobs.cancel_job(job_id)
+    if outcome is None:
+        return _json_error(404, "job_not_found")
+    # 202 while a running job is still winding down to its next stage.
+    return jsonify({"job_id": job_id, **outcome}), 202 if outcome["stopping"] else 200
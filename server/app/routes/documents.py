@@ -1,13 +1,59 @@
 import os
 import uuid
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
+from flask import Blueprint, request, jsonify, current_app, redirect, send_file, url_for
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 from ..db import get_db_connection
+from ..services import blob_store, file_serving, previews, upload_catalog, uploads
+from ..services.uploads import UploadError
 from ..utils import allowed_file
 
 documents_bp = Blueprint('documents', __name__)
 
 
+def _incoming_file():
+    """
+    The file for a single-file upload route: a multipart `file` part or the
+    `upload_id` of a completed upload session. Returns (file, upload_id,
+    original_name, error_response).
+    """
+    try:
+        # Reject from Content-Length before the multipart body is parsed.
+        uploads.check_declared_size(request.content_length)
+    except UploadError as e:
+        return None, None, None, (jsonify({'error': e.message}), e.status)
+    upload_id = request.args.get('upload_id') or request.form.get('upload_id')
+    if upload_id:
+        try:
+            original_name = uploads.session_filename(upload_id)
+        except UploadError as e:
+            return None, None, None, (jsonify({'error': e.message}), e.status)
+        if not allowed_file(original_name):
+            return None, None, None, (jsonify({'error': 'File type not allowed. Only PDF supported.'}), 400)
+        return None, upload_id, original_name, None
+
+    if 'file' not in request.files:
+        return None, None, None, (jsonify({'error': 'No file part'}), 400)
+    file = request.files['file']
+    if file.filename == '':
+        return None, None, None, (jsonify({'error': 'No selected file'}), 400)
+    if not allowed_file(file.filename):
+        return None, None, None, (jsonify({'error': 'File type not allowed. Only PDF supported.'}), 400)
+    return file, None, file.filename, None
+
+
+def _store_blob(file, upload_id, original_name):
+    """Store the incoming PDF content-addressed. Returns (public_url, sha256, size)."""
+    save_path = blob_store.incoming_path()
+    if upload_id:
+        stored = uploads.finish_session(upload_id, save_path)
+    else:
+        stored = uploads.save_file_storage(file, save_path)
+    sha256 = blob_store.adopt(stored)
+    previews.schedule(sha256, blob_store.blob_path(sha256))
+    return blob_store.public_url(sha256, original_name), sha256, stored.size
+
+
 # Get all documents
 @documents_bp.route('/documents', methods=['GET'])
 def get_documents():
@@ -37,6 +83,8 @@ def update_document(doc_id):
     data = request.json
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.execute("SELECT File_Path FROM Documents WHERE Document_ID = %s FOR UPDATE", (doc_id,))
+    row = cursor.fetchone()
     cursor.execute("""
         UPDATE Documents
         SET Title=%s, Author=%s, Category=%s, Department=%s, Classification=%s,
@@ -47,6 +95,9 @@ def update_document(doc_id):
         data.get('classification'), data.get('year'), data.get('sensitivity'),
         data.get('filePath'), doc_id
     ))
+    if row:
+        blob_store.swap_ref(cursor, row[0], data.get('filePath'))
+        upload_catalog.link_document(cursor, doc_id, row[0], data.get('filePath'))
     conn.commit()
     cursor.close()
     conn.close()
@@ -58,7 +109,13 @@ def update_document(doc_id):
 def delete_document(doc_id):
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.execute("SELECT File_Path FROM Documents WHERE Document_ID = %s FOR UPDATE", (doc_id,))
+    row = cursor.fetchone()
     cursor.execute("DELETE FROM Documents WHERE Document_ID = %s", (doc_id,))
+    if row:
+        # The blob itself goes once nothing references it (blob_store.collect_garbage).
+        blob_store.release_ref(cursor, row[0])
+        upload_catalog.link_document(cursor, doc_id, row[0], None)
     conn.commit()
     cursor.close()
     conn.close()
@@ -67,31 +124,19 @@ def delete_document(doc_id):
 # Upload document with metadata
 @documents_bp.route('/documents/upload', methods=['POST'])
 def upload_document():
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file part'}), 400
-
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'No selected file'}), 400
-
-    if not allowed_file(file.filename):
-        return jsonify({'error': 'File type not allowed. Only PDF supported.'}), 400
+    file, upload_id, original_name, error = _incoming_file()
+    if error:
+        return error
 
     metadata = request.form.to_dict()
     required_fields = ['title', 'author', 'category', 'department', 'classification', 'year', 'sensitivity']
     if not all(field in metadata for field in required_fields):
         return jsonify({'error': 'Missing required metadata fields.'}), 400
 
-    filename = secure_filename(file.filename)
-    unique_filename = f"{uuid.uuid4()}_{filename}"
-    upload_folder = current_app.config['UPLOAD_FOLDER']
-    os.makedirs(upload_folder, exist_ok=True)
-    save_path = os.path.join(upload_folder, unique_filename)
-    print(f"Saving file to {save_path}")
-    file.save(save_path)
-
-    # Save only public URL path
-    public_url = f"/uploads/{unique_filename}"
+    try:
+        public_url, sha256, size = _store_blob(file, upload_id, original_name)
+    except UploadError as e:
+        return jsonify({'error': e.message}), e.status
 
     # Save metadata and file path to database
     conn = get_db_connection()
@@ -109,31 +154,100 @@ def upload_document():
         metadata['sensitivity'],
         public_url
     ))
-    conn.commit()
     document_id = cursor.lastrowid
+    blob_store.add_ref(cursor, sha256, size)
+    conn.commit()
     cursor.close()
     conn.close()
 
     return jsonify({'message': 'Document uploaded successfully', 'documentId': document_id}), 201
 
-# Serve uploaded PDF file
+# Serve uploaded PDF file (ETag/304, Range/206; see app/services/file_serving.py)
 @documents_bp.route('/uploads/<filename>')
 def serve_uploaded_file(filename):
-    upload_folder = current_app.config['UPLOAD_FOLDER']
-    return send_from_directory(
-        upload_folder,
-        filename,
-        mimetype='application/pdf',
-        as_attachment=False  # 👈 this is key
-    )
+    path = safe_join(current_app.config['UPLOAD_FOLDER'], filename)
+    if path is None or not os.path.isfile(path):
+        return jsonify({'error': 'File not found'}), 404
+    return file_serving.send_pdf(path, filename)
+
+
+# Serve a content-addressed document PDF; the name segment is only the download name
+@documents_bp.route('/uploads/b/<sha256>/<filename>')
+def serve_blob(sha256, filename):
+    try:
+        path = blob_store.blob_path(sha256)
+    except ValueError:
+        return jsonify({'error': 'File not found'}), 404
+    if not os.path.isfile(path):
+        return jsonify({'error': 'File not found'}), 404
+    # The URL names the content, so it can be cached for good.
+    return file_serving.send_pdf(path, filename, etag=sha256, immutable=True)
+
+
+# Rendered page image of a stored PDF, addressed by content (app/services/previews.py)
+@documents_bp.route('/previews/<sha256>/<variant>.jpg')
+def serve_preview(sha256, variant):
+    try:
+        path = previews.preview_path(sha256, variant)
+    except ValueError:
+        return jsonify({'error': 'Preview not found'}), 404
+    if not os.path.isfile(path):
+        source = previews.source_for_sha(sha256)
+        if source is None:
+            return jsonify({'error': 'Preview not found'}), 404
+        if not previews.available():
+            return jsonify({'error': 'Preview rendering is not available'}), 503
+        if variant not in previews.render(sha256, source, [variant]):
+            return jsonify({'error': 'Page out of range'}), 404
+    rv = send_file(path, mimetype='image/jpeg', etag=f"{sha256}-{variant}", max_age=file_serving.IMMUTABLE_MAX_AGE)
+    rv.cache_control.immutable = True
+    return rv
+
+
+def _document_preview_source(doc_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT File_Path FROM Documents WHERE Document_ID = %s", (doc_id,))
+    row = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return previews.source_for_file_path(row[0]) if row else None
+
+
+# Page-1 thumbnail of a document; redirects to the cacheable content URL
+@documents_bp.route('/documents/<int:doc_id>/thumbnail', methods=['GET'])
+def get_document_thumbnail(doc_id):
+    source = _document_preview_source(doc_id)
+    if source is None:
+        return jsonify({'error': 'File not found'}), 404
+    return redirect(url_for('documents.serve_preview', sha256=source[0], variant=previews.THUMB_VARIANT))
+
+
+# Preview URLs and page count of a document
+@documents_bp.route('/documents/<int:doc_id>/previews', methods=['GET'])
+def get_document_previews(doc_id):
+    source = _document_preview_source(doc_id)
+    if source is None:
+        return jsonify({'error': 'File not found'}), 404
+    sha256, path = source
+    meta = previews.read_meta(sha256)
+    if meta is None:
+        if not previews.available():
+            return jsonify({'error': 'Preview rendering is not available'}), 503
+        previews.render(sha256, path, [previews.THUMB_VARIANT])
+        meta = previews.read_meta(sha256) or {}
+    page_count = int(meta.get('page_count') or 0)
+    return jsonify({
+        'sha256': sha256,
+        'page_count': page_count,
+        'thumbnail': previews.public_url(sha256),
+        'pages': [previews.public_url(sha256, previews.page_variant(n)) for n in range(1, page_count + 1)]
+    })
 
 
-# List files from the uploads directory with basic metadata
+# List the uploads library from its catalog table (app/services/upload_catalog.py)
 @documents_bp.route('/documents/uploads', methods=['GET'])
 def list_uploaded_files():
-    upload_folder = current_app.config['UPLOAD_FOLDER']
-    os.makedirs(upload_folder, exist_ok=True)
-
     def _parse_int(name: str, default: int) -> int:
         try:
             value = int(request.args.get(name, default))
@@ -143,43 +257,23 @@ def list_uploaded_files():
 
     page = max(_parse_int('page', 1), 1)
     per_page = max(1, min(_parse_int('per_page', 10), 100))
+    q = (request.args.get('q') or '').strip() or None
+    sort = request.args.get('sort', 'mtime')
+    order = request.args.get('order', 'asc' if sort == 'name' else 'desc')
+    linked = request.args.get('linked')
+    linked = None if linked is None else linked.lower() in ('1', 'true', 'yes')
 
-    files = []
-    try:
-        for entry in os.scandir(upload_folder):
-            if not entry.is_file():
-                continue
-            stat = entry.stat()
-            files.append({
-                'file': entry.name,
-                'size': stat.st_size,
-                'mtime': int(stat.st_mtime),
-                'url': f"/uploads/{entry.name}"
-            })
-    except (FileNotFoundError, PermissionError):
-        return jsonify({
-            'files': [],
-            'total': 0,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': 0
-        })
-
-    files.sort(key=lambda item: item['mtime'], reverse=True)
-
-    total = len(files)
+    files, total = upload_catalog.list_files(page, per_page, q=q, sort=sort, order=order, linked=linked)
     total_pages = (total + per_page - 1) // per_page if total else 0
-    if total_pages:
-        if page > total_pages:
-            page = total_pages
-    else:
+    if total_pages and page > total_pages:
+        # Past the end: serve the last page, as before.
+        page = total_pages
+        files, total = upload_catalog.list_files(page, per_page, q=q, sort=sort, order=order, linked=linked)
+    elif not total_pages:
         page = 1
 
-    start = (page - 1) * per_page
-    paged_files = files[start:start + per_page]
-
     return jsonify({
-        'files': paged_files,
+        'files': files,
         'total': total,
         'page': page,
         'per_page': per_page,
@@ -220,62 +314,152 @@ def upload_file_to_uploads():
         if not safe_name:
             return jsonify({'error': f'Invalid filename for "{original_name}".'}), 400
 
-        save_path = os.path.join(upload_folder, safe_name)
+        # Written under a hidden .tmp name, then moved to a free name so an
+        # existing file with the same name is never overwritten.
+        temp_path = os.path.join(upload_folder, f".{uuid.uuid4().hex}.tmp")
 
         try:
-            file_obj.save(save_path)
-            stat = os.stat(save_path)
-        except OSError as exc:
+            stored = uploads.save_file_storage(file_obj, temp_path)
+            final_name, duplicate = uploads.place_unique(stored, upload_folder, safe_name)
+        except (OSError, UploadError) as exc:
             # Cleanup any partially saved files from this batch
             for saved in saved_files:
+                if saved['duplicate']:
+                    continue
                 try:
                     os.remove(os.path.join(upload_folder, saved['file']))
                 except OSError:
                     pass
+            if isinstance(exc, UploadError):
+                return jsonify({'error': f'"{original_name}": {exc.message}'}), exc.status
             return jsonify({'error': f'Failed to store file "{original_name}": {exc}'}), 500
 
         saved_files.append({
-            'file': safe_name,
+            'file': final_name,
             'original': original_name,
-            'size': stat.st_size,
-            'mtime': int(stat.st_mtime),
-            'url': f"/uploads/{safe_name}"
+            'size': stored.size,
+            'sha256': stored.sha256,
+            'duplicate': duplicate,
+            'mtime': int(os.path.getmtime(os.path.join(upload_folder, final_name))),
+            'url': f"/uploads/{final_name}"
         })
 
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    for saved in saved_files:
+        upload_catalog.record_file(cursor, saved['file'], saved['size'], saved['mtime'], saved['sha256'])
+        previews.schedule(saved['sha256'], os.path.join(upload_folder, saved['file']))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
     message = f"Uploaded {len(saved_files)} file{'s' if len(saved_files) != 1 else ''}."
     return jsonify({'message': message, 'files': saved_files}), 201
 
+# Delete a file from the uploads library
+@documents_bp.route('/documents/uploads/<filename>', methods=['DELETE'])
+def delete_uploaded_file(filename):
+    safe_name = secure_filename(filename)
+    if not safe_name or safe_name != filename:
+        return jsonify({'error': 'File not found'}), 404
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        document_id = upload_catalog.linked_document(cursor, safe_name)
+        if document_id is not None:
+            return jsonify({'error': f'File is used by document {document_id}.'}), 409
+        try:
+            os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], safe_name))
+        except FileNotFoundError:
+            pass
+        upload_catalog.remove_file(cursor, safe_name)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    return jsonify({'message': 'File deleted'})
+
 # API endpoint to change the file (PDF) of a document
 @documents_bp.route('/upload/edit/<int:doc_id>', methods=['PUT'])
 def update_document_file(doc_id):
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file part'}), 400
+    file, upload_id, original_name, error = _incoming_file()
+    if error:
+        return error
 
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'No selected file'}), 400
-
-    if not allowed_file(file.filename):
-        return jsonify({'error': 'File type not allowed. Only PDF supported.'}), 400
-
-    filename = secure_filename(file.filename)
-    unique_filename = f"{uuid.uuid4()}_{filename}"
-    upload_folder = current_app.config['UPLOAD_FOLDER']
-    os.makedirs(upload_folder, exist_ok=True)
-    save_path = os.path.join(upload_folder, unique_filename)
-    file.save(save_path)
-
-    public_url = f"/uploads/{unique_filename}"
+    try:
+        public_url, sha256, size = _store_blob(file, upload_id, original_name)
+    except UploadError as e:
+        return jsonify({'error': e.message}), e.status
 
     # Update the file path in the database
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.execute("SELECT File_Path FROM Documents WHERE Document_ID = %s FOR UPDATE", (doc_id,))
+    row = cursor.fetchone()
+    if not row:
+        cursor.close()
+        conn.close()
+        return jsonify({'error': 'Document not found'}), 404
     cursor.execute(
         "UPDATE Documents SET File_Path = %s WHERE Document_ID = %s",
         (public_url, doc_id)
     )
+    blob_store.swap_ref(cursor, row[0], public_url)
+    upload_catalog.link_document(cursor, doc_id, row[0], public_url)
     conn.commit()
     cursor.close()
     conn.close()
 
     return jsonify({'message': 'Document file updated', 'filePath': public_url})
+
+
+# Resumable upload sessions for large files. The finished upload is attached
+# by passing its upload_id to /documents/upload or /upload/edit/<id>.
+@documents_bp.route('/documents/upload-sessions', methods=['POST'])
+def create_upload_session():
+    data = request.get_json(silent=True) or {}
+    filename = str(data.get('filename') or '').strip()
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'File type not allowed. Only PDF supported.'}), 400
+    try:
+        session = uploads.create_session(filename, int(data.get('size') or 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'size must be an integer'}), 400
+    except UploadError as e:
+        return jsonify({'error': e.message}), e.status
+    return jsonify(session), 201
+
+
+@documents_bp.route('/documents/upload-sessions/<upload_id>', methods=['GET'])
+def get_upload_session(upload_id):
+    try:
+        return jsonify(uploads.get_session(upload_id))
+    except UploadError as e:
+        return jsonify({'error': e.message}), e.status
+
+
+@documents_bp.route('/documents/upload-sessions/<upload_id>', methods=['PATCH'])
+def append_upload_chunk(upload_id):
+    """Raw chunk body; `Upload-Offset` header (or ?offset=) gives its byte position."""
+    raw_offset = request.headers.get('Upload-Offset', request.args.get('offset'))
+    try:
+        offset = int(raw_offset)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Upload-Offset header is required'}), 400
+    try:
+        session = uploads.append_chunk(upload_id, offset, request.stream, request.content_length)
+    except UploadError as e:
+        payload = {'error': e.message}
+        if e.offset is not None:
+            payload['offset'] = e.offset
+        return jsonify(payload), e.status
+    return jsonify(session)
+
+
+@documents_bp.route('/documents/upload-sessions/<upload_id>', methods=['DELETE'])
+def abort_upload_session(upload_id):
+    try:
+        uploads.abort_session(upload_id)
+    except UploadError as e:
+        return jsonify({'error': e.message}), e.status
+    return jsonify({'message': 'Upload session cancelled'})
@@ -1,6 +1,9 @@
 import os
 from flask import Blueprint, jsonify, request, current_app, send_from_directory, send_file, abort
 from werkzeug.utils import secure_filename
+from ..db import get_pool_stats
+from ..services.scheduler import get_scheduler_status
+from ..services.model_server import collect_metrics as collect_model_metrics
 from ..services.backup import create_backup, list_backups, get_backup_dir
 from ..services.settings import load_settings, save_settings  # added
 from ..services.image_pdf import images_to_pdf, get_uploads_dir, get_generated_dir, _is_allowed_image  # added
@@ -210,4 +213,21 @@ def system_image_to_pdf():
         #         os.remove(out_path)
         # except:
         #     pass
-        pass
\ No newline at end of file
+        pass
+
+@systems_bp.route("/system/db-pool", methods=["GET"])
+def system_db_pool_stats():
+    """
+    Reports connection pool usage for this worker process.
+    """
+    return jsonify(get_pool_stats()), 200
+
+
+@systems_bp.route("/system/scheduler", methods=["GET"])
+def scheduler_status():
+    return jsonify({"jobs": get_scheduler_status()}), 200
+
+
+@systems_bp.route("/system/model-metrics", methods=["GET"])
+def model_metrics():
+    return jsonify(collect_model_metrics()), 200
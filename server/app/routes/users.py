@@ -6,7 +6,7 @@ from datetime import datetime
 from pathlib import Path
 from typing import Any, Optional, Tuple, cast
 
-from flask import Blueprint, current_app, jsonify, request
+from flask import Blueprint, current_app, jsonify, request, send_file
 from ..db import get_db_connection
 import re
 from ..services.notifications import (
@@ -14,6 +14,8 @@ from ..services.notifications import (
     notify_account_approved,
     notify_account_rejected,
 )
+from app.services import borrower_attachments
+from app.services.user_indexes import ensure_indexes
 from app.services.passwords import hash_password
 from PIL import Image, UnidentifiedImageError
 from werkzeug.utils import secure_filename
@@ -23,6 +25,8 @@ users_bp = Blueprint('users', __name__)
 USERNAME_PATTERN = re.compile(r'^[A-Za-z0-9._-]+$')
 USERNAME_MIN_LENGTH = 4
 ATTACHMENTS_SUBDIR = 'attachments'
+BORROWER_COLUMNS = {'Position', 'Type', 'Department', 'AccountStatus', 'BorrowerID', 'AttachmentPath',
+                    'AttachmentSize', 'AttachmentSHA256'}
 
 
 def _load_payload() -> Optional[dict]:
@@ -85,6 +89,29 @@ def _load_attachment_pdf_content(db_path: Optional[str]) -> Optional[str]:
         return None
 
 
+def _wants_attachment() -> bool:
+    include = request.args.get('include') or ''
+    return 'attachment' in {part.strip().lower() for part in include.split(',')}
+
+
+def _borrower_view(user: dict, include_attachment: bool = False) -> dict:
+    """Nested borrower object; the PDF itself is inlined only on request."""
+    attachment_path = user.get('AttachmentPath')
+    borrower = {
+        'BorrowerID': user.get('BorrowerID'),
+        'Type': user.get('Type'),
+        'Department': user.get('Department'),
+        'AccountStatus': user.get('AccountStatus'),
+        'AttachmentPath': attachment_path,
+        'Attachment': borrower_attachments.descriptor(
+            user.get('UserID'), attachment_path, user.get('AttachmentSize'), user.get('AttachmentSHA256')
+        ),
+    }
+    if include_attachment:
+        borrower['AttachmentPdfBase64'] = _load_attachment_pdf_content(attachment_path)
+    return borrower
+
+
 def _save_borrower_attachment(file_storage, user_id: int) -> Tuple[str, Path]:
     if not file_storage or not getattr(file_storage, 'filename', None):
         raise ValueError('attachment_missing_filename')
@@ -142,6 +169,10 @@ def _delete_attachment_file(db_path: Optional[str]) -> None:
                 file_path.unlink()
     except Exception:
         current_app.logger.exception('Failed to remove borrower attachment %s', db_path)
+    try:
+        borrower_attachments.forget(db_path)
+    except Exception:
+        current_app.logger.exception('Failed to forget borrower attachment %s', db_path)
 
 def parse_date(date_str):
     if not date_str:
@@ -193,6 +224,9 @@ def username_available():
 def add_user():
     data = _load_payload()
     attachment_file = request.files.get('attachment') if request.files else None
+    # Hash before borrowing a connection; it is the slow part of the request.
+    hashed = hash_password(data['password']) if isinstance(data, dict) and data.get('password') else None
+    borrower_attachments.ensure_table()
     conn = get_db_connection()
     if conn is None:
         return jsonify({'error': 'database_unavailable'}), 500
@@ -228,8 +262,10 @@ def add_user():
         conn.close()
         return jsonify({'error': 'email_exists'}), 409
 
-    raw_password = data['password']
-    hashed = hash_password(raw_password)
+    if hashed is None:
+        cursor.close()
+        conn.close()
+        return jsonify({'error': 'password_required'}), 400
 
     cursor.execute("""
         INSERT INTO Users (Username, Password, Role)
@@ -247,6 +283,7 @@ def add_user():
     if attachment_file and attachment_file.filename:
         try:
             saved_attachment_path, saved_attachment_full_path = _save_borrower_attachment(attachment_file, user_id)
+            borrower_attachments.record(cursor, saved_attachment_path, str(saved_attachment_full_path))
         except ValueError as exc:
             conn.rollback()
             if saved_attachment_full_path and saved_attachment_full_path.exists():
@@ -295,58 +332,201 @@ def add_user():
     conn.close()
     return jsonify({'message': 'User added', 'user_id': user_id})
 
-# --- Get All Users with Specifics ---
+# --- User directory ---
+# Filters: ?role=Staff|Borrower, status (AccountStatus), type, department, and
+# q: every word must prefix-match a first name, last name, username or email.
+# Sort: ?sort=id (default), -id (newest first), username, name (last, first).
+# Keyset paging: ?limit=N&cursor=<X-Next-Cursor of the previous page>.
+# ?count=1 adds X-Total-Count. The body stays a JSON array of users.
+USER_LIST_MAX_LIMIT = 500
+USER_SEARCH_MAX_TERMS = 4
+USER_SORTS = {
+    # (expressions compared by the cursor, matching row keys, descending).
+    # Plain columns only, so ORDER BY and the cursor walk an index. The name
+    # sort follows idx_userdetails_name (the primary key is its implicit last
+    # column) and lists only users with a UserDetails row.
+    'id': (('u.UserID',), ('UserID',), False),
+    '-id': (('u.UserID',), ('UserID',), True),
+    'username': (('u.Username',), ('Username',), False),
+    'name': (
+        ('ud.Lastname', 'ud.Firstname', 'ud.UserID'),
+        ('Lastname', 'Firstname', 'UserID'),
+        False,
+    ),
+}
+
+
+def _like_prefix(term: str) -> str:
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def _user_list_filters(args) -> Tuple[list, list]:
+    clauses: list = []
+    params: list = []
+    role = args.get('role')
+    if role:
+        if role not in ('Staff', 'Borrower'):
+            raise ValueError('role must be Staff or Borrower.')
+        clauses.append('u.Role = %s')
+        params.append(role)
+    for arg, column in (('status', 'b.AccountStatus'), ('type', 'b.Type'), ('department', 'b.Department')):
+        value = args.get(arg)
+        if value:
+            clauses.append(f'{column} = %s')
+            params.append(value)
+    terms = (args.get('q') or '').split()
+    if len(terms) > USER_SEARCH_MAX_TERMS:
+        raise ValueError(f'q accepts at most {USER_SEARCH_MAX_TERMS} words.')
+    for term in terms:
+        # A bare IN (... UNION ...) runs as a dependent subquery, once per
+        # user. Wrapped in a derived table the union is materialized once
+        # (one prefix range scan per column) and semi-joined on UserID.
+        clauses.append("""u.UserID IN (SELECT m.UserID FROM (
+            SELECT UserID FROM Users WHERE Username LIKE %s
+            UNION SELECT UserID FROM UserDetails WHERE Lastname LIKE %s
+            UNION SELECT UserID FROM UserDetails WHERE Firstname LIKE %s
+            UNION SELECT UserID FROM UserDetails WHERE Email LIKE %s
+        ) AS m)""")
+        params.extend([_like_prefix(term)] * 4)
+    return clauses, params
+
+
+def _encode_user_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_user_cursor(raw: str, size: int) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(raw + '=' * (-len(raw) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError('cursor is not valid.')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('cursor is not valid.')
+    return values
+
+
+def _keyset_clause(columns: tuple, values: list, descending: bool) -> Tuple[str, list]:
+    """(a, b, c) > (x, y, z) spelled out so each step can use an index."""
+    op = '<' if descending else '>'
+    clause, params = '', []
+    for index in range(len(columns) - 1, -1, -1):
+        step = f'{columns[index]} {op} %s'
+        step_params = [values[index]]
+        if clause:
+            step = f'({step} OR ({columns[index]} = %s AND {clause}))'
+            step_params = [values[index], values[index]] + params
+        clause, params = step, step_params
+    return clause, params
+
+
 @users_bp.route('/users', methods=['GET'])
 def get_users():
+    sort = request.args.get('sort') or 'id'
+    if sort not in USER_SORTS:
+        return jsonify({'error': f"sort must be one of: {', '.join(USER_SORTS)}."}), 400
+    columns, keys, descending = USER_SORTS[sort]
+    try:
+        clauses, params = _user_list_filters(request.args)
+        if sort == 'name':
+            # Lastname is NOT NULL, so this drops only users without details
+            # and lets the LEFT JOIN run as an inner join in index order.
+            clauses.append('ud.Lastname IS NOT NULL')
+        limit = request.args.get('limit')
+        if limit not in (None, ''):
+            try:
+                limit = int(limit)
+            except (TypeError, ValueError):
+                raise ValueError('limit must be a whole number.')
+            if limit <= 0:
+                raise ValueError('limit must be positive.')
+            limit = min(limit, USER_LIST_MAX_LIMIT)
+        else:
+            limit = None
+        raw_cursor = request.args.get('cursor')
+        if raw_cursor:
+            keyset_sql, keyset_params = _keyset_clause(
+                columns, _decode_user_cursor(raw_cursor, len(columns)), descending
+            )
+            keyset = ([keyset_sql], keyset_params)
+        else:
+            keyset = ([], [])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    ensure_indexes()
+    borrower_attachments.ensure_table()
     conn = get_db_connection()
     if conn is None:
         return jsonify({'error': 'database_unavailable'}), 500
     cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT u.UserID, u.Username, u.Role,
-               ud.Firstname, ud.Middlename, ud.Lastname, ud.Email, ud.ContactNumber,
-               ud.Street, ud.Barangay, ud.City, ud.Province, ud.DateOfBirth,
-         s.Position,
-         b.BorrowerID, b.Type, b.Department, b.AccountStatus, b.AttachmentPath
+    joins = """
         FROM Users u
         LEFT JOIN UserDetails ud ON u.UserID = ud.UserID
         LEFT JOIN Staff s ON u.UserID = s.UserID
         LEFT JOIN Borrowers b ON u.UserID = b.UserID
-    """)
-    rows = cursor.fetchall()
+        LEFT JOIN AttachmentFiles af ON af.Path = b.AttachmentPath
+    """
+    headers = {}
+    try:
+        if request.args.get('count', '').strip().lower() in ('1', 'true', 'yes', 'on'):
+            where = ' AND '.join(clauses) or '1=1'
+            cursor.execute(f"SELECT COUNT(*) AS c {joins} WHERE {where}", tuple(params))
+            headers['X-Total-Count'] = str((cursor.fetchone() or {}).get('c', 0))
+        where = ' AND '.join(clauses + keyset[0]) or '1=1'
+        direction = 'DESC' if descending else 'ASC'
+        order_by = ', '.join(f'{column} {direction}' for column in columns)
+        limit_sql = '' if limit is None else 'LIMIT %s'
+        cursor.execute(f"""
+            SELECT u.UserID, u.Username, u.Role,
+                   ud.Firstname, ud.Middlename, ud.Lastname, ud.Email, ud.ContactNumber,
+                   ud.Street, ud.Barangay, ud.City, ud.Province, ud.DateOfBirth,
+             s.Position,
+             b.BorrowerID, b.Type, b.Department, b.AccountStatus, b.AttachmentPath,
+             af.SizeBytes AS AttachmentSize, af.SHA256 AS AttachmentSHA256
+            {joins}
+            WHERE {where}
+            ORDER BY {order_by}
+            {limit_sql}
+        """, tuple(params + keyset[1]) + (() if limit is None else (limit + 1,)))
+        rows = cursor.fetchall() or []
+    finally:
+        cursor.close()
+        conn.close()
+
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = cast(dict, rows[-1])
+        headers['X-Next-Cursor'] = _encode_user_cursor(
+            ['' if last[key] is None else last[key] for key in keys]
+        )
+
     normalized = []
-    for row in rows or []:
+    for row in rows:
         row_dict = cast(dict[str, Any], row)
         user: dict[str, Any] = dict(row_dict)
         if user.get('Role') == 'Staff':
             user['staff'] = {'Position': user.get('Position')}
             user['borrower'] = None
         elif user.get('Role') == 'Borrower':
-            attachment_path = user.get('AttachmentPath')
-            user['borrower'] = {
-                'BorrowerID': user.get('BorrowerID'),
-                'Type': user.get('Type'),
-                'Department': user.get('Department'),
-                'AccountStatus': user.get('AccountStatus'),
-                'AttachmentPath': attachment_path,
-                'AttachmentPdfBase64': _load_attachment_pdf_content(attachment_path)
-            }
+            user['borrower'] = _borrower_view(user)
             user['staff'] = None
         else:
             user['staff'] = None
             user['borrower'] = None
-        for k in ['Position', 'Type', 'Department', 'AccountStatus', 'BorrowerID', 'AttachmentPath']:
+        for k in BORROWER_COLUMNS:
             user.pop(k, None)
         normalized.append(user)
-    cursor.close()
-    conn.close()
-    return jsonify(normalized)
+    response = jsonify(normalized)
+    response.headers.update(headers)
+    return response
 
 # --- Edit User (and Borrower/Staff) ---
 @users_bp.route('/users/<int:user_id>', methods=['PUT'])
 def update_user(user_id):
     data = _load_payload()
     attachment_file = request.files.get('attachment') if request.files else None
+    new_hash = hash_password(data['password']) if isinstance(data, dict) and data.get('password') else None
+    borrower_attachments.ensure_table()
     conn = get_db_connection()
     if conn is None:
         return jsonify({'error': 'database_unavailable'}), 500
@@ -366,10 +546,9 @@ def update_user(user_id):
     if 'role' in data:
         fields.append("Role=%s")
         values.append(data['role'])
-    if 'password' in data and data['password']:
-        # re-hash new password
+    if new_hash:
         fields.append("Password=%s")
-        values.append(hash_password(data['password']))
+        values.append(new_hash)
 
     if fields:
         sql = f"UPDATE Users SET {', '.join(fields)} WHERE UserID=%s"
@@ -426,6 +605,7 @@ def update_user(user_id):
     if attachment_file and attachment_file.filename:
         try:
             new_attachment_path, new_attachment_full_path = _save_borrower_attachment(attachment_file, user_id)
+            borrower_attachments.record(cursor, new_attachment_path, str(new_attachment_full_path))
         except ValueError as exc:
             conn.rollback()
             cursor.close()
@@ -543,6 +723,7 @@ def reject_user_account(user_id):
 # --- Get User Details by BorrowerID ---
 @users_bp.route('/users/borrower/<int:borrower_id>', methods=['GET'])
 def get_user_by_borrower_id(borrower_id):
+    borrower_attachments.ensure_table()
     conn = get_db_connection()
     if conn is None:
         return jsonify({'error': 'database_unavailable'}), 500
@@ -551,10 +732,12 @@ def get_user_by_borrower_id(borrower_id):
         SELECT u.UserID, u.Username, u.Role,
                ud.Firstname, ud.Middlename, ud.Lastname, ud.Email, ud.ContactNumber,
                ud.Street, ud.Barangay, ud.City, ud.Province, ud.DateOfBirth,
-               b.BorrowerID, b.Type, b.Department, b.AccountStatus, b.AttachmentPath
+               b.BorrowerID, b.Type, b.Department, b.AccountStatus, b.AttachmentPath,
+         af.SizeBytes AS AttachmentSize, af.SHA256 AS AttachmentSHA256
         FROM Borrowers b
         JOIN Users u ON u.UserID = b.UserID
         LEFT JOIN UserDetails ud ON u.UserID = ud.UserID
+        LEFT JOIN AttachmentFiles af ON af.Path = b.AttachmentPath
         WHERE b.BorrowerID = %s
     """, (borrower_id,))
     user = cursor.fetchone()
@@ -564,22 +747,15 @@ def get_user_by_borrower_id(borrower_id):
         return jsonify({'error': 'Borrower not found'}), 404
     user = dict(user)
     # Structure output similar to /users
-    attachment_path = user.get('AttachmentPath')
-    user['borrower'] = {
-        'BorrowerID': user['BorrowerID'],
-        'Type': user['Type'],
-        'Department': user['Department'],
-        'AccountStatus': user['AccountStatus'],
-        'AttachmentPath': attachment_path,
-        'AttachmentPdfBase64': _load_attachment_pdf_content(attachment_path)
-    }
-    for k in ['BorrowerID', 'Type', 'Department', 'AccountStatus', 'AttachmentPath']:
+    user['borrower'] = _borrower_view(user, include_attachment=_wants_attachment())
+    for k in BORROWER_COLUMNS:
         user.pop(k, None)
     return jsonify(user)
 
 # --- Get User Details by UserID ---
 @users_bp.route('/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
+    borrower_attachments.ensure_table()
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     cursor.execute("""
@@ -587,11 +763,13 @@ def get_user(user_id):
                ud.Firstname, ud.Middlename, ud.Lastname, ud.Email, ud.ContactNumber,
                ud.Street, ud.Barangay, ud.City, ud.Province, ud.DateOfBirth,
          s.Position,
-         b.BorrowerID, b.Type, b.Department, b.AccountStatus, b.AttachmentPath
+         b.BorrowerID, b.Type, b.Department, b.AccountStatus, b.AttachmentPath,
+         af.SizeBytes AS AttachmentSize, af.SHA256 AS AttachmentSHA256
         FROM Users u
         LEFT JOIN UserDetails ud ON u.UserID = ud.UserID
         LEFT JOIN Staff s ON u.UserID = s.UserID
         LEFT JOIN Borrowers b ON u.UserID = b.UserID
+        LEFT JOIN AttachmentFiles af ON af.Path = b.AttachmentPath
         WHERE u.UserID = %s
         LIMIT 1
     """, (user_id,))
@@ -605,24 +783,55 @@ def get_user(user_id):
     user = dict(user)
 
     if user.get('Role') == 'Staff':
-        response = {k: v for k, v in user.items() if k not in {'Position', 'Type', 'Department', 'AccountStatus', 'BorrowerID', 'AttachmentPath'}}
+        response = {k: v for k, v in user.items() if k not in BORROWER_COLUMNS}
         response['staff'] = {'Position': user.get('Position')}
         response['borrower'] = None
     elif user.get('Role') == 'Borrower':
-        response = {k: v for k, v in user.items() if k not in {'Position', 'Type', 'Department', 'AccountStatus', 'BorrowerID', 'AttachmentPath'}}
+        response = {k: v for k, v in user.items() if k not in BORROWER_COLUMNS}
         response['staff'] = None
-        attachment_path = user.get('AttachmentPath')
-        response['borrower'] = {
-            'BorrowerID': user.get('BorrowerID'),
-            'Type': user.get('Type'),
-            'Department': user.get('Department'),
-            'AccountStatus': user.get('AccountStatus'),
-            'AttachmentPath': attachment_path,
-            'AttachmentPdfBase64': _load_attachment_pdf_content(attachment_path)
-        }
+        response['borrower'] = _borrower_view(user, include_attachment=_wants_attachment())
     else:
-        response = {k: v for k, v in user.items() if k not in {'Position', 'Type', 'Department', 'AccountStatus', 'BorrowerID', 'AttachmentPath'}}
+        response = {k: v for k, v in user.items() if k not in BORROWER_COLUMNS}
         response['staff'] = None
         response['borrower'] = None
 
-    return jsonify(response)
\ No newline at end of file
+    return jsonify(response)
+
+
+# --- Stream a borrower's attachment PDF ---
+@users_bp.route('/users/<int:user_id>/attachment', methods=['GET'])
+def get_user_attachment(user_id):
+    borrower_attachments.ensure_table()
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({'error': 'database_unavailable'}), 500
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT b.AttachmentPath, af.SHA256
+            FROM Borrowers b
+            LEFT JOIN AttachmentFiles af ON af.Path = b.AttachmentPath
+            WHERE b.UserID = %s
+            LIMIT 1
+        """, (user_id,))
+        row = cursor.fetchone()
+        db_path = row.get('AttachmentPath') if row else None
+        file_path = _resolve_attachment_file(db_path)
+        if not file_path:
+            return jsonify({'error': 'Attachment not found'}), 404
+        sha256 = row.get('SHA256')
+        if not sha256:
+            # Saved before sizes and hashes were recorded.
+            sha256 = borrower_attachments.record(cursor, db_path, str(file_path))['sha256']
+            conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+    rv = send_file(
+        str(file_path), mimetype='application/pdf', as_attachment=False,
+        download_name=file_path.name, conditional=True, etag=sha256,
+    )
+    # Identity documents: revalidate every time and keep out of shared caches.
+    rv.cache_control.private = True
+    return rv
@@ -0,0 +1,113 @@
+"""
+ActiveLoans read model.
+
+One row per open borrow transaction (Pending or Approved, not yet Returned) with
+the fields the background scans and dashboards need: borrower, due date,
+physical/digital flag and staff route. The borrow routes refresh the affected
+rows with sync_active_loans() inside their own transaction, so the scans can
+use indexed range queries on DueDate instead of aggregating the full history.
+"""
+from threading import Lock
+from typing import Any, Iterable, List
+
+from app.db import get_db_connection
+
+ACTIVE_LOANS_DDL = """
+CREATE TABLE IF NOT EXISTS ActiveLoans (
+    BorrowID INT NOT NULL PRIMARY KEY,
+    BorrowerID INT NOT NULL,
+    ApprovalStatus ENUM('Pending','Approved') NOT NULL,
+    DueDate DATE DEFAULT NULL,
+    IsDigital TINYINT(1) NOT NULL DEFAULT 0,
+    Route ENUM('librarian','admin') NOT NULL,
+    UpdatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_activeloans_due (ApprovalStatus, DueDate),
+    INDEX idx_activeloans_digital_due (IsDigital, ApprovalStatus, DueDate),
+    INDEX idx_activeloans_borrower (BorrowerID),
+    CONSTRAINT fk_activeloans_borrow FOREIGN KEY (BorrowID)
+        REFERENCES BorrowTransactions(BorrowID) ON DELETE CASCADE
+)
+"""
+
+# Digital = has document items and none of them is a physical (storage) copy.
+_SOURCE_SELECT = """
+    SELECT
+        bt.BorrowID,
+        bt.BorrowerID,
+        bt.ApprovalStatus,
+        (SELECT MAX(rt.ReturnDate) FROM ReturnTransactions rt WHERE rt.BorrowID = bt.BorrowID) AS DueDate,
+        (
+            EXISTS (SELECT 1 FROM BorrowedItems bi
+                    WHERE bi.BorrowID = bt.BorrowID AND bi.ItemType = 'Document')
+            AND NOT EXISTS (SELECT 1 FROM BorrowedItems bi
+                            WHERE bi.BorrowID = bt.BorrowID AND bi.ItemType = 'Document'
+                              AND bi.DocumentStorageID IS NOT NULL)
+        ) AS IsDigital,
+        CASE WHEN EXISTS (SELECT 1 FROM BorrowedItems bi
+                          WHERE bi.BorrowID = bt.BorrowID AND bi.ItemType = 'Document')
+             THEN 'admin' ELSE 'librarian' END AS Route
+    FROM BorrowTransactions bt
+    WHERE bt.ApprovalStatus IN ('Pending', 'Approved')
+      AND bt.ReturnStatus <> 'Returned'
+"""
+
+_INSERT_COLUMNS = "INSERT INTO ActiveLoans (BorrowID, BorrowerID, ApprovalStatus, DueDate, IsDigital, Route)"
+
+_ready = False
+_ready_lock = Lock()
+
+
+def _table_exists(cursor: Any) -> bool:
+    cursor.execute(
+        """
+        SELECT 1 FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'ActiveLoans'
+        """
+    )
+    return cursor.fetchone() is not None
+
+
+def rebuild_active_loans(cursor: Any) -> int:
+    """Repopulate the whole read model from the base tables."""
+    cursor.execute("DELETE FROM ActiveLoans")
+    cursor.execute(f"{_INSERT_COLUMNS} {_SOURCE_SELECT}")
+    return cursor.rowcount
+
+
+def ensure_active_loans() -> bool:
+    """Create (and backfill) the ActiveLoans table once per process."""
+    global _ready
+    if _ready:
+        return True
+    with _ready_lock:
+        if _ready:
+            return True
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            # DDL commits implicitly, so it runs on its own connection rather
+            # than inside a route's transaction.
+            if not _table_exists(cursor):
+                cursor.execute(ACTIVE_LOANS_DDL)
+                rebuilt = rebuild_active_loans(cursor)
+                conn.commit()
+                print(f"[active_loans] Created read model with {rebuilt} open loans")
+            _ready = True
+        except Exception as exc:
+            conn.rollback()
+            print(f"[active_loans] Setup failed: {exc}")
+        finally:
+            cursor.close()
+            conn.close()
+    return _ready
+
+
+def sync_active_loans(cursor: Any, borrow_ids: Iterable[Any]) -> None:
+    """Refresh the read-model rows for the given borrow transactions."""
+    ids: List[int] = sorted({int(b) for b in borrow_ids if b is not None})
+    if not ids:
+        return
+    ensure_active_loans()
+    fmt = ','.join(['%s'] * len(ids))
+    cursor.execute(f"DELETE FROM ActiveLoans WHERE BorrowID IN ({fmt})", tuple(ids))
+    cursor.execute(f"{_INSERT_COLUMNS} {_SOURCE_SELECT} AND bt.BorrowID IN ({fmt})", tuple(ids))
@@ -0,0 +1,138 @@
+"""
+Content-addressed cache for document-analysis results.
+
+Entries are keyed by the PDF's SHA-256 plus the pipeline version, and they
+live in a small SQLite file shared by every worker on the host. Total payload
+size is capped; the least recently used entries are evicted first. Bumping
+PIPELINE_VERSION in document_ai_service drops every older entry on next use.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Optional
+
+from app.config import Config
+
+_CACHE_DIR = Path(__file__).resolve().parent / "_analysis_cache"
+_CACHE_FILE = _CACHE_DIR / "analysis_cache.sqlite3"
+_HASH_CHUNK = 1024 * 1024
+
+_init_lock = Lock()
+_initialized_version: Optional[str] = None
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _connect() -> sqlite3.Connection:
+    _CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(_CACHE_FILE), timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _init(conn: sqlite3.Connection, version: str) -> None:
+    global _initialized_version
+    if _initialized_version == version:
+        return
+    with _init_lock:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                sha256 TEXT NOT NULL,
+                version TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (sha256, version)
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries (last_access)")
+        # Results from other pipeline versions can never be served again.
+        conn.execute("DELETE FROM entries WHERE version <> ?", (version,))
+        conn.commit()
+        _initialized_version = version
+
+
+def get(sha256: str, version: str) -> Optional[Dict[str, Any]]:
+    if not Config.ANALYSIS_CACHE_ENABLED:
+        return None
+    try:
+        conn = _connect()
+    except sqlite3.Error:
+        return None
+    try:
+        _init(conn, version)
+        row = conn.execute(
+            "SELECT payload FROM entries WHERE sha256=? AND version=?", (sha256, version)
+        ).fetchone()
+        if not row:
+            return None
+        conn.execute(
+            "UPDATE entries SET last_access=? WHERE sha256=? AND version=?",
+            (time.time(), sha256, version),
+        )
+        conn.commit()
+        return json.loads(row[0])
+    except (sqlite3.Error, ValueError) as exc:
+        print(f"[analysis_cache] Lookup failed: {exc}")
+        return None
+    finally:
+        conn.close()
+
+
+def put(sha256: str, version: str, payload: Dict[str, Any]) -> None:
+    if not Config.ANALYSIS_CACHE_ENABLED:
+        return
+    data = json.dumps(payload, ensure_ascii=False)
+    size = len(data.encode("utf-8"))
+    limit = max(0, Config.ANALYSIS_CACHE_MAX_BYTES)
+    if size > limit:
+        return
+    try:
+        conn = _connect()
+    except sqlite3.Error:
+        return
+    try:
+        _init(conn, version)
+        now = time.time()
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO entries (sha256, version, payload, size, created_at, last_access)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (sha256, version, data, size, now, now),
+        )
+        _evict(conn, limit)
+        conn.commit()
+    except sqlite3.Error as exc:
+        print(f"[analysis_cache] Store failed: {exc}")
+    finally:
+        conn.close()
+
+
+def _evict(conn: sqlite3.Connection, limit: int) -> None:
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    if total <= limit:
+        return
+    for sha256, version, size in conn.execute(
+        "SELECT sha256, version, size FROM entries ORDER BY last_access ASC"
+    ).fetchall():
+        if total <= limit:
+            break
+        conn.execute("DELETE FROM entries WHERE sha256=? AND version=?", (sha256, version))
+        total -= size
+
@@ -0,0 +1,327 @@
+"""
+Background document-analysis queue.
+
+POST /analyze/jobs spools the PDF to disk, records an AnalysisJobs row and
+hands the job to a bounded thread pool, so OCR and zero-shot inference never
+run on a request thread. Job state and results live in the database, so
+polling works from any worker and survives a page reload.
+"""
+from __future__ import annotations
+
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Optional
+
+from app.config import Config
+from app.db import BACKGROUND_POOL, DatabaseUnavailable, get_db_connection, use_pool
+from app.services.document_ai_service import AnalysisCancelled, analyze_pdf
+
+ANALYSIS_JOBS_DDL = """
+CREATE TABLE IF NOT EXISTS AnalysisJobs (
+    JobID CHAR(32) NOT NULL PRIMARY KEY,
+    Status ENUM('queued','running','done','failed','cancelled') NOT NULL DEFAULT 'queued',
+    FileName VARCHAR(255) NOT NULL,
+    SaveOriginal TINYINT(1) NOT NULL DEFAULT 0,
+    Result LONGTEXT DEFAULT NULL,
+    Error TEXT DEFAULT NULL,
+    CreatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    StartedAt DATETIME DEFAULT NULL,
+    FinishedAt DATETIME DEFAULT NULL,
+    INDEX idx_analysisjobs_status (Status, CreatedAt)
+)
+"""
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_SPOOL_DIR = Path(__file__).resolve().parent / "_analysis_spool"
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = Lock()
+_pending = 0
+_pending_lock = Lock()
+_table_ready = False
+
+
+class QueueFull(Exception):
+    """Raised when ANALYSIS_MAX_PENDING jobs are already waiting in this worker."""
+
+
+def _ensure_table(cursor: Any) -> None:
+    global _table_ready
+    if not _table_ready:
+        cursor.execute(ANALYSIS_JOBS_DDL)
+        _table_ready = True
+
+
+def _spool_path(job_id: str) -> Path:
+    return _SPOOL_DIR / f"{job_id}.pdf"
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=max(1, Config.ANALYSIS_WORKERS),
+                    thread_name_prefix="analysis",
+                    initializer=use_pool,
+                    initargs=(BACKGROUND_POOL,),
+                )
+    return _executor
+
+
+def _enqueue(job_id: str) -> None:
+    global _pending
+    with _pending_lock:
+        _pending += 1
+    _get_executor().submit(_run_job, job_id)
+
+
+def submit_job(file_storage, save_original: bool = False) -> str:
+    """Spool the upload, record it and queue it. Returns the job ID."""
+    if _pending >= Config.ANALYSIS_MAX_PENDING:
+        raise QueueFull()
+    job_id = uuid.uuid4().hex
+    _SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+    path = _spool_path(job_id)
+    file_storage.stream.seek(0)
+    file_storage.save(str(path))
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        _ensure_table(cursor)
+        cursor.execute(
+            "INSERT INTO AnalysisJobs (JobID, FileName, SaveOriginal) VALUES (%s, %s, %s)",
+            (job_id, (file_storage.filename or "document.pdf")[:255], 1 if save_original else 0),
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        path.unlink(missing_ok=True)
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+    _enqueue(job_id)
+    return job_id
+
+
+def _finish(job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        # Only a job still marked running can finish; a cancel wins.
+        cursor.execute(
+            """
+            UPDATE AnalysisJobs
+            SET Status=%s, Result=%s, Error=%s, FinishedAt=NOW()
+            WHERE JobID=%s AND Status='running'
+            """,
+            (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error, job_id),
+        )
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _run_job(job_id: str) -> None:
+    global _pending
+    path = _spool_path(job_id)
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            # Atomic claim: a cancelled job, or one another worker picked up,
+            # is skipped.
+            cursor.execute(
+                "UPDATE AnalysisJobs SET Status='running', StartedAt=NOW() WHERE JobID=%s AND Status='queued'",
+                (job_id,),
+            )
+            claimed = cursor.rowcount == 1
+            conn.commit()
+            row = None
+            if claimed:
+                cursor.execute("SELECT FileName, SaveOriginal FROM AnalysisJobs WHERE JobID=%s", (job_id,))
+                row = cursor.fetchone()
+        finally:
+            cursor.close()
+            conn.close()
+        if not claimed or not row:
+            return
+
+        if not path.exists():
+            _finish(job_id, "failed", error="spooled_file_missing")
+            return
+
+        def _checkpoint():
+            # A cancel stops the run at the next stage and frees this worker.
+            if _job_status(job_id) == "cancelled":
+                raise AnalysisCancelled()
+
+        try:
+            result = analyze_pdf(
+                str(path),
+                row["FileName"],
+                save_original=bool(row["SaveOriginal"]),
+                save_dir="uploaded_docs",
+                checkpoint=_checkpoint,
+            )
+        except AnalysisCancelled:
+            print(f"[analysis_jobs] Job {job_id} cancelled while running")
+            return
+        except Exception as exc:
+            print(f"[analysis_jobs] Job {job_id} failed: {exc}")
+            _finish(job_id, "failed", error=str(exc))
+            return
+        _finish(job_id, "done", result=result)
+    except DatabaseUnavailable:
+        print(f"[analysis_jobs] Database unavailable, job {job_id} left queued")
+        return
+    except Exception as exc:
+        print(f"[analysis_jobs] Error running job {job_id}: {exc}")
+    finally:
+        with _pending_lock:
+            _pending -= 1
+        # Keep the spool file for a job that is still queued so it can resume.
+        if _job_status(job_id) not in ACTIVE_STATUSES:
+            path.unlink(missing_ok=True)
+
+
+def _job_status(job_id: str) -> Optional[str]:
+    try:
+        job = get_job(job_id, include_result=False)
+    except Exception:
+        return "queued"
+    return job["status"] if job else None
+
+
+def get_job(job_id: str, include_result: bool = True) -> Optional[Dict[str, Any]]:
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        _ensure_table(cursor)
+        cols = "JobID, Status, FileName, Error, CreatedAt, StartedAt, FinishedAt"
+        if include_result:
+            cols += ", Result"
+        cursor.execute(f"SELECT {cols} FROM AnalysisJobs WHERE JobID=%s", (job_id,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+    if not row:
+        return None
+
+    def _iso(value):
+        return value.isoformat() if isinstance(value, datetime) else value
+
+    job = {
+        "job_id": row["JobID"],
+        "status": row["Status"],
+        "file_name": row["FileName"],
+        "error": row["Error"],
+        "created_at": _iso(row["CreatedAt"]),
+        "started_at": _iso(row["StartedAt"]),
+        "finished_at": _iso(row["FinishedAt"]),
+    }
+    if include_result:
+        job["result"] = json.loads(row["Result"]) if row.get("Result") else None
+    return job
+
+
+def cancel_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Cancel a queued or running job. Returns {"status", "stopping"}, where
+    stopping means a running job was cancelled and halts at its next stage;
+    None if the job is unknown.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        _ensure_table(cursor)
+        cursor.execute("SELECT Status FROM AnalysisJobs WHERE JobID=%s FOR UPDATE", (job_id,))
+        before = cursor.fetchone()
+        cursor.execute(
+            """
+            UPDATE AnalysisJobs
+            SET Status='cancelled', FinishedAt=NOW()
+            WHERE JobID=%s AND Status IN ('queued','running')
+            """,
+            (job_id,),
+        )
+        conn.commit()
+        cursor.execute("SELECT Status FROM AnalysisJobs WHERE JobID=%s", (job_id,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+    if not row:
+        return None
+    stopping = bool(before) and before["Status"] == "running" and row["Status"] == "cancelled"
+    if row["Status"] == "cancelled" and not stopping:
+        # A queued one is skipped when a worker reaches it; a running one
+        # removes its spool file when it stops.
+        _spool_path(job_id).unlink(missing_ok=True)
+    return {"status": row["Status"], "stopping": stopping}
+
+
+def resume_pending_jobs() -> int:
+    """Re-queue jobs left queued by a restart whose spool file is on this host."""
+    if not _SPOOL_DIR.exists():
+        return 0
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        _ensure_table(cursor)
+        cursor.execute("SELECT JobID FROM AnalysisJobs WHERE Status='queued' ORDER BY CreatedAt")
+        rows = cursor.fetchall() or []
+    finally:
+        cursor.close()
+        conn.close()
+    resumed = 0
+    for row in rows:
+        if _spool_path(row["JobID"]).exists():
+            _enqueue(row["JobID"])
+            resumed += 1
+    return resumed
+
+
+def purge_finished_jobs() -> int:
+    """Scheduled clean-up: drop finished jobs past the retention window and stale running ones."""
+    cutoff = datetime.now() - timedelta(days=max(1, Config.ANALYSIS_JOB_RETENTION_DAYS))
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        _ensure_table(cursor)
+        cursor.execute(
+            "DELETE FROM AnalysisJobs WHERE Status IN ('done','failed','cancelled') AND CreatedAt < %s",
+            (cutoff,),
+        )
+        removed = cursor.rowcount
+        # A worker that died mid-job leaves it running forever.
+        cursor.execute(
+            """
+            UPDATE AnalysisJobs
+            SET Status='failed', Error='worker_lost', FinishedAt=NOW()
+            WHERE Status='running' AND StartedAt < NOW() - INTERVAL 1 HOUR
+            """
+        )
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    if _SPOOL_DIR.exists():
+        for path in _SPOOL_DIR.glob("*.pdf"):
+            if path.stat().st_mtime < cutoff.timestamp():
+                path.unlink(missing_ok=True)
+    if removed:
+        print(f"[analysis_jobs] Purged {removed} finished jobs")
+    return removed
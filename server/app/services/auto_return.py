@@ -1,65 +1,54 @@
-from threading import Thread, Event
-from datetime import date
-import time
+from app.db import DatabaseUnavailable, get_db_connection
+from app.services.active_loans import ensure_active_loans, sync_active_loans
+from app.services.notifications import notify_return_recorded_batch
+from app.services.scheduler import SKIPPED
 
-from app.db import get_db_connection
-from app.services.notifications import notify_return_recorded
+# Run by the scheduler; the pass is idempotent, so a short interval is safe.
+AUTO_RETURN_INTERVAL_SECONDS = 60
 
-_stop_event = None
-_thread = None
-
-def _scan_and_auto_return():
-    conn = get_db_connection()
+def run_auto_return():
+    try:
+        conn = get_db_connection()
+    except DatabaseUnavailable:
+        print("[auto_return] Database unavailable, skipping scan")
+        return SKIPPED
     cursor = conn.cursor(dictionary=True)
     try:
-        # Find Approved, not Returned, digital-only document transactions
+        ensure_active_loans()
+        # Approved, digital-only loans whose access period has ended. Locking
+        # the rows keeps overlapping runs (or another worker) from returning
+        # and notifying the same loan twice.
         cursor.execute("""
-            SELECT bt.BorrowID
-            FROM BorrowTransactions bt
-            WHERE bt.ApprovalStatus='Approved'
-              AND COALESCE(bt.ReturnStatus,'Not Returned') <> 'Returned'
-              AND EXISTS (
-                    SELECT 1 FROM BorrowedItems bi
-                    WHERE bi.BorrowID=bt.BorrowID AND bi.ItemType='Document'
-              )
-              AND NOT EXISTS (
-                    SELECT 1 FROM BorrowedItems bi
-                    WHERE bi.BorrowID=bt.BorrowID AND bi.ItemType='Document'
-                      AND bi.DocumentStorageID IS NOT NULL
-              )
+            SELECT al.BorrowID
+            FROM ActiveLoans al
+            JOIN BorrowTransactions bt ON bt.BorrowID = al.BorrowID
+            WHERE al.IsDigital=1
+              AND al.ApprovalStatus='Approved'
+              AND al.DueDate <= CURDATE()
+              AND bt.ReturnStatus <> 'Returned'
+            FOR UPDATE
         """)
-        rows = cursor.fetchall() or []
-        today = date.today()
-
-        for r in rows:
-            bid = r['BorrowID']
-            # Get the due/expiration date (MAX ReturnDate)
-            cursor.execute("""
-                SELECT MAX(ReturnDate) AS DueDate
-                FROM ReturnTransactions
-                WHERE BorrowID=%s
-            """, (bid,))
-            due_row = cursor.fetchone()
-            due = due_row and due_row.get('DueDate')
-            if not due:
-                continue  # no due date recorded, skip
-            # Compare by date only
-            if getattr(due, 'date', None):
-                due_d = due.date()
-            else:
-                # Fallback if it's already a date
-                due_d = due
-            if due_d and due_d <= today:
-                # Mark as returned (no inventory changes for digital)
-                cursor.execute("""
-                    UPDATE BorrowTransactions
-                    SET ReturnStatus='Returned'
-                    WHERE BorrowID=%s
-                """, (bid,))
-                # Notify borrower/staff
-                notify_return_recorded(cursor, bid)
+        borrow_ids = [int(r['BorrowID']) for r in cursor.fetchall() or []]
+        if not borrow_ids:
+            conn.commit()
+            return
+
+        # Mark them all as returned in one statement (no inventory changes
+        # for digital); the ReturnStatus guard keeps reruns idempotent.
+        fmt = ','.join(['%s'] * len(borrow_ids))
+        cursor.execute(f"""
+            UPDATE BorrowTransactions
+            SET ReturnStatus='Returned'
+            WHERE BorrowID IN ({fmt})
+              AND ReturnStatus <> 'Returned'
+        """, tuple(borrow_ids))
+        returned = cursor.rowcount
+        sync_active_loans(cursor, borrow_ids)
+        # Notify borrowers/staff
+        sent = notify_return_recorded_batch(cursor, borrow_ids)
 
         conn.commit()
+        print(f"[auto_return] Returned {returned} expired digital loans, {sent['notifications']} notifications")
     except Exception as e:
         # Best-effort; don't crash the service
         try:
@@ -67,28 +56,8 @@ def _scan_and_auto_return():
         except:
             pass
         print(f"[auto_return] Error: {e}")
+        # Let the scheduler record the failure and retry the slot.
+        raise
     finally:
         cursor.close()
         conn.close()
-
-def start_auto_return_service(app, interval_seconds: int = 60):
-    global _stop_event, _thread
-    if _thread and _thread.is_alive():
-        return  # already running
-    _stop_event = Event()
-
-    def _runner():
-        with app.app_context():
-            while not _stop_event.is_set():
-                _scan_and_auto_return()
-                # Wait with early-exit
-                _stop_event.wait(interval_seconds)
-
-    _thread = Thread(target=_runner, name="auto-return-service", daemon=True)
-    _thread.start()
-
-def stop_auto_return_service():
-    global _stop_event, _thread
-    if _stop_event:
-        _stop_event.set()
-    _thread = None
\ No newline at end of file
@@ -0,0 +1,364 @@
+"""
+Content-addressed storage for document PDFs.
+
+Each distinct file is stored once, named by its SHA-256 and sharded two levels
+deep: UPLOAD_FOLDER/blobs/ab/cd/abcd....pdf. Documents.File_Path keeps a
+public URL of the form /uploads/b/<sha256>/<original-name>, so the original
+file name survives for display and downloads. The FileBlobs table counts how
+many documents reference each blob. Uploading the same PDF again only bumps
+that count.
+
+Blobs whose count has dropped to zero are deleted by the scheduled garbage
+collector after BLOB_GC_GRACE_HOURS. The grace period also protects a blob
+that was just stored but whose document row has not been committed yet.
+
+    python -m app.services.blob_store migrate [--dry-run]   # move existing uploads in
+    python -m app.services.blob_store recount               # rebuild counts from Documents
+    python -m app.services.blob_store gc
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import shutil
+import sys
+import time
+import uuid
+from threading import Lock
+from typing import Any, Dict, Iterable, Optional, Set
+
+from werkzeug.utils import secure_filename
+
+from app.config import Config
+from app.db import get_db_connection
+from app.services.uploads import StoredUpload, hash_file
+
+FILE_BLOBS_DDL = """
+CREATE TABLE IF NOT EXISTS FileBlobs (
+    SHA256 CHAR(64) NOT NULL PRIMARY KEY,
+    SizeBytes BIGINT NOT NULL,
+    RefCount INT NOT NULL DEFAULT 0,
+    CreatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UpdatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_fileblobs_gc (RefCount, UpdatedAt)
+)
+"""
+
+BLOB_DIR = "blobs"
+_INCOMING_DIR = ".incoming"
+PUBLIC_PREFIX = "/uploads/b/"
+_URL_RE = re.compile(r"^/uploads/b/([0-9a-f]{64})/")
+_SHA_RE = re.compile(r"^[0-9a-f]{64}$")
+# Files written by the old upload routes: "<uuid4>_<name>".
+_LEGACY_NAME_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}_")
+
+_table_ready = False
+_table_lock = Lock()
+
+
+def ensure_table() -> None:
+    """Create FileBlobs once per process."""
+    global _table_ready
+    if _table_ready:
+        return
+    with _table_lock:
+        if _table_ready:
+            return
+        # DDL commits implicitly, so it runs on its own connection rather
+        # than inside a route's transaction.
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(FILE_BLOBS_DDL)
+            _table_ready = True
+        finally:
+            cursor.close()
+            conn.close()
+
+
+def _root() -> str:
+    return os.path.join(Config.UPLOAD_FOLDER, BLOB_DIR)
+
+
+def blob_path(sha256: str) -> str:
+    if not _SHA_RE.match(sha256 or ""):
+        raise ValueError("invalid blob id")
+    return os.path.join(_root(), sha256[:2], sha256[2:4], f"{sha256}.pdf")
+
+
+def incoming_path() -> str:
+    """Where an upload is written before its hash (and so its blob path) is known."""
+    path = os.path.join(_root(), _INCOMING_DIR)
+    os.makedirs(path, exist_ok=True)
+    return os.path.join(path, f"{uuid.uuid4().hex}.pdf")
+
+
+def public_url(sha256: str, original_name: str) -> str:
+    return f"{PUBLIC_PREFIX}{sha256}/{secure_filename(original_name or '') or 'document.pdf'}"
+
+
+def sha_from_url(file_path: Optional[str]) -> Optional[str]:
+    match = _URL_RE.match(file_path or "")
+    return match.group(1) if match else None
+
+
+def adopt(stored: StoredUpload) -> str:
+    """Move a freshly written upload into the store. Returns its SHA-256."""
+    target = blob_path(stored.sha256)
+    if os.path.exists(target):
+        # Already stored: keep the existing copy and mark it recently used so
+        # the collector's grace period covers the pending reference.
+        os.utime(target)
+        os.remove(stored.path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(stored.path, target)
+    return stored.sha256
+
+
+def add_ref(cursor: Any, sha256: str, size: Optional[int] = None) -> None:
+    """Count one more reference; call inside the transaction that writes File_Path."""
+    ensure_table()
+    if size is None:
+        try:
+            size = os.path.getsize(blob_path(sha256))
+        except OSError:
+            size = 0
+    cursor.execute(
+        """
+        INSERT INTO FileBlobs (SHA256, SizeBytes, RefCount) VALUES (%s, %s, 1)
+        ON DUPLICATE KEY UPDATE RefCount = RefCount + 1
+        """,
+        (sha256, size),
+    )
+
+
+def release_ref(cursor: Any, file_path: Optional[str]) -> None:
+    sha256 = sha_from_url(file_path)
+    if not sha256:
+        return
+    ensure_table()
+    cursor.execute(
+        "UPDATE FileBlobs SET RefCount = GREATEST(RefCount - 1, 0) WHERE SHA256=%s",
+        (sha256,),
+    )
+
+
+def swap_ref(cursor: Any, old_path: Optional[str], new_path: Optional[str]) -> None:
+    """Move a document's reference from old_path to new_path (either may be a non-blob path)."""
+    if old_path == new_path:
+        return
+    new_sha = sha_from_url(new_path)
+    if new_sha:
+        add_ref(cursor, new_sha)
+    release_ref(cursor, old_path)
+
+
+def live_hashes() -> Set[str]:
+    """SHA-256 of every blob that a document references."""
+    ensure_table()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT SHA256 FROM FileBlobs WHERE RefCount > 0")
+        return {row[0] for row in cursor.fetchall() or []}
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def collect_garbage() -> Dict[str, int]:
+    """Scheduled job: delete unreferenced blobs and stray files past the grace period."""
+    grace_seconds = max(0, Config.BLOB_GC_GRACE_HOURS) * 3600
+    cutoff = time.time() - grace_seconds
+    removed_rows = removed_files = 0
+    ensure_table()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT SHA256 FROM FileBlobs WHERE RefCount = 0 AND UpdatedAt < NOW() - INTERVAL %s SECOND",
+            (grace_seconds,),
+        )
+        candidates = [row[0] for row in cursor.fetchall() or []]
+        for sha256 in candidates:
+            # Re-check in the DELETE: a new reference may have arrived meanwhile.
+            cursor.execute("DELETE FROM FileBlobs WHERE SHA256=%s AND RefCount = 0", (sha256,))
+            conn.commit()
+            if cursor.rowcount != 1:
+                continue
+            removed_rows += 1
+            path = blob_path(sha256)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed_files += 1
+            except OSError:
+                pass
+
+        # Files with no row at all: failed uploads or rows removed above while
+        # the file was still fresh.
+        known = set()
+        cursor.execute("SELECT SHA256 FROM FileBlobs")
+        known.update(row[0] for row in cursor.fetchall() or [])
+    finally:
+        cursor.close()
+        conn.close()
+
+    root = _root()
+    if os.path.isdir(root):
+        for dirpath, _dirnames, filenames in os.walk(root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                sha256 = name[:-4] if name.endswith(".pdf") else ""
+                in_incoming = os.path.basename(dirpath) == _INCOMING_DIR
+                if not in_incoming and sha256 in known:
+                    continue
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed_files += 1
+                except OSError:
+                    continue
+    if removed_rows or removed_files:
+        print(f"[blob_store] Collected {removed_rows} unreferenced blobs, removed {removed_files} files")
+    return {"blobs": removed_rows, "files": removed_files}
+
+
+def recount(cursor: Any) -> None:
+    """Rebuild every RefCount from Documents.File_Path, the source of truth."""
+    ensure_table()
+    start = len(PUBLIC_PREFIX) + 1
+    # Referenced blobs that lost their row get one back.
+    cursor.execute(
+        """
+        INSERT IGNORE INTO FileBlobs (SHA256, SizeBytes, RefCount)
+        SELECT DISTINCT SUBSTRING(File_Path, %s, 64), 0, 0 FROM Documents WHERE File_Path LIKE %s
+        """,
+        (start, f"{PUBLIC_PREFIX}%"),
+    )
+    cursor.execute(
+        """
+        UPDATE FileBlobs fb
+        LEFT JOIN (
+            SELECT SUBSTRING(File_Path, %s, 64) AS SHA256, COUNT(*) AS Refs
+            FROM Documents
+            WHERE File_Path LIKE %s
+            GROUP BY SUBSTRING(File_Path, %s, 64)
+        ) d ON d.SHA256 = fb.SHA256
+        SET fb.RefCount = COALESCE(d.Refs, 0)
+        """,
+        (start, f"{PUBLIC_PREFIX}%", start),
+    )
+
+
+def _store_existing(path: str, dry_run: bool) -> tuple:
+    """Hash a legacy upload and hard-link (or copy) it into the store."""
+    sha256 = hash_file(path)
+    size = os.path.getsize(path)
+    target = blob_path(sha256)
+    if not dry_run and not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f"{target}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.link(path, tmp)
+        except OSError:
+            shutil.copyfile(path, tmp)
+        os.replace(tmp, target)
+    return sha256, size
+
+
+def migrate(dry_run: bool = False) -> Dict[str, int]:
+    """Move files referenced by Documents.File_Path (/uploads/<name>) into the store."""
+    upload_folder = Config.UPLOAD_FOLDER
+    stats = {"documents": 0, "missing": 0, "deduplicated_bytes": 0, "removed_files": 0}
+    first_path: Dict[str, str] = {}
+    migrated_files = set()
+    kept_files = set()
+    ensure_table()
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            "SELECT Document_ID, File_Path FROM Documents WHERE File_Path LIKE '/uploads/%%' AND File_Path NOT LIKE %s",
+            (f"{PUBLIC_PREFIX}%",),
+        )
+        rows = cursor.fetchall() or []
+        for row in rows:
+            name = row["File_Path"][len("/uploads/"):]
+            if not name or "/" in name or "\\" in name:
+                continue
+            path = os.path.join(upload_folder, name)
+            if not os.path.isfile(path):
+                stats["missing"] += 1
+                print(f"  missing: document {row['Document_ID']} -> {row['File_Path']}")
+                continue
+            sha256, size = _store_existing(path, dry_run)
+            if first_path.setdefault(sha256, path) != path and path not in migrated_files:
+                stats["deduplicated_bytes"] += size
+            # Strip the uuid prefix the old routes added so the URL shows the real name.
+            display_name = _LEGACY_NAME_RE.sub("", name)
+            new_url = public_url(sha256, display_name)
+            if not dry_run:
+                cursor.execute(
+                    "UPDATE Documents SET File_Path=%s WHERE Document_ID=%s AND File_Path=%s",
+                    (new_url, row["Document_ID"], row["File_Path"]),
+                )
+                if cursor.rowcount != 1:
+                    # Changed underneath us; leave its file where it is.
+                    conn.commit()
+                    kept_files.add(path)
+                    continue
+                add_ref(cursor, sha256, size)
+                conn.commit()
+            stats["documents"] += 1
+            migrated_files.add(path)
+    finally:
+        cursor.close()
+        conn.close()
+
+    # Per-document copies from the old routes are now in the store. Other
+    # files stay: they are also the shared uploads library.
+    for path in migrated_files - kept_files:
+        if _LEGACY_NAME_RE.match(os.path.basename(path)):
+            stats["removed_files"] += 1
+            if not dry_run:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+    return stats
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.services.blob_store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("migrate").add_argument("--dry-run", action="store_true")
+    sub.add_parser("recount")
+    sub.add_parser("gc")
+    args = parser.parse_args(list(argv) if argv is not None else None)
+
+    if args.command == "migrate":
+        stats = migrate(dry_run=args.dry_run)
+        prefix = "Would migrate" if args.dry_run else "Migrated"
+        print(f"{prefix} {stats['documents']} documents ({stats['missing']} files missing); "
+              f"{stats['deduplicated_bytes']} duplicate bytes; {stats['removed_files']} legacy copies removed")
+        return 0
+    if args.command == "recount":
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            recount(cursor)
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+        print("Reference counts rebuilt from Documents.")
+        return 0
+    print(collect_garbage())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+Metadata for borrower attachment PDFs.
+
+The user list used to read every attachment from disk and inline it as
+base64. Responses now carry only a small descriptor (URL, size, SHA-256), and
+the PDF is streamed from GET /users/<id>/attachment when it is opened. Size
+and hash live in AttachmentFiles, keyed by Borrowers.AttachmentPath, so the
+list is still one joined query with no file reads. Attachments saved before
+this table existed get their row the first time they are served.
+"""
+from __future__ import annotations
+
+import os
+from threading import Lock
+from typing import Any, Dict, Optional
+
+from app.db import get_db_connection
+from app.services.uploads import hash_file
+
+ATTACHMENT_FILES_DDL = """
+CREATE TABLE IF NOT EXISTS AttachmentFiles (
+    Path VARCHAR(500) NOT NULL PRIMARY KEY,
+    SizeBytes BIGINT NOT NULL,
+    SHA256 CHAR(64) NOT NULL,
+    RecordedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+_table_ready = False
+_table_lock = Lock()
+
+
+def ensure_table() -> None:
+    """Create the table once per process, before any transaction that uses it."""
+    global _table_ready
+    if _table_ready:
+        return
+    with _table_lock:
+        if _table_ready:
+            return
+        # DDL commits implicitly, so it runs on its own connection rather
+        # than inside a route's transaction.
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(ATTACHMENT_FILES_DDL)
+            _table_ready = True
+        finally:
+            cursor.close()
+            conn.close()
+
+
+def record(cursor: Any, db_path: str, file_path: str) -> Dict[str, Any]:
+    """Hash a stored attachment and remember its size and SHA-256. Needs ensure_table() first."""
+    size = os.path.getsize(file_path)
+    sha256 = hash_file(file_path)
+    cursor.execute(
+        """
+        INSERT INTO AttachmentFiles (Path, SizeBytes, SHA256) VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE SizeBytes=VALUES(SizeBytes), SHA256=VALUES(SHA256), RecordedAt=NOW()
+        """,
+        (db_path, size, sha256),
+    )
+    return {"size": size, "sha256": sha256}
+
+
+def forget(db_path: Optional[str]) -> None:
+    if not db_path:
+        return
+    ensure_table()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM AttachmentFiles WHERE Path=%s", (db_path,))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def descriptor(user_id: int, db_path: Optional[str], size: Optional[int], sha256: Optional[str]) -> Optional[Dict[str, Any]]:
+    """What user responses carry instead of the file."""
+    if not db_path:
+        return None
+    return {
+        "url": f"/users/{user_id}/attachment",
+        "name": db_path.replace("\\", "/").split("/")[-1],
+        "size": int(size) if size is not None else None,
+        "sha256": sha256,
+    }
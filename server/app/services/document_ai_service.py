@@ -3,24 +3,12 @@ import tempfile
 import shutil
 import re
 from datetime import datetime
-from io import BytesIO
+from typing import Callable, Optional
 
-try:
-    from PyPDF2 import PdfReader
-except ImportError:
-    PdfReader = None
+from app.config import Config
 
-try:
-    import pytesseract
-except ImportError:
-    pytesseract = None
-
-try:
-    from PIL import Image
-except ImportError:
-    Image = None
-
-from . import document_classifier
+from . import analysis_cache, document_classifier, page_ocr
+from .pdf_document import ParsedPDF, PdfReader
 
 ALLOWED_SENSITIVITY = ["Public", "Restricted", "Confidential"]
 ALLOWED_CLASSIFICATIONS = ["Public Resource", "Government Document", "Historical File"]
@@ -41,7 +29,9 @@ _SENS_KEYWORDS = [
     r"\bssn\b", r"\bsocial security\b", r"\bstudent id\b"
 ]
 
-OCR_MAX_PAGES = 3
+# Bump whenever extraction, OCR or classifier behaviour changes so cached
+# analysis results from the old pipeline are discarded.
+PIPELINE_VERSION = "2"
 
 
 def _normalize_text(value, default="N/A") -> str:
@@ -78,25 +68,26 @@ def _merge_field_sources(primary: dict, secondary: dict) -> dict:
     return result
 
 
-def _run_classifier_pipeline(pdf_path: str, combined_text: str):
+def _run_classifier_pipeline(doc: ParsedPDF, combined_text: str):
     if not combined_text.strip():
-        return {}, [], None, {}
+        return {}, [], None, {}, None
     classifier_fields = {}
     ranked = []
     sensitivity = None
     pii_summary = {}
     try:
-        meta = document_classifier.extract_metadata(pdf_path)
+        meta = document_classifier.extract_metadata(doc.path, doc)
     except Exception:
         meta = {}
     try:
-        classifier_fields = document_classifier.extract_structured_fields(combined_text, meta)
+        zero_shot = document_classifier.classify_all(combined_text)
     except Exception:
-        classifier_fields = {}
+        zero_shot = None
     try:
-        ranked = document_classifier.classify_document(combined_text)
+        classifier_fields = document_classifier.extract_structured_fields(combined_text, meta, zero_shot)
     except Exception:
-        ranked = []
+        classifier_fields = {}
+    ranked = (zero_shot or {}).get("classification") or []
     try:
         pii = document_classifier.detect_pii(combined_text)
         sensitivity = document_classifier.sensitivity_flag(combined_text, pii)
@@ -107,65 +98,10 @@ def _run_classifier_pipeline(pdf_path: str, combined_text: str):
     except Exception:
         sensitivity = None
         pii_summary = {}
-    return classifier_fields, ranked, sensitivity, pii_summary
-
-
-def _iter_page_images(page):
-    """Yield raw image bytes from a PDF page."""
-    yielded = False
-
-    try:
-        for img in getattr(page, "images", []) or []:
-            data = getattr(img, "data", None)
-            if data:
-                yielded = True
-                yield data
-    except Exception:
-        pass
-
-    if yielded:
-        return
-
-    try:
-        resources = page.get("/Resources")
-        if not resources:
-            return
-        xobjects = resources.get("/XObject")
-        if not xobjects:
-            return
-        xobjects = xobjects.get_object()
-        for name, xobj in xobjects.items():  # pylint: disable=unused-variable
-            if xobj.get("/Subtype") != "/Image":
-                continue
-            try:
-                yield xobj.get_data()
-            except Exception:
-                continue
-    except Exception:
-        return
+    backend = (zero_shot or {}).get("backend")
+    return classifier_fields, ranked, sensitivity, pii_summary, backend
 
 
-def _ocr_images_from_page(page) -> str:
-    if not pytesseract or not Image:
-        return ""
-
-    texts = []
-    for data in _iter_page_images(page):
-        try:
-            with Image.open(BytesIO(data)) as img:
-                pil_img = img.convert("RGB") if img.mode not in ("RGB", "L") else img.copy()
-        except Exception:
-            continue
-        try:
-            text = pytesseract.image_to_string(pil_img)
-        except Exception:
-            text = ""
-        finally:
-            pil_img.close()
-        if text and text.strip():
-            texts.append(text.strip())
-    return "\n".join(texts)
-
 def _safe_filename(original_name: str) -> str:
     base = os.path.basename(original_name or "document.pdf")
     base = base.replace("..", "_").replace("/", "_").replace("\\", "_")
@@ -214,7 +150,11 @@ def _normalize_classification(val):
             return c
     return None  # route will re-heuristic if needed
 
-def _extract_fields_from_pdf(pdf_path: str):
+class AnalysisCancelled(Exception):
+    """Raised at a stage boundary once the caller no longer wants the result."""
+
+
+def _extract_fields_from_pdf(doc: ParsedPDF, checkpoint: Optional[Callable[[], None]] = None):
     heuristic_fields = {}
     combined_text = ""
     ocr_segments = []
@@ -222,19 +162,34 @@ def _extract_fields_from_pdf(pdf_path: str):
         return heuristic_fields, combined_text, {"ocr_used": False}
 
     text_segments = []
+    text_content = ""
+    ocr_content = ""
+    page_count = 0
+    ocr_tasks = []
+    ocr_timeouts = []
+    rendered_pages = 0
     try:
-        reader = PdfReader(pdf_path)
-        page_count = len(reader.pages)
-        limit = min(OCR_MAX_PAGES, page_count)
+        page_count = doc.page_count
+        limit = min(max(1, Config.OCR_PAGE_BUDGET), page_count)
+        min_chars = max(0, Config.OCR_TEXT_MIN_CHARS)
+        ocr_enabled = page_ocr.ocr_available()
         for i in range(limit):
-            page = reader.pages[i]
-            try:
-                text_segments.append(page.extract_text() or "")
-            except Exception:
-                text_segments.append("")
-            ocr_text = _ocr_images_from_page(page)
-            if ocr_text:
-                ocr_segments.append(ocr_text)
+            page_text = doc.page_text(i)
+            text_segments.append(page_text)
+            # A page with a real text layer needs no OCR.
+            if not ocr_enabled or len(page_text.strip()) >= min_chars:
+                continue
+            blobs = doc.page_images(i)
+            if blobs:
+                ocr_tasks.append((i, blobs))
+            elif not page_text.strip() and page_ocr.render_available():
+                ocr_tasks.append((i, None))
+
+        if checkpoint and ocr_tasks:
+            checkpoint()
+        ocr_by_page, ocr_timeouts = page_ocr.ocr_pages(doc.path, ocr_tasks)
+        rendered_pages = sum(1 for _, blobs in ocr_tasks if blobs is None)
+        ocr_segments = [ocr_by_page[i] for i in sorted(ocr_by_page)]
 
         text_content = "\n".join(seg for seg in text_segments if seg).strip()
         ocr_content = "\n".join(ocr_segments).strip()
@@ -264,10 +219,16 @@ def _extract_fields_from_pdf(pdf_path: str):
         lower = analysis_source.lower()
         heuristic_fields["Classification"] = _heuristic_classification(lower)
         heuristic_fields["Sensitivity"] = _heuristic_sensitivity(lower)
+    except AnalysisCancelled:
+        raise
     except Exception:
         combined_text = combined_text or ""
 
-    classifier_fields, ranked, classifier_sensitivity, pii_summary = _run_classifier_pipeline(pdf_path, combined_text)
+    if checkpoint:
+        checkpoint()
+    classifier_fields, ranked, classifier_sensitivity, pii_summary, backend = _run_classifier_pipeline(
+        doc, combined_text
+    )
     merged_fields = _merge_field_sources(heuristic_fields, classifier_fields)
 
     # Defaults and normalization
@@ -288,14 +249,98 @@ def _extract_fields_from_pdf(pdf_path: str):
     )
 
     analysis = {
+        "text": text_content,
+        "ocr_text": ocr_content,
         "ocr_used": bool(ocr_segments),
+        "pages_total": page_count,
+        "pages_analyzed": len(text_segments),
+        "ocr_pages": len(ocr_tasks),
+        "ocr_rendered_pages": rendered_pages,
+        "ocr_timeouts": [i + 1 for i in ocr_timeouts],
         "classifier_ranked": ranked,
         "classifier_top": normalized_class or merged_fields.get("Classification"),
+        "classifier_backend": backend,
         "pii_summary": pii_summary
     }
 
     return merged_fields, combined_text, analysis
 
+def analyze_pdf(pdf_path: str, file_name: str, save_original=False, save_dir="uploaded_docs",
+                checkpoint: Optional[Callable[[], None]] = None):
+    """
+    Run the extraction/classification pipeline on a PDF already on disk.
+    Returns the same shape as process_upload(). `checkpoint` is called
+    between stages and may raise AnalysisCancelled to stop the run.
+    """
+    # Results differ per classifier backend, so it is part of the cache version.
+    cache_version = f"{PIPELINE_VERSION}:{(Config.DOCUMENT_CLASSIFIER_BACKEND or 'zero-shot').lower()}"
+    with ParsedPDF(pdf_path) as doc:
+        sha256 = doc.sha256
+        cached = analysis_cache.get(sha256, cache_version)
+        if cached is not None:
+            extracted = cached["fields"]
+            combined_text = cached["combined_text"]
+            analysis_details = cached["analysis"]
+        else:
+            extracted, combined_text, analysis_details = _extract_fields_from_pdf(doc, checkpoint)
+            analysis_details = analysis_details or {}
+            analysis_cache.put(sha256, cache_version, {
+                "fields": extracted,
+                "combined_text": combined_text,
+                "analysis": analysis_details,
+            })
+    ocr_used = bool(analysis_details.get("ocr_used", False))
+    if checkpoint:
+        checkpoint()
+
+    extracted["Classification"] = _normalize_classification(extracted.get("Classification")) or extracted.get("Classification")
+    extracted["Sensitivity"] = _normalize_sensitivity(extracted.get("Sensitivity"))
+    # Alignment: guarantee keys & defaults
+    extracted["Department"] = _normalize_text(extracted.get("Department"))
+    extracted["Category"] = _normalize_text(extracted.get("Category"))
+    extracted["Author"] = _normalize_text(extracted.get("Author"))
+    extracted["Year"] = _normalize_text(extracted.get("Year"))
+
+    final_saved_path = None
+    if save_original:
+        os.makedirs(save_dir, exist_ok=True)
+        safe_name = _safe_filename(file_name)
+        final_saved_path = os.path.join(save_dir, safe_name)
+        shutil.copyfile(pdf_path, final_saved_path)
+
+    pii_summary = analysis_details.get("pii_summary")
+    if not isinstance(pii_summary, dict):
+        pii_summary = {}
+    classifier_ranked = analysis_details.get("classifier_ranked")
+    if not isinstance(classifier_ranked, list):
+        classifier_ranked = []
+
+    training_metadata = {
+        "file_name": file_name or "document.pdf",
+        "saved_path": final_saved_path,
+        "ocr_used": ocr_used,
+        "text_chars": len(combined_text),
+        "classifier_top": analysis_details.get("classifier_top"),
+        "pii_types": pii_summary.get("types"),
+        "classifier_ranked": classifier_ranked[:3],
+        # Lets local_classifier train leave out its own predictions.
+        "classifier_backend": analysis_details.get("classifier_backend"),
+        "sha256": sha256
+    }
+    if cached is None:
+        # A cache hit is a duplicate upload; don't record it twice.
+        try:
+            document_classifier.record_training_sample(dict(extracted), combined_text, training_metadata)
+        except Exception:
+            pass
+
+    return {
+        "saved_path": final_saved_path,
+        "extracted_fields": extracted,
+        "sha256": sha256,
+        "cached": cached is not None
+    }
+
 def process_upload(file_storage, save_original=False, save_dir="uploaded_docs"):
     """
     Returns:
@@ -312,54 +357,10 @@ def process_upload(file_storage, save_original=False, save_dir="uploaded_docs"):
     try:
         file_storage.stream.seek(0)
         file_storage.save(temp_path)
-
-        extracted, combined_text, analysis_details = _extract_fields_from_pdf(temp_path)
-        analysis_details = analysis_details or {}
-        ocr_used = bool(analysis_details.get("ocr_used", False))
-
-        extracted["Classification"] = _normalize_classification(extracted.get("Classification")) or extracted.get("Classification")
-        extracted["Sensitivity"] = _normalize_sensitivity(extracted.get("Sensitivity"))
-        # Alignment: guarantee keys & defaults
-        extracted["Department"] = _normalize_text(extracted.get("Department"))
-        extracted["Category"] = _normalize_text(extracted.get("Category"))
-        extracted["Author"] = _normalize_text(extracted.get("Author"))
-        extracted["Year"] = _normalize_text(extracted.get("Year"))
-
-        final_saved_path = None
-        if save_original:
-            os.makedirs(save_dir, exist_ok=True)
-            safe_name = _safe_filename(file_storage.filename)
-            final_saved_path = os.path.join(save_dir, safe_name)
-            shutil.copyfile(temp_path, final_saved_path)
-
-        pii_summary = analysis_details.get("pii_summary")
-        if not isinstance(pii_summary, dict):
-            pii_summary = {}
-        classifier_ranked = analysis_details.get("classifier_ranked")
-        if not isinstance(classifier_ranked, list):
-            classifier_ranked = []
-
-        training_metadata = {
-            "file_name": file_storage.filename or "document.pdf",
-            "saved_path": final_saved_path,
-            "ocr_used": ocr_used,
-            "text_chars": len(combined_text),
-            "classifier_top": analysis_details.get("classifier_top"),
-            "pii_types": pii_summary.get("types"),
-            "classifier_ranked": classifier_ranked[:3]
-        }
-        try:
-            document_classifier.record_training_sample(dict(extracted), combined_text, training_metadata)
-        except Exception:
-            pass
-
-        return {
-            "saved_path": final_saved_path,
-            "extracted_fields": extracted
-        }
+        return analyze_pdf(temp_path, file_storage.filename, save_original=save_original, save_dir=save_dir)
     finally:
         try:
             if os.path.exists(temp_path):
                 os.remove(temp_path)
         except OSError:
-            pass
\ No newline at end of file
+            pass
@@ -1,12 +1,16 @@
-import os, re, hashlib, datetime, mimetypes, math, threading, json
+import os, re, hashlib, datetime, mimetypes, math, threading, json, time
 from pathlib import Path
 from typing import Dict, Any, List, Optional, cast
-import PyPDF2, docx
+import docx
+
+from app.config import Config
+from app.services.pdf_document import ParsedPDF
 
 # ---------- MODEL LOADING (smart cache + graceful fallback) ----------
 _zero_shot = None
 _zero_shot_lock = threading.Lock()
 _zero_shot_failed = False
+_zero_shot_load_seconds: Optional[float] = None
 
 _TRAINING_DIR = Path(__file__).resolve().parent / "_training_data"
 _TRAINING_FILE = _TRAINING_DIR / "document_samples.jsonl"
@@ -14,12 +18,13 @@ _TRAINING_LOCK = threading.Lock()
 _TRAINING_TEXT_LIMIT = 20000
 
 def get_zero_shot():
-    global _zero_shot, _zero_shot_failed
+    global _zero_shot, _zero_shot_failed, _zero_shot_load_seconds
     if _zero_shot_failed:
         return None
     if _zero_shot is None:
         with _zero_shot_lock:
             if _zero_shot is None:
+                started = time.monotonic()
                 try:
                     from transformers import pipeline
                     _zero_shot = pipeline(
@@ -27,11 +32,40 @@ def get_zero_shot():
                         model="facebook/bart-large-mnli",
                         device=-1
                     )
+                    _zero_shot_load_seconds = round(time.monotonic() - started, 2)
+                    print(f"[document_classifier] Zero-shot model loaded in {_zero_shot_load_seconds}s")
                 except Exception:
                     _zero_shot_failed = True
                     _zero_shot = None
     return _zero_shot
 
+def zero_shot_load_seconds() -> Optional[float]:
+    return _zero_shot_load_seconds
+
+def _use_model_server() -> bool:
+    from app.services import model_server
+    return Config.MODEL_SERVER_ENABLED and not model_server.IN_SERVER
+
+def zero_shot_available() -> bool:
+    """True when zero-shot inference can run, without loading the model into a web worker."""
+    if _use_model_server():
+        from app.services import model_server
+        if model_server.server_available():
+            return True
+        if not Config.MODEL_SERVER_FALLBACK:
+            return False
+    return get_zero_shot() is not None
+
+def warm_up() -> None:
+    """Load the model (or start the model server) and run one tiny inference."""
+    if _use_model_server():
+        from app.services import model_server
+        model_server.ensure_server()
+    try:
+        _batched_zero_shot([("Warm-up document.", CLASSIFICATION_LABELS[:1])])
+    except Exception as exc:
+        print(f"[document_classifier] Warm-up skipped: {exc}")
+
 # Restricted classification labels (business rule)
 CLASSIFICATION_LABELS = ["Public Resources", "Government Document", "Historical Files"]
 CATEGORY_LABELS = [
@@ -65,51 +99,36 @@ SENSITIVE_KEYWORDS = [
 SENSITIVITY_LEVELS = ["Public","Restricted","Confidential"]
 
 # ------------- TEXT & METADATA EXTRACTION -------------
-def extract_metadata(path_str: str) -> Dict[str, Any]:
+def extract_metadata(path_str: str, doc: Optional[ParsedPDF] = None) -> Dict[str, Any]:
+    if doc is not None:
+        return doc.file_info()
     path = Path(path_str)
+    if path.suffix.lower() == ".pdf":
+        with ParsedPDF(path_str) as parsed:
+            return parsed.file_info()
     stat = path.stat()
     mime, _ = mimetypes.guess_type(path_str)
-    sha256 = hashlib.sha256(path.read_bytes()).hexdigest()
-    pdf_meta = {}
-    if path.suffix.lower() == ".pdf":
-        try:
-            with open(path_str, "rb") as f:
-                reader = PyPDF2.PdfReader(f)
-                if reader.metadata:
-                    for k, v in reader.metadata.items():
-                        if isinstance(v, str):
-                            cleaned = v.strip()
-                            if cleaned:
-                                pdf_meta[k.strip("/").lower()] = cleaned
-        except Exception:
-            pass
+    digest = hashlib.sha256()
+    with open(path_str, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
     return {
         "file_name": path.name,
         "extension": path.suffix.lower(),
         "size_bytes": stat.st_size,
         "mime_type": mime or "application/octet-stream",
-        "sha256": sha256,
-        "pdf_raw_metadata": pdf_meta
+        "sha256": digest.hexdigest(),
+        "pdf_raw_metadata": {}
     }
 
-def extract_text(path_str: str, max_chars: int = 250_000) -> str:
+def extract_text(path_str: str, max_chars: int = 250_000, doc: Optional[ParsedPDF] = None) -> str:
     ext = Path(path_str).suffix.lower()
     text = ""
-    if ext == ".pdf":
-        pages = []
-        try:
-            with open(path_str, "rb") as f:
-                reader = PyPDF2.PdfReader(f)
-                for idx, p in enumerate(reader.pages):
-                    try:
-                        pages.append(p.extract_text() or "")
-                        if sum(len(x) for x in pages) > max_chars:
-                            break
-                    except Exception:
-                        continue
-        except Exception:
-            pass
-        text = "\n".join(pages)
+    if doc is not None:
+        text = doc.text(max_chars)
+    elif ext == ".pdf":
+        with ParsedPDF(path_str) as parsed:
+            text = parsed.text(max_chars)
     elif ext == ".docx":
         try:
             d = docx.Document(path_str)
@@ -151,33 +170,178 @@ def segment_text(text: str, seg_size: int = 1600, max_segments: int = 4) -> List
         segments.append(" ".join(cur))
     return segments or [text[:seg_size]]
 
+HYPOTHESIS_TEMPLATE = "This example is {}."
+ZERO_SHOT_PREMISE_CHARS = 4000
+_torch_threads_applied = False
+
+
+def _entail_contra_ids(model) -> Optional[tuple]:
+    label2id = getattr(model.config, "label2id", {}) or {}
+    entail = contra = None
+    for label, idx in label2id.items():
+        low = str(label).lower()
+        if low.startswith("entail"):
+            entail = int(idx)
+        elif low.startswith("contra"):
+            contra = int(idx)
+    if entail is None or contra is None:
+        return None
+    return entail, contra
+
+
+def _apply_torch_threads(torch) -> None:
+    global _torch_threads_applied
+    if _torch_threads_applied:
+        return
+    threads = Config.ZERO_SHOT_TORCH_THREADS or 0
+    if threads > 0:
+        torch.set_num_threads(threads)
+    _torch_threads_applied = True
+
+
+def _batched_zero_shot(jobs: List[tuple]) -> List[Dict[str, float]]:
+    """Score (premise, labels) jobs via the shared model server when enabled, else in-process."""
+    if _use_model_server():
+        from app.services import model_server
+        try:
+            return model_server.remote_zero_shot(jobs)
+        except model_server.ModelServerError as exc:
+            if not Config.MODEL_SERVER_FALLBACK:
+                raise
+            print(f"[document_classifier] Model server unavailable, running in-process: {exc}")
+    return local_batched_zero_shot(jobs)
+
+
+def local_batched_zero_shot(jobs: List[tuple]) -> List[Dict[str, float]]:
+    """
+    Score several (premise, labels) jobs in shared batches.
+
+    Each premise is tokenized once and its token IDs are reused for every
+    hypothesis in its label set. All premise/hypothesis pairs from all jobs are
+    then length-sorted and run through the NLI model in ZERO_SHOT_BATCH_SIZE
+    batches. Scores match the pipeline's multi_label=True output: a softmax
+    over (contradiction, entailment) per pair. Returns one {label: score} dict
+    per job.
+    """
+    pipe = get_zero_shot()
+    if pipe is None:
+        raise RuntimeError("zero-shot model unavailable")
+    import torch
+
+    _apply_torch_threads(torch)
+    model, tokenizer = pipe.model, pipe.tokenizer
+    ids = _entail_contra_ids(model)
+    if ids is None:
+        raise RuntimeError("model has no entailment/contradiction labels")
+    entail_id, contra_id = ids
+    max_len = min(getattr(tokenizer, "model_max_length", 1024) or 1024, 1024)
+
+    hyp_cache: Dict[str, List[int]] = {}
+    pairs = []  # (job_index, label, input_ids)
+    for job_idx, (premise, labels) in enumerate(jobs):
+        premise_ids = tokenizer(premise, add_special_tokens=False)["input_ids"]
+        for label in labels:
+            hyp_ids = hyp_cache.get(label)
+            if hyp_ids is None:
+                hyp_ids = tokenizer(HYPOTHESIS_TEMPLATE.format(label), add_special_tokens=False)["input_ids"]
+                hyp_cache[label] = hyp_ids
+            budget = max_len - len(hyp_ids) - 4  # room for <s> </s></s> ... </s>
+            input_ids = tokenizer.build_inputs_with_special_tokens(premise_ids[:budget], hyp_ids)
+            pairs.append((job_idx, label, input_ids))
+
+    results: List[Dict[str, float]] = [dict() for _ in jobs]
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+    batch_size = max(1, Config.ZERO_SHOT_BATCH_SIZE or 1)
+    order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][2]))
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            batch = [pairs[i] for i in order[start:start + batch_size]]
+            width = max(len(p[2]) for p in batch)
+            input_ids = torch.full((len(batch), width), pad_id, dtype=torch.long)
+            attention = torch.zeros((len(batch), width), dtype=torch.long)
+            for row, (_, _, seq) in enumerate(batch):
+                input_ids[row, :len(seq)] = torch.tensor(seq, dtype=torch.long)
+                attention[row, :len(seq)] = 1
+            logits = model(input_ids=input_ids, attention_mask=attention).logits
+            probs = logits[:, [contra_id, entail_id]].softmax(dim=-1)[:, 1].tolist()
+            for (job_idx, label, _), score in zip(batch, probs):
+                results[job_idx][label] = float(score)
+    return results
+
+
+def _rank_segments(seg_scores: List[Dict[str, float]]) -> List[Dict[str, Any]]:
+    averaged = []
+    for lbl in CLASSIFICATION_LABELS:
+        values = [sc[lbl] for sc in seg_scores if lbl in sc]
+        averaged.append((lbl, sum(values) / len(values) if values else 0.0))
+    averaged.sort(key=lambda x: x[1], reverse=True)
+    return [{"label": l, "score": float(f"{s:.4f}")} for l, s in averaged]
+
+
+def _best_label(scores: Dict[str, float], threshold: float = 0.40) -> Optional[str]:
+    best, best_score = None, 0.0
+    for lab, sc in scores.items():
+        if sc > best_score:
+            best, best_score = lab, sc
+    return best if best_score >= threshold else None
+
+
+def classify_all(text: str) -> Dict[str, Any]:
+    """
+    Classification ranking, category and department for a document from the
+    configured backend: DOCUMENT_CLASSIFIER_BACKEND=local uses the trained
+    local model (falling back to zero-shot until one exists).
+    """
+    if (Config.DOCUMENT_CLASSIFIER_BACKEND or "").lower() == "local":
+        from app.services.local_classifier import get_local_model
+        model = get_local_model()
+        if model is not None:
+            return dict(model.classify_all(text), backend="local")
+    return dict(zero_shot_classify_all(text), backend="zero-shot")
+
+
+def zero_shot_classify_all(text: str) -> Dict[str, Any]:
+    """
+    Run every zero-shot decision for a document in one batched inference step:
+    the classification ranking (averaged over segments) plus the best
+    category and department. Falls back to the per-call/heuristic paths when
+    the model is unavailable.
+    """
+    if not text.strip():
+        return {"classification": [], "category": None, "department": None}
+    segments = segment_text(text)
+    premise = text[:ZERO_SHOT_PREMISE_CHARS]
+    jobs = [(seg[:ZERO_SHOT_PREMISE_CHARS], CLASSIFICATION_LABELS) for seg in segments]
+    jobs.append((premise, CATEGORY_LABELS))
+    jobs.append((premise, DEPARTMENT_LABELS))
+    try:
+        scores = _batched_zero_shot(jobs)
+    except Exception:
+        return {
+            "classification": classify_document(text),
+            "category": zero_shot_best(text, CATEGORY_LABELS),
+            "department": zero_shot_best(text, DEPARTMENT_LABELS),
+        }
+    return {
+        "classification": _rank_segments(scores[:len(segments)]),
+        "category": _best_label(scores[-2]),
+        "department": _best_label(scores[-1]),
+    }
+
 def classify_document(text: str) -> List[Dict[str, Any]]:
-    model = get_zero_shot()
     if not text.strip():
         return []
+    if not zero_shot_available():
+        # No model available -> heuristic
+        return _heuristic_classification(text)
     # Multi-segment scoring: more stable on long docs
     segments = segment_text(text)
-    agg = {lbl: [] for lbl in CLASSIFICATION_LABELS}
-    if model:
-        try:
-            for seg in segments:
-                res = cast(Dict[str, Any], model(seg[:4000], CLASSIFICATION_LABELS, multi_label=True))
-                labels = res.get("labels", [])
-                scores = res.get("scores", [])
-                for lbl, score in zip(labels, scores):
-                    lbl_key = str(lbl)
-                    if lbl_key in agg:
-                        agg[lbl_key].append(float(score))
-        except Exception:
-            # fallback to heuristic alone
-            return _heuristic_classification(text)
-        averaged = [
-            (lbl, sum(v)/len(v) if v else 0.0) for lbl, v in agg.items()
-        ]
-        averaged.sort(key=lambda x: x[1], reverse=True)
-        return [{"label": l, "score": float(f"{s:.4f}")} for l, s in averaged]
-    # No model available -> heuristic
-    return _heuristic_classification(text)
+    try:
+        scores = _batched_zero_shot([(seg[:ZERO_SHOT_PREMISE_CHARS], CLASSIFICATION_LABELS) for seg in segments])
+    except Exception:
+        # fallback to heuristic alone
+        return _heuristic_classification(text)
+    return _rank_segments(scores)
 
 # ------------- FIELD EXTRACTION -------------
 _DEGREE_CLEAN = re.compile(r",?\s*(Ph\.?D\.?|MSc|BS|MBA|MA|BA|BSc)\b", re.IGNORECASE)
@@ -186,10 +350,9 @@ def _clean_author(a: str) -> str:
     return _DEGREE_CLEAN.sub("", a).strip(" ,;-")
 
 def zero_shot_best(text: str, labels: List[str], threshold: float = 0.40) -> Optional[str]:
-    model = get_zero_shot()
     if not text.strip():
         return None
-    if not model:
+    if not zero_shot_available():
         # heuristic: first label whose keyword appears
         tl = text.lower()
         for lab in labels:
@@ -198,19 +361,13 @@ def zero_shot_best(text: str, labels: List[str], threshold: float = 0.40) -> Opt
                 return lab
         return None
     try:
-        res = cast(Dict[str, Any], model(text[:4000], labels, multi_label=True))
-        best = None
-        best_score = 0.0
-        for lab, sc in zip(res.get("labels", []), res.get("scores", [])):
-            if sc > best_score:
-                best, best_score = lab, sc
-        if best_score >= threshold:
-            return best
+        scores = _batched_zero_shot([(text[:ZERO_SHOT_PREMISE_CHARS], labels)])[0]
     except Exception:
         return None
-    return None
+    return _best_label(scores, threshold)
 
-def extract_structured_fields(text: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+def extract_structured_fields(text: str, meta: Dict[str, Any], zero_shot: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """zero_shot: optional classify_all() result, reused instead of new model calls."""
     lines = [l.strip() for l in text.splitlines() if l.strip()]
     pdf_meta = meta.get("pdf_raw_metadata", {})
     title = pdf_meta.get("title") or ""
@@ -253,8 +410,12 @@ def extract_structured_fields(text: str, meta: Dict[str, Any]) -> Dict[str, Any]
             if 1950 <= yi <= CURRENT_YEAR:
                 year = yi
                 break
-    category = zero_shot_best(text, CATEGORY_LABELS) or "N/A"
-    department = zero_shot_best(text, DEPARTMENT_LABELS) or "N/A"
+    if zero_shot is not None:
+        category = zero_shot.get("category") or "N/A"
+        department = zero_shot.get("department") or "N/A"
+    else:
+        category = zero_shot_best(text, CATEGORY_LABELS) or "N/A"
+        department = zero_shot_best(text, DEPARTMENT_LABELS) or "N/A"
     if not author:
         author = "N/A"
     if year is None:
@@ -311,12 +472,18 @@ def record_training_sample(extracted_fields: Dict[str, Any], combined_text: str,
 
 # ------------- MAIN ENTRY -------------
 def analyze_document(path_str: str) -> Dict[str, Any]:
-    meta = extract_metadata(path_str)
-    text = extract_text(path_str)
-    classifications = classify_document(text)
+    if Path(path_str).suffix.lower() == ".pdf":
+        with ParsedPDF(path_str) as doc:
+            meta = extract_metadata(path_str, doc)
+            text = extract_text(path_str, doc=doc)
+    else:
+        meta = extract_metadata(path_str)
+        text = extract_text(path_str)
+    zero_shot = classify_all(text)
+    classifications = zero_shot["classification"]
     pii = detect_pii(text)
     sens = sensitivity_flag(text, pii)
-    fields = extract_structured_fields(text, meta)
+    fields = extract_structured_fields(text, meta, zero_shot)
     fields["Classification"] = classifications[0]["label"] if classifications else None
     if not fields.get("Department"):
         fields["Department"] = "N/A"
@@ -0,0 +1,113 @@
+"""
+Serving stored PDFs with validators, byte ranges and proxy offload.
+
+Every response carries the file's SHA-256 as a strong ETag, so a viewer that
+reopens a document gets a 304 instead of the whole file. Range requests are
+answered with 206 partial content, which lets PDF viewers fetch pages as
+they are shown. Content-addressed blobs never change under their URL and are
+marked immutable for a year. Library files can be replaced under the same
+name, so they are revalidated on each use.
+
+With UPLOAD_SENDFILE set, Flask only checks the validators and leaves the
+bytes (and range handling) to the front proxy:
+
+- "x-accel-redirect" (nginx): answers with X-Accel-Redirect pointing at
+  UPLOAD_ACCEL_PREFIX + the path below UPLOAD_FOLDER. The prefix must be an
+  `internal` location aliased to UPLOAD_FOLDER.
+- "x-sendfile" (Apache mod_xsendfile, lighttpd): answers with the absolute path.
+"""
+from __future__ import annotations
+
+import os
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from flask import Response, request, send_file
+
+from app.config import Config
+from app.services.uploads import hash_file
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+_ETAG_CACHE_SIZE = 2048
+
+_etag_cache: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+_etag_lock = Lock()
+
+
+def _catalog_sha256(path: str, size: int, mtime: int) -> Optional[str]:
+    # Library files were hashed when they were uploaded or scanned.
+    if os.path.dirname(os.path.abspath(path)) != os.path.abspath(Config.UPLOAD_FOLDER):
+        return None
+    try:
+        from app.services.upload_catalog import catalog_entry
+        row = catalog_entry(os.path.basename(path))
+    except Exception:
+        return None
+    if row and row["SHA256"] and int(row["SizeBytes"]) == size and int(row["MTime"]) == mtime:
+        return row["SHA256"]
+    return None
+
+
+def content_etag(path: str, stat: Optional[os.stat_result] = None) -> str:
+    """SHA-256 of the file, remembered per (path, size, mtime) so it is computed once."""
+    stat = stat or os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    with _etag_lock:
+        cached = _etag_cache.get(key)
+        if cached:
+            _etag_cache.move_to_end(key)
+            return cached
+    sha256 = _catalog_sha256(path, stat.st_size, int(stat.st_mtime)) or hash_file(path)
+    with _etag_lock:
+        _etag_cache[key] = sha256
+        while len(_etag_cache) > _ETAG_CACHE_SIZE:
+            _etag_cache.popitem(last=False)
+    return sha256
+
+
+def _proxy_location(path: str, mode: str) -> Optional[str]:
+    if mode == "x-sendfile":
+        return os.path.abspath(path)
+    rel = os.path.relpath(os.path.abspath(path), os.path.abspath(Config.UPLOAD_FOLDER))
+    if rel.startswith(".."):
+        return None
+    return Config.UPLOAD_ACCEL_PREFIX.rstrip("/") + "/" + quote(rel.replace(os.sep, "/"))
+
+
+def send_pdf(path: str, download_name: str, etag: Optional[str] = None, immutable: bool = False) -> Response:
+    """
+    Send a stored PDF inline. `etag` is the known content hash (blobs carry it
+    in their name); otherwise it is looked up or computed.
+    """
+    stat = os.stat(path)
+    etag = etag or content_etag(path, stat)
+    max_age = IMMUTABLE_MAX_AGE if immutable else None
+    mode = (Config.UPLOAD_SENDFILE or "").strip().lower()
+    location = _proxy_location(path, mode) if mode in ("x-accel-redirect", "x-sendfile") else None
+
+    if location is None:
+        rv = send_file(
+            path, mimetype="application/pdf", as_attachment=False, download_name=download_name,
+            conditional=True, etag=etag, max_age=max_age, last_modified=stat.st_mtime,
+        )
+    else:
+        rv = Response(mimetype="application/pdf")
+        rv.headers.set("Content-Disposition", "inline", filename=download_name)
+        rv.set_etag(etag)
+        rv.last_modified = stat.st_mtime
+        if max_age:
+            rv.cache_control.public = True
+            rv.cache_control.max_age = max_age
+        else:
+            rv.cache_control.no_cache = True
+        # Only the validators are checked here; the proxy serves ranges.
+        rv = rv.make_conditional(request)
+        if rv.status_code != 304:
+            rv.headers["X-Accel-Redirect" if mode == "x-accel-redirect" else "X-Sendfile"] = location
+        rv.headers.pop("Content-Length", None)
+
+    if immutable:
+        rv.cache_control.immutable = True
+    return rv
@@ -0,0 +1,299 @@
+"""
+Local document classifier trained from the recorded analysis samples.
+
+record_training_sample() appends every analyzed document (text plus the
+fields the pipeline chose) to _training_data/document_samples.jsonl. This
+module trains a TF-IDF weighted multinomial Naive Bayes model per field
+(Classification, Category, Department) from that file. It is plain Python,
+so it loads in milliseconds, needs a few MB of RAM and has no torch
+dependency. Select it with DOCUMENT_CLASSIFIER_BACKEND=local.
+
+Samples whose labels came from this model (metadata.classifier_backend ==
+"local") are left out of training and evaluation, so the model never learns
+from its own output. Below LOCAL_CLASSIFIER_MIN_CONFIDENCE, or on text with no
+known terms, it returns no label and the pipeline falls back to heuristics.
+
+    python -m app.services.local_classifier train
+    python -m app.services.local_classifier eval [--compare-zero-shot]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config import Config
+
+_DATA_DIR = Path(__file__).resolve().parent / "_training_data"
+SAMPLES_FILE = _DATA_DIR / "document_samples.jsonl"
+MODEL_FILE = _DATA_DIR / "local_classifier.json"
+
+TARGET_FIELDS = ("Classification", "Category", "Department")
+MODEL_FORMAT = 1
+MAX_FEATURES = 20000
+MIN_DF = 2
+_TOKEN_RE = re.compile(r"[a-z][a-z0-9]{2,}")
+_SKIP_LABELS = {"", "n/a", "na", "none"}
+BACKEND_NAME = "local"
+
+_model: Optional["LocalClassifier"] = None
+_model_mtime: Optional[float] = None
+_model_lock = threading.Lock()
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+class LocalClassifier:
+    def __init__(self, vocab: Dict[str, int], idf: List[float], fields: Dict[str, Dict[str, Any]]):
+        self.vocab = vocab
+        self.idf = idf
+        self.fields = fields
+
+    # ---- training ----
+    @classmethod
+    def train(cls, samples: List[Dict[str, Any]]) -> "LocalClassifier":
+        docs = [Counter(tokenize(s["text"])) for s in samples]
+        df: Counter = Counter()
+        for counts in docs:
+            df.update(counts.keys())
+        kept = [t for t, n in df.most_common() if n >= MIN_DF][:MAX_FEATURES]
+        vocab = {t: i for i, t in enumerate(sorted(kept))}
+        n_docs = max(1, len(docs))
+        idf = [0.0] * len(vocab)
+        for term, idx in vocab.items():
+            idf[idx] = math.log((1 + n_docs) / (1 + df[term])) + 1.0
+        model = cls(vocab, idf, {})
+        vectors = [model._vectorize(counts) for counts in docs]
+
+        for field in TARGET_FIELDS:
+            label_weights: Dict[str, Dict[int, float]] = defaultdict(lambda: defaultdict(float))
+            label_docs: Counter = Counter()
+            for sample, vec in zip(samples, vectors):
+                label = _label(sample, field)
+                if label is None:
+                    continue
+                label_docs[label] += 1
+                bucket = label_weights[label]
+                for idx, w in vec.items():
+                    bucket[idx] += w
+            if len(label_docs) < 2:
+                continue
+            total_docs = sum(label_docs.values())
+            alpha = 0.1
+            labels = {}
+            for label, weights in label_weights.items():
+                total = sum(weights.values()) + alpha * len(vocab)
+                labels[label] = {
+                    "prior": math.log(label_docs[label] / total_docs),
+                    "default": math.log(alpha / total),
+                    "log_probs": {str(i): math.log((w + alpha) / total) for i, w in weights.items()},
+                }
+            model.fields[field] = {"labels": labels, "samples": total_docs}
+        return model
+
+    def _vectorize(self, counts: Counter) -> Dict[int, float]:
+        vec: Dict[int, float] = {}
+        for term, tf in counts.items():
+            idx = self.vocab.get(term)
+            if idx is not None:
+                vec[idx] = (1.0 + math.log(tf)) * self.idf[idx]
+        norm = math.sqrt(sum(w * w for w in vec.values())) or 1.0
+        return {i: w / norm for i, w in vec.items()}
+
+    # ---- inference ----
+    def rank(self, text: str, field: str) -> List[Dict[str, Any]]:
+        spec = self.fields.get(field)
+        if not spec:
+            return []
+        vec = self._vectorize(Counter(tokenize(text)))
+        if not vec:
+            # Nothing it has seen before: the priors alone are not evidence.
+            return []
+        scores = {}
+        for label, params in spec["labels"].items():
+            log_probs = params["log_probs"]
+            default = params["default"]
+            scores[label] = params["prior"] + sum(w * log_probs.get(str(i), default) for i, w in vec.items())
+        top = max(scores.values())
+        exp = {label: math.exp(s - top) for label, s in scores.items()}
+        z = sum(exp.values()) or 1.0
+        ranked = sorted(((label, e / z) for label, e in exp.items()), key=lambda x: x[1], reverse=True)
+        return [{"label": label, "score": float(f"{p:.4f}")} for label, p in ranked]
+
+    def classify_all(self, text: str) -> Dict[str, Any]:
+        """Same shape as document_classifier.classify_all()."""
+        if not (text or "").strip():
+            return {"classification": [], "category": None, "department": None}
+        floor = Config.LOCAL_CLASSIFIER_MIN_CONFIDENCE
+        classification = self.rank(text, "Classification")
+        if classification and classification[0]["score"] < floor:
+            classification = []
+        category = self.rank(text, "Category")
+        department = self.rank(text, "Department")
+        return {
+            "classification": classification,
+            "category": category[0]["label"] if category and category[0]["score"] >= floor else None,
+            "department": department[0]["label"] if department and department[0]["score"] >= floor else None,
+        }
+
+    # ---- persistence ----
+    def to_dict(self) -> Dict[str, Any]:
+        return {"format": MODEL_FORMAT, "vocab": self.vocab, "idf": self.idf, "fields": self.fields}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LocalClassifier":
+        if data.get("format") != MODEL_FORMAT:
+            raise ValueError(f"unsupported model format {data.get('format')}")
+        return cls(data["vocab"], data["idf"], data["fields"])
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.to_dict()), encoding="utf-8")
+        tmp.replace(path)
+
+
+def _label(sample: Dict[str, Any], field: str) -> Optional[str]:
+    value = (sample.get("fields") or {}).get(field)
+    if value is None:
+        return None
+    value = str(value).strip()
+    return None if value.lower() in _SKIP_LABELS else value
+
+
+def self_labelled(sample: Dict[str, Any]) -> bool:
+    return (sample.get("metadata") or {}).get("classifier_backend") == BACKEND_NAME
+
+
+def load_samples(path: Path = SAMPLES_FILE) -> List[Dict[str, Any]]:
+    """Recorded samples, minus those labelled by this model."""
+    samples = []
+    if not path.exists():
+        return samples
+    with path.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                sample = json.loads(line)
+            except ValueError:
+                continue
+            if sample.get("text") and not self_labelled(sample):
+                samples.append(sample)
+    return samples
+
+
+def get_local_model() -> Optional[LocalClassifier]:
+    """Load (or reload after retraining) the saved model; None if not trained yet."""
+    global _model, _model_mtime
+    try:
+        mtime = MODEL_FILE.stat().st_mtime
+    except OSError:
+        return None
+    if _model is not None and mtime == _model_mtime:
+        return _model
+    with _model_lock:
+        if _model is None or mtime != _model_mtime:
+            try:
+                _model = LocalClassifier.from_dict(json.loads(MODEL_FILE.read_text(encoding="utf-8")))
+                _model_mtime = mtime
+            except (OSError, ValueError, KeyError) as exc:
+                print(f"[local_classifier] Could not load model: {exc}")
+                return None
+    return _model
+
+
+# ---------------- CLI ----------------
+
+def _split(samples: List[Dict[str, Any]], holdout: float, seed: int) -> Tuple[list, list]:
+    shuffled = list(samples)
+    random.Random(seed).shuffle(shuffled)
+    cut = max(1, int(len(shuffled) * (1 - holdout)))
+    return shuffled[:cut], shuffled[cut:]
+
+
+def _same(a: Optional[str], b: Optional[str]) -> bool:
+    # Recorded labels use the normalized singular names ("Historical File")
+    # while the zero-shot labels are plural; compare loosely.
+    norm = lambda v: (v or "").strip().lower().rstrip("s")
+    return norm(a) == norm(b)
+
+
+def _evaluate(name: str, predict, test: List[Dict[str, Any]]) -> Dict[str, Any]:
+    hits: Counter = Counter()
+    totals: Counter = Counter()
+    started = time.perf_counter()
+    for sample in test:
+        out = predict(sample["text"])
+        predicted = {
+            "Classification": out["classification"][0]["label"] if out.get("classification") else None,
+            "Category": out.get("category"),
+            "Department": out.get("department"),
+        }
+        for field in TARGET_FIELDS:
+            expected = _label(sample, field)
+            if expected is None:
+                continue
+            totals[field] += 1
+            hits[field] += int(_same(predicted[field], expected))
+    elapsed = time.perf_counter() - started
+    report = {"backend": name, "documents": len(test), "ms_per_doc": round(1000 * elapsed / max(1, len(test)), 2)}
+    for field in TARGET_FIELDS:
+        report[field] = round(hits[field] / totals[field], 4) if totals[field] else None
+    return report
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.services.local_classifier")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for cmd in ("train", "eval"):
+        p = sub.add_parser(cmd)
+        p.add_argument("--samples", type=Path, default=SAMPLES_FILE)
+        p.add_argument("--holdout", type=float, default=0.2, help="fraction held out for eval")
+        p.add_argument("--seed", type=int, default=13)
+    sub.choices["train"].add_argument("--out", type=Path, default=MODEL_FILE)
+    sub.choices["train"].add_argument("--min-samples", type=int, default=20)
+    sub.choices["eval"].add_argument("--compare-zero-shot", action="store_true",
+                                     help="also time and score the BART zero-shot backend")
+    args = parser.parse_args(list(argv) if argv is not None else None)
+
+    samples = load_samples(args.samples)
+    if args.command == "train":
+        if len(samples) < args.min_samples:
+            print(f"Only {len(samples)} samples in {args.samples}; need at least {args.min_samples}.")
+            return 1
+        started = time.perf_counter()
+        model = LocalClassifier.train(samples)
+        model.save(args.out)
+        print(f"Trained on {len(samples)} samples in {time.perf_counter() - started:.2f}s "
+              f"({len(model.vocab)} terms, fields: {', '.join(model.fields) or 'none'}) -> {args.out}")
+        return 0
+
+    train, test = _split(samples, args.holdout, args.seed)
+    if not test:
+        print("Not enough samples to hold any out.")
+        return 1
+    model = LocalClassifier.train(train)
+    reports = [_evaluate("local", model.classify_all, test)]
+    if args.compare_zero_shot:
+        from app.services import document_classifier
+        if not document_classifier.zero_shot_available():
+            print("Zero-shot model unavailable; skipping comparison.")
+        else:
+            reports.append(_evaluate("zero-shot", document_classifier.zero_shot_classify_all, test))
+    print(f"Train {len(train)} / test {len(test)} samples")
+    for report in reports:
+        print(json.dumps(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,300 @@
+"""
+Failed-login tracking and account lockout.
+
+Failures are counted per key (the lower-cased username) over a sliding
+LOGIN_LOCKOUT_WINDOW_MINUTES window. LOGIN_LOCKOUT_ATTEMPTS failures inside
+the window lock the key for LOGIN_LOCKOUT_MINUTES. Every operation touches a
+single key, so checks cost the same however many keys are tracked.
+
+Two backends, chosen with LOGIN_LOCKOUT_BACKEND:
+
+- "database" (default): the LoginLockouts table, shared by every gunicorn
+  worker and host, so lockout cannot be dodged by landing on another worker.
+  Expired rows are removed by the scheduled login_lockout_sweep job.
+- "memory": a per-process LRU of at most LOGIN_LOCKOUT_MAX_KEYS entries with
+  a background sweeper thread. Suitable for a single worker or development.
+
+If the database backend cannot be reached the process falls back to memory
+rather than refusing every login.
+"""
+from __future__ import annotations
+
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from threading import Event, Lock, Thread
+from typing import Deque, Optional, Tuple
+
+from app.config import Config
+from app.db import get_db_connection
+
+LOGIN_LOCKOUTS_DDL = """
+CREATE TABLE IF NOT EXISTS LoginLockouts (
+    LockKey VARCHAR(191) NOT NULL PRIMARY KEY,
+    Failures TEXT NOT NULL,
+    LockedUntil DOUBLE DEFAULT NULL,
+    ExpiresAt DOUBLE NOT NULL,
+    INDEX idx_loginlockouts_expires (ExpiresAt)
+)
+"""
+
+_SWEEP_INTERVAL_SECONDS = 60
+
+
+def attempt_limit() -> int:
+    return max(1, Config.LOGIN_LOCKOUT_ATTEMPTS)
+
+
+def lock_seconds() -> int:
+    return max(1, Config.LOGIN_LOCKOUT_MINUTES) * 60
+
+
+def window_seconds() -> int:
+    return max(1, Config.LOGIN_LOCKOUT_WINDOW_MINUTES) * 60
+
+
+def _apply_failure(failures: Deque[float], locked_until: Optional[float], now: float) -> Tuple[int, Optional[float]]:
+    """Shared sliding-window rule. Mutates `failures`; returns (count, locked_until)."""
+    if locked_until is not None and locked_until <= now:
+        # A served lock starts the count afresh.
+        failures.clear()
+        locked_until = None
+    cutoff = now - window_seconds()
+    while failures and failures[0] <= cutoff:
+        failures.popleft()
+    failures.append(now)
+    if len(failures) >= attempt_limit():
+        locked_until = now + lock_seconds()
+    return len(failures), locked_until
+
+
+class LockoutStore:
+    def locked_until(self, key: str, now: float) -> Optional[float]:
+        """End of the active lock on `key`, or None."""
+        raise NotImplementedError
+
+    def record_failure(self, key: str, now: float) -> Tuple[int, Optional[float]]:
+        """Count a failure. Returns (failures in window, lock end or None)."""
+        raise NotImplementedError
+
+    def clear(self, key: str) -> None:
+        raise NotImplementedError
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop expired entries. Returns how many were removed."""
+        raise NotImplementedError
+
+
+class _Entry:
+    __slots__ = ("failures", "locked_until")
+
+    def __init__(self):
+        self.failures: Deque[float] = deque(maxlen=attempt_limit())
+        self.locked_until: Optional[float] = None
+
+    def expires_at(self) -> float:
+        last = self.failures[-1] + window_seconds() if self.failures else 0.0
+        return max(last, self.locked_until or 0.0)
+
+
+class MemoryLockoutStore(LockoutStore):
+    def __init__(self, max_keys: int):
+        self.max_keys = max(1, max_keys)
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = Lock()
+        self._stop = Event()
+        self._sweeper: Optional[Thread] = None
+
+    def _start_sweeper(self) -> None:
+        if self._sweeper is None:
+            self._sweeper = Thread(target=self._sweep_loop, name="login-lockout-sweep", daemon=True)
+            self._sweeper.start()
+
+    def _sweep_loop(self) -> None:
+        while not self._stop.wait(_SWEEP_INTERVAL_SECONDS):
+            self.sweep()
+
+    def locked_until(self, key: str, now: float) -> Optional[float]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.locked_until is None or entry.locked_until <= now:
+                return None
+            return entry.locked_until
+
+    def record_failure(self, key: str, now: float) -> Tuple[int, Optional[float]]:
+        with self._lock:
+            self._start_sweeper()
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+                # Fixed ceiling: the least recently failed key goes first.
+                while len(self._entries) > self.max_keys:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+            count, entry.locked_until = _apply_failure(entry.failures, entry.locked_until, now)
+            return count, entry.locked_until
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if entry.expires_at() <= now]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+
+class DatabaseLockoutStore(LockoutStore):
+    """One primary-key row per key; the failure timestamps are a short CSV."""
+
+    def __init__(self):
+        self._table_ready = False
+
+    def ensure_table(self) -> None:
+        if self._table_ready:
+            return
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(LOGIN_LOCKOUTS_DDL)
+            self._table_ready = True
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _cursor(self):
+        self.ensure_table()
+        conn = get_db_connection()
+        return conn, conn.cursor()
+
+    def locked_until(self, key: str, now: float) -> Optional[float]:
+        conn, cursor = self._cursor()
+        try:
+            cursor.execute("SELECT LockedUntil FROM LoginLockouts WHERE LockKey=%s", (key,))
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+            conn.close()
+        if not row or row[0] is None or row[0] <= now:
+            return None
+        return float(row[0])
+
+    def record_failure(self, key: str, now: float) -> Tuple[int, Optional[float]]:
+        conn, cursor = self._cursor()
+        try:
+            cursor.execute(
+                "INSERT IGNORE INTO LoginLockouts (LockKey, Failures, ExpiresAt) VALUES (%s, '', %s)",
+                (key, now),
+            )
+            # The row lock serializes concurrent failures for the same key.
+            cursor.execute(
+                "SELECT Failures, LockedUntil FROM LoginLockouts WHERE LockKey=%s FOR UPDATE", (key,)
+            )
+            row = cursor.fetchone()
+            failures = deque(
+                (float(part) for part in (row[0] or "").split(",") if part), maxlen=attempt_limit()
+            )
+            count, locked_until = _apply_failure(failures, row[1], now)
+            expires_at = max(now + window_seconds(), locked_until or 0.0)
+            cursor.execute(
+                "UPDATE LoginLockouts SET Failures=%s, LockedUntil=%s, ExpiresAt=%s WHERE LockKey=%s",
+                (",".join(f"{stamp:.3f}" for stamp in failures), locked_until, expires_at, key),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+        return count, locked_until
+
+    def clear(self, key: str) -> None:
+        conn, cursor = self._cursor()
+        try:
+            cursor.execute("DELETE FROM LoginLockouts WHERE LockKey=%s", (key,))
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        conn, cursor = self._cursor()
+        try:
+            cursor.execute("DELETE FROM LoginLockouts WHERE ExpiresAt <= %s", (now,))
+            removed = cursor.rowcount or 0
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+        return removed
+
+
+_store: Optional[LockoutStore] = None
+_fallback: Optional[MemoryLockoutStore] = None
+_store_lock = Lock()
+
+
+def get_store() -> LockoutStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = (Config.LOGIN_LOCKOUT_BACKEND or "database").strip().lower()
+                if backend == "memory":
+                    _store = MemoryLockoutStore(Config.LOGIN_LOCKOUT_MAX_KEYS)
+                else:
+                    _store = DatabaseLockoutStore()
+    return _store
+
+
+def _fallback_store() -> MemoryLockoutStore:
+    global _fallback
+    if _fallback is None:
+        with _store_lock:
+            if _fallback is None:
+                _fallback = MemoryLockoutStore(Config.LOGIN_LOCKOUT_MAX_KEYS)
+    return _fallback
+
+
+def _call(method: str, *args):
+    store = get_store()
+    try:
+        return getattr(store, method)(*args)
+    except Exception as exc:
+        if isinstance(store, MemoryLockoutStore):
+            raise
+        print(f"[login_lockout] {method} fell back to memory: {exc}")
+        return getattr(_fallback_store(), method)(*args)
+
+
+def _as_datetime(stamp: Optional[float]) -> Optional[datetime]:
+    return datetime.fromtimestamp(stamp, tz=timezone.utc) if stamp is not None else None
+
+
+def locked_until(key: str) -> Optional[datetime]:
+    return _as_datetime(_call("locked_until", key, time.time()))
+
+
+def record_failure(key: str) -> Tuple[int, Optional[datetime]]:
+    count, until = _call("record_failure", key, time.time())
+    return count, _as_datetime(until)
+
+
+def clear(key: str) -> None:
+    _call("clear", key)
+
+
+def sweep() -> int:
+    """Scheduled job for the shared backend; the memory backend sweeps itself."""
+    removed = get_store().sweep()
+    if _fallback is not None:
+        removed += _fallback.sweep()
+    if removed:
+        print(f"[login_lockout] Swept {removed} expired lockout entries")
+    return removed
@@ -0,0 +1,320 @@
+"""
+Shared zero-shot model server.
+
+BART-MNLI costs about 1.6 GB per process. With MODEL_SERVER_ENABLED, web
+workers do not load it themselves. They send (premise, labels) jobs to a
+single local subprocess that loads the model once. The server gathers
+requests that arrive within MODEL_SERVER_BATCH_WINDOW_MS and runs them as a
+single batched inference. Memory therefore stays flat as web workers are
+added.
+
+The first worker that needs the server starts it with
+`python -m app.services.model_server`. Binding the port is what makes it a
+singleton: a second copy fails to bind and exits before loading anything.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import Config
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Set in the server process so document_classifier runs inference locally.
+IN_SERVER = False
+
+_SERVER_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_START_TIMEOUT = 15.0
+_AVAILABLE_TTL = 30.0
+
+_local = threading.local()
+_spawn_lock = threading.Lock()
+_available: Tuple[float, bool] = (0.0, False)
+
+
+class ModelServerError(RuntimeError):
+    """The model server could not be reached or failed the request."""
+
+
+def _address() -> Tuple[str, int]:
+    return ("127.0.0.1", Config.MODEL_SERVER_PORT)
+
+
+def _authkey() -> bytes:
+    if Config.MODEL_SERVER_AUTHKEY:
+        return Config.MODEL_SERVER_AUTHKEY.encode("utf-8")
+    # Both sides read the same .env, so the DB credentials make a shared secret.
+    db = Config.DB_CONFIG
+    return hashlib.sha256(f"kcls-model-server:{db.get('user')}:{db.get('password')}".encode("utf-8")).digest()
+
+
+def rss_bytes(pid: Optional[int] = None) -> Optional[int]:
+    if psutil is None:
+        return None
+    try:
+        return psutil.Process(pid or os.getpid()).memory_info().rss
+    except Exception:
+        return None
+
+
+# ---------------- client side ----------------
+
+def _connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        try:
+            conn = Client(_address(), authkey=_authkey())
+        except (OSError, EOFError) as exc:
+            raise ModelServerError(f"connect failed: {exc}") from exc
+        _local.conn = conn
+    return conn
+
+
+def _drop_connection() -> None:
+    conn = getattr(_local, "conn", None)
+    _local.conn = None
+    if conn is not None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def _call(message: Tuple[Any, ...], timeout: float) -> Any:
+    conn = _connection()
+    try:
+        conn.send(message)
+        if not conn.poll(timeout):
+            raise ModelServerError("timed out waiting for the model server")
+        status, payload = conn.recv()
+    except ModelServerError:
+        _drop_connection()
+        raise
+    except (OSError, EOFError) as exc:
+        _drop_connection()
+        raise ModelServerError(f"connection lost: {exc}") from exc
+    if status != "ok":
+        raise ModelServerError(str(payload))
+    return payload
+
+
+def ensure_server() -> bool:
+    """Start the model server if nothing is listening yet; True once it answers."""
+    try:
+        _call(("ping",), timeout=5)
+        return True
+    except ModelServerError:
+        pass
+    with _spawn_lock:
+        try:
+            _call(("ping",), timeout=5)
+            return True
+        except ModelServerError:
+            pass
+        kwargs: Dict[str, Any] = {"cwd": _SERVER_DIR}
+        if os.name == "posix":
+            kwargs["start_new_session"] = True
+        subprocess.Popen([sys.executable, "-m", "app.services.model_server"], **kwargs)
+        deadline = time.monotonic() + _START_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(0.25)
+            try:
+                _call(("ping",), timeout=5)
+                return True
+            except ModelServerError:
+                continue
+    return False
+
+
+def server_available() -> bool:
+    """Cached check whether the server has (or can load) the model."""
+    global _available
+    checked_at, ok = _available
+    if time.monotonic() - checked_at < _AVAILABLE_TTL:
+        return ok
+    try:
+        ok = bool(ensure_server() and _call(("available",), timeout=Config.MODEL_SERVER_TIMEOUT))
+    except ModelServerError:
+        ok = False
+    _available = (time.monotonic(), ok)
+    return ok
+
+
+def remote_zero_shot(jobs: List[tuple]) -> List[Dict[str, float]]:
+    try:
+        return _call(("zero_shot", jobs), timeout=Config.MODEL_SERVER_TIMEOUT)
+    except ModelServerError:
+        if not ensure_server():
+            raise
+    return _call(("zero_shot", jobs), timeout=Config.MODEL_SERVER_TIMEOUT)
+
+
+def server_metrics() -> Optional[Dict[str, Any]]:
+    try:
+        return _call(("metrics",), timeout=5)
+    except ModelServerError:
+        return None
+
+
+# ---------------- server side ----------------
+
+class _Pending:
+    __slots__ = ("jobs", "result", "error", "done")
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class _Server:
+    def __init__(self):
+        self.requests: "queue.Queue[_Pending]" = queue.Queue()
+        self.started_at = time.time()
+        self.load_seconds: Optional[float] = None
+        self.available: Optional[bool] = None
+        self.request_count = 0
+        self.batch_count = 0
+        self.job_count = 0
+        self.inference_seconds = 0.0
+        self._load_lock = threading.Lock()
+
+    def ensure_model(self) -> bool:
+        from app.services import document_classifier
+        with self._load_lock:
+            if self.available is None:
+                self.available = document_classifier.get_zero_shot() is not None
+                self.load_seconds = document_classifier.zero_shot_load_seconds()
+        return self.available
+
+    def batch_loop(self) -> None:
+        from app.services import document_classifier
+        window = max(0, Config.MODEL_SERVER_BATCH_WINDOW_MS) / 1000.0
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.monotonic() + window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            jobs = [job for pending in batch for job in pending.jobs]
+            started = time.monotonic()
+            try:
+                if not self.ensure_model():
+                    raise RuntimeError("zero-shot model unavailable")
+                scores = document_classifier.local_batched_zero_shot(jobs)
+                offset = 0
+                for pending in batch:
+                    pending.result = scores[offset:offset + len(pending.jobs)]
+                    offset += len(pending.jobs)
+            except Exception as exc:
+                for pending in batch:
+                    pending.error = str(exc)
+            self.inference_seconds += time.monotonic() - started
+            self.batch_count += 1
+            self.job_count += len(jobs)
+            for pending in batch:
+                pending.done.set()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "model_loaded": bool(self.available),
+            "load_seconds": self.load_seconds,
+            "rss_bytes": rss_bytes(),
+            "requests": self.request_count,
+            "batches": self.batch_count,
+            "jobs": self.job_count,
+            "avg_requests_per_batch": round(self.request_count / self.batch_count, 2) if self.batch_count else None,
+            "inference_seconds": round(self.inference_seconds, 2),
+        }
+
+    def handle(self, conn) -> None:
+        try:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                kind = message[0] if message else None
+                if kind == "ping":
+                    conn.send(("ok", "pong"))
+                elif kind == "available":
+                    conn.send(("ok", self.ensure_model()))
+                elif kind == "metrics":
+                    conn.send(("ok", self.metrics()))
+                elif kind == "zero_shot":
+                    self.request_count += 1
+                    pending = _Pending(list(message[1]))
+                    self.requests.put(pending)
+                    pending.done.wait()
+                    if pending.error is not None:
+                        conn.send(("error", pending.error))
+                    else:
+                        conn.send(("ok", pending.result))
+                else:
+                    conn.send(("error", f"unknown request {kind!r}"))
+        finally:
+            conn.close()
+
+
+def serve() -> int:
+    global IN_SERVER
+    IN_SERVER = True
+    try:
+        listener = Listener(_address(), authkey=_authkey())
+    except OSError as exc:
+        # Another server already owns the port.
+        print(f"[model_server] Not starting: {exc}")
+        return 0
+    server = _Server()
+    print(f"[model_server] Listening on {_address()[0]}:{_address()[1]} (pid {os.getpid()})")
+    threading.Thread(target=server.batch_loop, name="model-batcher", daemon=True).start()
+    threading.Thread(target=server.ensure_model, name="model-loader", daemon=True).start()
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception as exc:  # bad authkey, aborted handshake
+            print(f"[model_server] Rejected connection: {exc}")
+            continue
+        threading.Thread(target=server.handle, args=(conn,), daemon=True).start()
+
+
+def collect_metrics() -> Dict[str, Any]:
+    """Model metrics for this web worker plus, when enabled, the shared server."""
+    from app.services import document_classifier
+    return {
+        "backend": Config.DOCUMENT_CLASSIFIER_BACKEND,
+        "mode": "server" if Config.MODEL_SERVER_ENABLED else "in-process",
+        "worker": {
+            "pid": os.getpid(),
+            "rss_bytes": rss_bytes(),
+            "model_loaded": document_classifier.zero_shot_load_seconds() is not None,
+            "load_seconds": document_classifier.zero_shot_load_seconds(),
+        },
+        "server": server_metrics() if Config.MODEL_SERVER_ENABLED else None,
+    }
+
+
+if __name__ == "__main__":
+    # Run through the package module so IN_SERVER is set where
+    # document_classifier looks for it.
+    from app.services import model_server as _module
+    sys.exit(_module.serve())
@@ -1,5 +1,5 @@
 from typing import Iterable, Optional, List, Any, Dict
-from app.services.audit import log_event  # NEW
+from app.services.audit import log_event, log_many  # NEW
 from app.services.mailer import (
     send_account_approved_email,
     send_account_rejected_email,
@@ -72,6 +72,47 @@ def create_notification(
     """, [(notif_id, uid) for uid in recips])
     return notif_id
 
+def create_notifications_bulk(
+    cursor,
+    type_code: str,
+    entries: Iterable[Dict[str, Any]],
+    title: Optional[str] = None,
+    related_type: Optional[str] = None,
+) -> Dict[str, int]:
+    """
+    Insert many notifications of one type with a single multi-row INSERT and
+    a single recipients INSERT. Each entry is a dict with 'message',
+    'related_id', 'recipients' and optionally 'sender_user_id'.
+    Returns {'notifications': n, 'recipients': m}.
+    """
+    rows = []
+    for e in entries:
+        recips = sorted({int(r) for r in (e.get('recipients') or []) if r is not None})
+        if recips and e.get('message'):
+            rows.append((e, recips))
+    if not rows or not type_code or not ensure_type_exists(cursor, type_code):
+        return {'notifications': 0, 'recipients': 0}
+
+    values = ','.join(['(%s, %s, %s, %s, %s, %s)'] * len(rows))
+    params: List[Any] = []
+    for e, _ in rows:
+        params.extend((type_code, title, e['message'], e.get('sender_user_id'), related_type, e.get('related_id')))
+    # MariaDB returns the generated IDs in VALUES order.
+    cursor.execute(f"""
+        INSERT INTO Notifications (Type, Title, Message, SenderUserID, RelatedType, RelatedID)
+        VALUES {values}
+        RETURNING NotificationID
+    """, tuple(params))
+    ids = [r['NotificationID'] if isinstance(r, dict) else r[0] for r in cursor.fetchall() or []]
+
+    pairs = [(nid, uid) for nid, (_, recips) in zip(ids, rows) for uid in recips]
+    if pairs:
+        cursor.executemany("""
+            INSERT IGNORE INTO Notification_Recipients (NotificationID, RecipientUserID)
+            VALUES (%s, %s)
+        """, pairs)
+    return {'notifications': len(ids), 'recipients': len(pairs)}
+
 # High-level emitters (optional helpers)
 
 def notify_submit(cursor, borrow_id: int, route: str, sender_user_id: Optional[int] = None):
@@ -182,6 +223,41 @@ def notify_return_recorded(cursor, borrow_id: int, sender_user_id: Optional[int]
             title='Return Recorded'
         )
 
+def notify_return_recorded_batch(cursor, borrow_ids: Iterable[int], sender_user_id: Optional[int] = None) -> Dict[str, int]:
+    """Bulk variant of notify_return_recorded for many borrows at once."""
+    ids = sorted({int(b) for b in borrow_ids if b is not None})
+    if not ids:
+        return {'notifications': 0, 'recipients': 0}
+    fmt = ','.join(['%s'] * len(ids))
+    cursor.execute(f"""
+        SELECT t.BorrowID, b.UserID,
+               EXISTS (SELECT 1 FROM BorrowedItems bi
+                       WHERE bi.BorrowID = t.BorrowID AND bi.ItemType = 'Document') AS HasDocument
+        FROM BorrowTransactions t
+        LEFT JOIN Borrowers b ON b.BorrowerID = t.BorrowerID
+        WHERE t.BorrowID IN ({fmt})
+    """, tuple(ids))
+    rows = cursor.fetchall() or []
+
+    staff = {route: get_staff_user_ids(cursor, route) for route in ('librarian', 'admin')}
+    entries = []
+    for r in rows:
+        borrow_id = int(r['BorrowID'])
+        route = 'admin' if r.get('HasDocument') else 'librarian'
+        entries.append({
+            'message': f'Return recorded for borrow #{borrow_id}.',
+            'sender_user_id': sender_user_id,
+            'related_id': borrow_id,
+            'recipients': [r.get('UserID'), *staff[route]],
+        })
+    return create_notifications_bulk(
+        cursor,
+        'BORROW_RETURN_RECORDED',
+        entries,
+        title='Return Recorded',
+        related_type='Borrow',
+    )
+
 def _get_user_name(cursor, user_id: int) -> str:
     profile = _get_user_profile(cursor, user_id)
     if not profile:
@@ -355,4 +431,65 @@ def notify_overdue(cursor, borrow_id: int, due_date, sender_user_id: Optional[in
     )
     log_event("BORROW_OVERDUE_REMINDER", user_id=sender_user_id,
               target_type="Borrow", target_id=borrow_id,
-              details={"due": str(due_date)})  # NEW
\ No newline at end of file
+              details={"due": str(due_date)})  # NEW
+
+def notify_overdue_batch(cursor, batch_size: int = 500) -> Dict[str, int]:
+    """
+    Set-based overdue pass: one query finds every approved, past-due loan
+    without a reminder today, then reminders go out in bulk batches.
+    Returns counts for the run.
+    """
+    _ensure_type(cursor, 'BORROW_OVERDUE_REMINDER', 'Borrow overdue reminder')
+    cursor.execute("""
+        SELECT al.BorrowID, al.DueDate, al.Route, b.UserID
+        FROM ActiveLoans al
+        JOIN Borrowers b ON b.BorrowerID = al.BorrowerID
+        WHERE al.ApprovalStatus='Approved'
+          AND al.DueDate < CURDATE()
+          AND NOT EXISTS (
+              SELECT 1 FROM Notifications n
+              WHERE n.RelatedType='Borrow'
+                AND n.RelatedID=al.BorrowID
+                AND n.Type='BORROW_OVERDUE_REMINDER'
+                AND n.CreatedAt >= CURDATE()
+          )
+        ORDER BY al.BorrowID
+    """)
+    due_rows = cursor.fetchall() or []
+    stats = {'overdue': len(due_rows), 'notifications': 0, 'recipients': 0}
+    if not due_rows:
+        return stats
+
+    staff = {route: get_staff_user_ids(cursor, route) for route in ('librarian', 'admin')}
+    entries = []
+    for r in due_rows:
+        if not r.get('UserID'):
+            continue
+        borrow_id = int(r['BorrowID'])
+        due_date = r.get('DueDate')
+        due_str = getattr(due_date, 'strftime', lambda fmt: str(due_date))('%Y-%m-%d')
+        entries.append({
+            'message': f'Borrow #{borrow_id} is overdue (due {due_str}). Please return items.',
+            'related_id': borrow_id,
+            'recipients': [r['UserID'], *staff.get(r.get('Route') or 'admin', [])],
+            'due': str(due_date),
+        })
+
+    for start in range(0, len(entries), batch_size):
+        chunk = entries[start:start + batch_size]
+        created = create_notifications_bulk(
+            cursor,
+            'BORROW_OVERDUE_REMINDER',
+            chunk,
+            title='Overdue Reminder',
+            related_type='Borrow',
+        )
+        stats['notifications'] += created['notifications']
+        stats['recipients'] += created['recipients']
+
+    log_many([
+        {"action_code": "BORROW_OVERDUE_REMINDER", "target_type": "Borrow",
+         "target_id": e['related_id'], "details": {"due": e['due']}}
+        for e in entries
+    ])
+    return stats
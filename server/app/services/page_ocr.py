@@ -0,0 +1,168 @@
+"""
+Page-parallel OCR for document analysis.
+
+pytesseract runs every image through a separate tesseract process, so the
+pages of a document are handed to a shared pool of OCR_WORKERS threads (one
+per core by default) and that many tesseract processes work side by side. The
+pool is shared by all analyses in the worker, so concurrent uploads cannot
+oversubscribe the CPU. A page gets OCR_PAGE_TIMEOUT seconds across all of its
+images; tesseract is killed when they run out and the page contributes
+nothing instead of stalling the whole document.
+
+Pages without embedded images or a text layer (vector-drawn scans, some
+fax-to-PDF output) are rasterized with PyMuPDF when it is installed. PyMuPDF
+is not thread-safe, so rasterizing takes the process-wide MUPDF_LOCK (shared
+with preview rendering) and only the tesseract step runs in parallel.
+"""
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from io import BytesIO
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.config import Config
+from app.services.pdf_document import MUPDF_LOCK
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+# Extra wait on top of the per-page timeouts before a page is given up on.
+_RESULT_GRACE_SECONDS = 10
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = Lock()
+
+
+def ocr_available() -> bool:
+    return pytesseract is not None and Image is not None
+
+
+def render_available() -> bool:
+    return fitz is not None
+
+
+def pool_size() -> int:
+    return max(1, Config.OCR_WORKERS or os.cpu_count() or 1)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=pool_size(), thread_name_prefix="ocr")
+    return _executor
+
+
+def _tesseract(img, deadline: float) -> Tuple[str, bool]:
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return "", True
+    try:
+        return pytesseract.image_to_string(img, timeout=remaining), False
+    except RuntimeError as exc:
+        # pytesseract kills tesseract and raises RuntimeError on timeout.
+        return "", "timeout" in str(exc).lower()
+    except Exception:
+        return "", False
+
+
+def ocr_image_blobs(blobs: Sequence[bytes], timeout: float) -> Tuple[str, bool]:
+    """OCR every embedded image of one page. Returns (text, timed_out)."""
+    if not ocr_available():
+        return "", False
+    deadline = time.monotonic() + timeout
+    texts = []
+    for data in blobs:
+        try:
+            with Image.open(BytesIO(data)) as img:
+                pil_img = img.convert("RGB") if img.mode not in ("RGB", "L") else img.copy()
+        except Exception:
+            continue
+        try:
+            text, timed_out = _tesseract(pil_img, deadline)
+        finally:
+            pil_img.close()
+        if text and text.strip():
+            texts.append(text.strip())
+        if timed_out:
+            return "\n".join(texts), True
+    return "\n".join(texts), False
+
+
+def render_and_ocr(pdf_path: str, page_index: int, dpi: int, timeout: float) -> Tuple[str, bool]:
+    """Rasterize one page and OCR the bitmap. Returns (text, timed_out)."""
+    if not ocr_available() or fitz is None:
+        return "", False
+    try:
+        with MUPDF_LOCK:
+            with fitz.open(pdf_path) as doc:
+                pix = doc[page_index].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+                img = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    except Exception:
+        return "", False
+    # The page's time limit covers tesseract, not the wait for the lock.
+    deadline = time.monotonic() + timeout
+    try:
+        text, timed_out = _tesseract(img, deadline)
+    finally:
+        img.close()
+    return (text or "").strip(), timed_out
+
+
+def ocr_pages(pdf_path: str, tasks: List[Tuple[int, Optional[List[bytes]]]]) -> Tuple[Dict[int, str], List[int]]:
+    """
+    Run OCR for (page_index, image_blobs) tasks in parallel. A task with
+    image_blobs=None is rasterized first. Returns ({page_index: text}, timed_out_pages).
+    """
+    if not tasks or not ocr_available():
+        return {}, []
+    timeout = max(1, Config.OCR_PAGE_TIMEOUT)
+    dpi = max(72, Config.OCR_RENDER_DPI)
+    texts: Dict[int, str] = {}
+    timed_out: List[int] = []
+
+    executor = _get_executor()
+    futures = []
+    for page_index, blobs in tasks:
+        if blobs is None:
+            future = executor.submit(render_and_ocr, pdf_path, page_index, dpi, timeout)
+        else:
+            future = executor.submit(ocr_image_blobs, blobs, timeout)
+        futures.append((page_index, future))
+
+    # Pages queue behind each other, so the wait bound scales with the
+    # number of rounds the pool needs; tesseract enforces the per-page limit.
+    rounds = -(-len(futures) // pool_size())
+    deadline = time.monotonic() + rounds * timeout + _RESULT_GRACE_SECONDS
+    for page_index, future in futures:
+        try:
+            text, late = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            future.cancel()
+            timed_out.append(page_index)
+            continue
+        except Exception as exc:
+            print(f"[page_ocr] Page {page_index + 1} failed: {exc}")
+            continue
+        if text:
+            texts[page_index] = text
+        if late:
+            timed_out.append(page_index)
+    return texts, timed_out
@@ -1,38 +1,127 @@
+"""
+Password reset codes.
+
+A code is stored as HMAC-SHA256(key, "<UserID>:<code>"), not as a password
+hash: codes are short-lived and random, so a slow hash only made every check
+expensive. The digest is behind a unique index, so verification is a single
+indexed lookup whatever the number of outstanding requests. UserID is unique
+as well, so a new request replaces the user's previous code. Used codes are
+deleted, and the scheduled password_reset_purge job drops expired ones.
+
+A cheap check would let a 6-digit code be guessed online, so every wrong
+guess counts against the code and it is deleted after
+RESET_CODE_MAX_ATTEMPTS; the forgot-password route limits how often new codes
+are issued.
+
+The key is PASSWORD_RESET_SECRET. Keep it out of the database so a copy of
+PasswordResetCodes cannot be brute-forced back into working codes; when
+unset it is derived from the database credentials.
+"""
 from __future__ import annotations
 
-import random
+import hashlib
+import hmac
+import secrets
 import string
 from datetime import datetime, timedelta
+from threading import Lock
 from typing import Any, Dict, Optional, Tuple, cast
 
-
+from app.config import Config
+from app.db import get_db_connection
 from app.services.mailer import send_forgot_password_email
 from app.services.notifications import _compose_display_name
-from app.services.passwords import hash_password, verify_password
 
 RESET_CODE_LENGTH = 6
 RESET_CODE_EXPIRY_MINUTES = 30
+RESET_CODE_MAX_ATTEMPTS = 5
 RESET_TABLE_DDL = """
 CREATE TABLE IF NOT EXISTS PasswordResetCodes (
     ResetID INT AUTO_INCREMENT PRIMARY KEY,
     UserID INT NOT NULL,
-    CodeHash VARCHAR(255) NOT NULL,
+    CodeDigest CHAR(64) NOT NULL,
     ExpiresAt DATETIME NOT NULL,
-    Consumed TINYINT(1) NOT NULL DEFAULT 0,
+    Attempts INT NOT NULL DEFAULT 0,
     CreatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    INDEX idx_user_expires (UserID, ExpiresAt),
+    UNIQUE KEY uq_reset_user (UserID),
+    UNIQUE KEY uq_reset_digest (CodeDigest),
+    INDEX idx_reset_expires (ExpiresAt),
     CONSTRAINT fk_password_reset_user FOREIGN KEY (UserID)
         REFERENCES Users(UserID) ON DELETE CASCADE
 )
 """
+# Tables from before digests held one PBKDF2 hash per request. Those codes
+# cannot be checked against a digest, so they are dropped (users ask again).
+_UPGRADE_DDL = (
+    "DELETE FROM PasswordResetCodes",
+    """
+    ALTER TABLE PasswordResetCodes
+        CHANGE CodeHash CodeDigest CHAR(64) NOT NULL,
+        DROP COLUMN Consumed,
+        ADD UNIQUE KEY uq_reset_user (UserID),
+        ADD UNIQUE KEY uq_reset_digest (CodeDigest),
+        ADD INDEX idx_reset_expires (ExpiresAt),
+        DROP INDEX idx_user_expires
+    """,
+)
+_ATTEMPTS_DDL = "ALTER TABLE PasswordResetCodes ADD COLUMN IF NOT EXISTS Attempts INT NOT NULL DEFAULT 0"
+
+_ready = False
+_ready_lock = Lock()
+
+
+def _has_digest_column(cursor: Any) -> bool:
+    cursor.execute(
+        """
+        SELECT 1 FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'PasswordResetCodes'
+          AND COLUMN_NAME = 'CodeDigest'
+        """
+    )
+    return cursor.fetchone() is not None
+
+
+def ensure_table() -> None:
+    """Create or upgrade the table once per process."""
+    global _ready
+    if _ready:
+        return
+    with _ready_lock:
+        if _ready:
+            return
+        # DDL commits implicitly, so it runs on its own connection rather
+        # than inside a route's transaction.
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(RESET_TABLE_DDL)
+            if not _has_digest_column(cursor):
+                for statement in _UPGRADE_DDL:
+                    cursor.execute(statement)
+                print("[password_reset] Switched reset codes to HMAC digests")
+            cursor.execute(_ATTEMPTS_DDL)
+            conn.commit()
+            _ready = True
+        finally:
+            cursor.close()
+            conn.close()
+
 
+def _secret() -> bytes:
+    if Config.PASSWORD_RESET_SECRET:
+        return Config.PASSWORD_RESET_SECRET.encode("utf-8")
+    # Every worker reads the same .env, so the DB credentials make a shared key.
+    db = Config.DB_CONFIG
+    return hashlib.sha256(f"kcls-password-reset:{db.get('user')}:{db.get('password')}".encode("utf-8")).digest()
 
-def _ensure_table(cursor: Any) -> None:
-    cursor.execute(RESET_TABLE_DDL)
+
+def code_digest(user_id: int, code: str) -> str:
+    message = f"{int(user_id)}:{code}".encode("utf-8")
+    return hmac.new(_secret(), message, hashlib.sha256).hexdigest()
 
 
 def _generate_code() -> str:
-    return ''.join(random.choices(string.digits, k=RESET_CODE_LENGTH))
+    return ''.join(secrets.choice(string.digits) for _ in range(RESET_CODE_LENGTH))
 
 
 def _lookup_user_by_email(cursor: Any, email: str) -> Optional[Tuple[int, Dict[str, Any]]]:
@@ -70,22 +159,24 @@ def _lookup_user_by_email(cursor: Any, email: str) -> Optional[Tuple[int, Dict[s
 def request_password_reset(cursor: Any, email: str) -> None:
     """Create a password reset code for the given email and send it if possible."""
 
-    _ensure_table(cursor)
+    ensure_table()
     user_record = _lookup_user_by_email(cursor, email)
     if not user_record:
         return  # Silently ignore to prevent user enumeration
 
     user_id, profile = user_record
     code = _generate_code()
-    code_hash = hash_password(code)
     expires_at = datetime.utcnow() + timedelta(minutes=RESET_CODE_EXPIRY_MINUTES)
 
+    # One row per user: a new request replaces any earlier code.
     cursor.execute(
         """
-        INSERT INTO PasswordResetCodes (UserID, CodeHash, ExpiresAt)
+        INSERT INTO PasswordResetCodes (UserID, CodeDigest, ExpiresAt)
         VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            CodeDigest=VALUES(CodeDigest), ExpiresAt=VALUES(ExpiresAt), Attempts=0, CreatedAt=NOW()
         """,
-        (user_id, code_hash, expires_at),
+        (user_id, code_digest(user_id, code), expires_at),
     )
 
     recipient = profile.get('email') or profile.get('username')
@@ -100,48 +191,71 @@ def request_password_reset(cursor: Any, email: str) -> None:
 
 
 def verify_reset_code(cursor: Any, email: str, code: str) -> Optional[int]:
-    """Return the UserID if the code is valid and not yet consumed."""
+    """
+    Return the UserID if the code is valid and not yet used. A wrong guess is
+    counted on the caller's transaction, which must be committed either way.
+    """
 
-    _ensure_table(cursor)
+    ensure_table()
     user_record = _lookup_user_by_email(cursor, email)
     if not user_record:
         return None
 
     user_id, _ = user_record
+    # The row lock keeps concurrent guesses from sharing one attempt.
     cursor.execute(
         """
-        SELECT ResetID, CodeHash, ExpiresAt, Consumed
+        SELECT CodeDigest, ExpiresAt, Attempts
         FROM PasswordResetCodes
         WHERE UserID=%s
-        ORDER BY CreatedAt DESC
-        LIMIT 5
+        FOR UPDATE
         """,
         (user_id,),
     )
-    fetched = cursor.fetchall() or []
-    rows = [cast(Dict[str, Any], r) for r in fetched]
-
-    now = datetime.utcnow()
-    for row in rows:
-        if row.get('Consumed'):
-            continue
-        expires_at = row.get('ExpiresAt')
-        if expires_at and expires_at < now:
-            continue
-        code_hash = row.get('CodeHash')
-        if isinstance(code_hash, bytes):
-            code_hash = code_hash.decode('utf-8')
-        if isinstance(code_hash, str) and verify_password(code_hash, code):
-            return user_id
+    raw_row = cursor.fetchone()
+    if not raw_row:
+        return None
+    row = cast(Dict[str, Any], raw_row)
+
+    expires_at = row.get('ExpiresAt')
+    attempts = int(row.get('Attempts') or 0)
+    if not expires_at or expires_at < datetime.utcnow() or attempts >= RESET_CODE_MAX_ATTEMPTS:
+        # Spent or out of guesses: refuse before looking at the code.
+        consume_reset_code(cursor, user_id)
+        return None
+
+    stored = row.get('CodeDigest') or ''
+    if isinstance(stored, bytes):
+        stored = stored.decode('utf-8')
+    if hmac.compare_digest(stored, code_digest(user_id, code)):
+        return user_id
+
+    if attempts + 1 >= RESET_CODE_MAX_ATTEMPTS:
+        consume_reset_code(cursor, user_id)
+    else:
+        cursor.execute(
+            "UPDATE PasswordResetCodes SET Attempts = Attempts + 1 WHERE UserID=%s",
+            (user_id,),
+        )
     return None
 
 
 def consume_reset_code(cursor: Any, user_id: int) -> None:
-    cursor.execute(
-        """
-        UPDATE PasswordResetCodes
-        SET Consumed=1
-        WHERE UserID=%s AND Consumed=0
-        """,
-        (user_id,),
-    )
+    cursor.execute("DELETE FROM PasswordResetCodes WHERE UserID=%s", (user_id,))
+
+
+def purge_expired_codes() -> int:
+    """Scheduled job: delete codes past their expiry."""
+    ensure_table()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM PasswordResetCodes WHERE ExpiresAt < %s", (datetime.utcnow(),))
+        removed = cursor.rowcount or 0
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    if removed:
+        print(f"[password_reset] Purged {removed} expired reset codes")
+    return removed
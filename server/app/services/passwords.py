@@ -1,11 +1,96 @@
-from werkzeug.security import generate_password_hash, check_password_hash
+"""
+Password hashing.
+
+Hashes are werkzeug PBKDF2-SHA256 strings. The iteration count is
+PASSWORD_HASH_ITERATIONS, or, when PASSWORD_HASH_TARGET_MS is set, whatever
+this machine needs for one hash to take that long (measured once per process,
+never below PASSWORD_HASH_MIN_ITERATIONS).
+
+Hashing and verification run on a shared pool of PASSWORD_HASH_WORKERS
+threads. hashlib releases the GIL during PBKDF2, so hashes run in parallel on
+separate cores while a burst of logins cannot occupy more than that many
+cores. Callers should hash before borrowing a database connection.
+
+Plain-text passwords left over from before hashing, and hashes weaker than
+the current parameters, are reported by needs_rehash(). Logins upgrade them
+as they happen; plain-text ones can also be migrated in bulk:
+
+    python -m app.services.passwords rehash [--dry-run]
+    python -m app.services.passwords calibrate
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import hmac
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Iterable, Optional
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app.config import Config
+
+_CALIBRATION_SAMPLE = 50_000
+_REHASH_BATCH = 200
+
+_iterations: Optional[int] = None
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = Lock()
+
+
+def pool_size() -> int:
+    return max(1, Config.PASSWORD_HASH_WORKERS or os.cpu_count() or 1)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=pool_size(), thread_name_prefix="pwhash")
+    return _executor
+
+
+def calibrate(target_ms: int) -> int:
+    """PBKDF2-SHA256 iterations that take about target_ms on this machine."""
+    started = time.perf_counter()
+    hashlib.pbkdf2_hmac("sha256", b"calibration", b"0123456789abcdef", _CALIBRATION_SAMPLE)
+    elapsed = max(time.perf_counter() - started, 1e-6)
+    return int(_CALIBRATION_SAMPLE * (target_ms / 1000.0) / elapsed)
+
+
+def iterations() -> int:
+    global _iterations
+    if _iterations is None:
+        with _lock:
+            if _iterations is None:
+                floor = max(1, Config.PASSWORD_HASH_MIN_ITERATIONS)
+                if Config.PASSWORD_HASH_TARGET_MS > 0:
+                    chosen = calibrate(Config.PASSWORD_HASH_TARGET_MS)
+                else:
+                    chosen = Config.PASSWORD_HASH_ITERATIONS
+                # Round so the stored method string does not change on every restart.
+                _iterations = max(floor, (chosen // 10_000) * 10_000)
+    return _iterations
+
+
+def current_method() -> str:
+    return f"pbkdf2:sha256:{iterations()}"
+
+
+def _hash_now(plain: str) -> str:
+    return generate_password_hash(plain, method=current_method())
 
-DEFAULT_METHOD = "pbkdf2:sha256:600000"
 
 def hash_password(plain: str) -> str:
     if plain is None:
         return None
-    return generate_password_hash(plain, method=DEFAULT_METHOD)
+    return _get_executor().submit(_hash_now, plain).result()
+
 
 def is_hashed(value: str) -> bool:
     if not value or ":" not in value:
@@ -14,13 +99,97 @@ def is_hashed(value: str) -> bool:
     parts = value.split(":")
     return len(parts) >= 3 and parts[0] in ("pbkdf2", "scrypt", "argon2")
 
+
 def verify_password(stored: str, provided: str) -> bool:
     if stored is None or provided is None:
         return False
     if is_hashed(stored):
-        return check_password_hash(stored, provided)
+        return _get_executor().submit(check_password_hash, stored, provided).result()
     # legacy plain text fallback
-    return stored == provided
+    return hmac.compare_digest(stored.encode("utf-8"), provided.encode("utf-8"))
+
 
 def needs_rehash(stored: str) -> bool:
-    return not is_hashed(stored)
\ No newline at end of file
+    if not is_hashed(stored):
+        return True
+    method = stored.split("$", 1)[0]
+    parts = method.split(":")
+    if parts[0] != "pbkdf2":
+        # scrypt/argon2 are at least as strong; leave them alone.
+        return False
+    try:
+        rounds = int(parts[2]) if len(parts) > 2 else 0
+    except ValueError:
+        return True
+    return parts[1] != "sha256" or rounds < iterations()
+
+
+def rehash_plaintext(dry_run: bool = False) -> dict:
+    """
+    Hash every plain-text password in parallel. Weak hashes are counted but
+    left alone: they can only be upgraded with the password, at login.
+    """
+    from app.db import get_db_connection
+
+    stats = {"plaintext": 0, "weak": 0, "rehashed": 0}
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        last_id = 0
+        while True:
+            cursor.execute(
+                "SELECT UserID, Password FROM Users WHERE UserID > %s ORDER BY UserID LIMIT %s",
+                (last_id, _REHASH_BATCH),
+            )
+            rows = cursor.fetchall() or []
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            plain = []
+            for user_id, stored in rows:
+                if stored is None or not needs_rehash(stored):
+                    continue
+                if is_hashed(stored):
+                    stats["weak"] += 1
+                else:
+                    plain.append((user_id, stored))
+            stats["plaintext"] += len(plain)
+            if dry_run or not plain:
+                continue
+            hashes = list(_get_executor().map(_hash_now, [stored for _, stored in plain]))
+            for (user_id, stored), hashed in zip(plain, hashes):
+                # Skip users who changed their password while we were hashing.
+                cursor.execute(
+                    "UPDATE Users SET Password=%s WHERE UserID=%s AND Password=%s",
+                    (hashed, user_id, stored),
+                )
+                stats["rehashed"] += cursor.rowcount or 0
+            conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    return stats
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.services.passwords")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rehash", help="hash plain-text passwords").add_argument("--dry-run", action="store_true")
+    sub.add_parser("calibrate", help="show iterations for PASSWORD_HASH_TARGET_MS")
+    args = parser.parse_args(list(argv) if argv is not None else None)
+
+    if args.command == "calibrate":
+        target = Config.PASSWORD_HASH_TARGET_MS or 250
+        print(f"{calibrate(target)} iterations take about {target} ms here; "
+              f"in use: {iterations()} ({pool_size()} hashing threads)")
+        return 0
+    started = time.perf_counter()
+    stats = rehash_plaintext(dry_run=args.dry_run)
+    prefix = "Would hash" if args.dry_run else f"Hashed {stats['rehashed']} of"
+    print(f"{prefix} {stats['plaintext']} plain-text passwords in {time.perf_counter() - started:.1f}s; "
+          f"{stats['weak']} weaker hashes will be upgraded at next login")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+A PDF opened once and shared by every analysis stage.
+
+PyPDF2 copies the whole file into memory when it is given a path, and the
+pipeline used to do that three times per upload (text/OCR, metadata, text
+again) plus a fourth full read for the SHA-256. ParsedPDF keeps one file
+handle and one reader. Page text, embedded images, the metadata dictionary
+and the hash are produced lazily, and page text is memoized so later stages
+get it for free.
+
+    with ParsedPDF(path) as doc:
+        doc.sha256, doc.page_count, doc.page_text(0), doc.metadata
+"""
+from __future__ import annotations
+
+import hashlib
+import mimetypes
+import os
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    from PyPDF2 import PdfReader
+except ImportError:
+    PdfReader = None
+
+_HASH_CHUNK = 1024 * 1024
+
+# PyMuPDF is not thread-safe, even with a Document per thread. Every fitz
+# call in the process (OCR rasterizing, preview rendering) holds this lock.
+MUPDF_LOCK = Lock()
+
+
+def iter_page_images(page) -> Iterator[bytes]:
+    """Yield raw image bytes from a PDF page."""
+    yielded = False
+
+    try:
+        for img in getattr(page, "images", []) or []:
+            data = getattr(img, "data", None)
+            if data:
+                yielded = True
+                yield data
+    except Exception:
+        pass
+
+    if yielded:
+        return
+
+    try:
+        resources = page.get("/Resources")
+        if not resources:
+            return
+        xobjects = resources.get("/XObject")
+        if not xobjects:
+            return
+        xobjects = xobjects.get_object()
+        for name, xobj in xobjects.items():  # pylint: disable=unused-variable
+            if xobj.get("/Subtype") != "/Image":
+                continue
+            try:
+                yield xobj.get_data()
+            except Exception:
+                continue
+    except Exception:
+        return
+
+
+class ParsedPDF:
+    def __init__(self, path: str):
+        self.path = str(path)
+        self._handle = None
+        self._reader = None
+        self._reader_failed = False
+        self._page_text: Dict[int, str] = {}
+        self._metadata: Optional[Dict[str, str]] = None
+        self._sha256: Optional[str] = None
+        # The reader seeks the shared handle; hashing must not interleave.
+        self._io_lock = Lock()
+
+    def __enter__(self) -> "ParsedPDF":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._reader = None
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def _file(self):
+        if self._handle is None:
+            self._handle = open(self.path, "rb")
+        return self._handle
+
+    @property
+    def reader(self):
+        """PyPDF2 reader over the open handle, or None if the file cannot be parsed."""
+        if self._reader is None and not self._reader_failed:
+            if PdfReader is None:
+                self._reader_failed = True
+                return None
+            try:
+                with self._io_lock:
+                    self._reader = PdfReader(self._file())
+            except Exception:
+                self._reader_failed = True
+        return self._reader
+
+    @property
+    def page_count(self) -> int:
+        reader = self.reader
+        if reader is None:
+            return 0
+        try:
+            return len(reader.pages)
+        except Exception:
+            return 0
+
+    def page_text(self, index: int) -> str:
+        if index not in self._page_text:
+            text = ""
+            reader = self.reader
+            if reader is not None:
+                try:
+                    with self._io_lock:
+                        text = reader.pages[index].extract_text() or ""
+                except Exception:
+                    text = ""
+            self._page_text[index] = text
+        return self._page_text[index]
+
+    def page_images(self, index: int) -> List[bytes]:
+        reader = self.reader
+        if reader is None:
+            return []
+        try:
+            with self._io_lock:
+                return list(iter_page_images(reader.pages[index]))
+        except Exception:
+            return []
+
+    def text(self, max_chars: int = 250_000, max_pages: Optional[int] = None) -> str:
+        """Page texts joined by newlines, stopping once max_chars is reached."""
+        pages = []
+        total = 0
+        limit = self.page_count if max_pages is None else min(max_pages, self.page_count)
+        for index in range(limit):
+            page = self.page_text(index)
+            pages.append(page)
+            total += len(page)
+            if total > max_chars:
+                break
+        return "\n".join(pages)[:max_chars]
+
+    @property
+    def metadata(self) -> Dict[str, str]:
+        """Document info dictionary with cleaned string values, keys lower-cased."""
+        if self._metadata is None:
+            meta: Dict[str, str] = {}
+            reader = self.reader
+            if reader is not None:
+                try:
+                    with self._io_lock:
+                        info = reader.metadata
+                        items = list(info.items()) if info else []
+                    for k, v in items:
+                        if isinstance(v, str):
+                            cleaned = v.strip()
+                            if cleaned:
+                                meta[k.strip("/").lower()] = cleaned
+                except Exception:
+                    pass
+            self._metadata = meta
+        return self._metadata
+
+    @property
+    def sha256(self) -> str:
+        if self._sha256 is None:
+            digest = hashlib.sha256()
+            with self._io_lock:
+                handle = self._file()
+                position = handle.tell()
+                handle.seek(0)
+                for chunk in iter(lambda: handle.read(_HASH_CHUNK), b""):
+                    digest.update(chunk)
+                handle.seek(position)
+            self._sha256 = digest.hexdigest()
+        return self._sha256
+
+    def file_info(self) -> Dict[str, Any]:
+        """Same shape as document_classifier.extract_metadata()."""
+        path = Path(self.path)
+        mime, _ = mimetypes.guess_type(self.path)
+        return {
+            "file_name": path.name,
+            "extension": path.suffix.lower(),
+            "size_bytes": os.path.getsize(self.path),
+            "mime_type": mime or "application/octet-stream",
+            "sha256": self.sha256,
+            "pdf_raw_metadata": self.metadata,
+        }
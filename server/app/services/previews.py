@@ -0,0 +1,267 @@
+"""
+Page thumbnails and low-resolution page images for stored PDFs.
+
+Browsing the catalog used to mean downloading whole PDFs. Each stored file now
+gets a small page-1 thumbnail and JPEG images of its first PREVIEW_PAGES
+pages. They are rendered in the background when the file is uploaded and
+cached under UPLOAD_FOLDER/previews/ab/<sha256>/. They are keyed by content,
+like the blob store, so a PDF stored twice is rendered once and the images
+can be cached by browsers for good. Later pages are rendered on first
+request. A scheduled backfill renders files that predate this (or were
+uploaded while rendering was unavailable) and removes previews whose PDF is
+gone.
+
+Rendering needs PyMuPDF (1.22 or newer). Without it the endpoints answer 503
+and nothing else changes.
+
+    python -m app.services.previews backfill [--limit N]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config import Config
+from app.services import blob_store
+from app.services.pdf_document import MUPDF_LOCK
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+THUMB_VARIANT = "thumb"
+_PREVIEW_DIR = "previews"
+_META_NAME = "meta.json"
+_SHA_RE = re.compile(r"^[0-9a-f]{64}$")
+_VARIANT_RE = re.compile(r"^(thumb|page-[1-9][0-9]{0,4})$")
+_JPEG_QUALITY = 70
+# Never upscale tiny pages past this zoom factor.
+_MAX_ZOOM = 3.0
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = Lock()
+
+
+def available() -> bool:
+    return fitz is not None
+
+
+def _root() -> str:
+    return os.path.join(Config.UPLOAD_FOLDER, _PREVIEW_DIR)
+
+
+def preview_dir(sha256: str) -> str:
+    if not _SHA_RE.match(sha256 or ""):
+        raise ValueError("invalid preview id")
+    return os.path.join(_root(), sha256[:2], sha256)
+
+
+def preview_path(sha256: str, variant: str) -> str:
+    if not _VARIANT_RE.match(variant or ""):
+        raise ValueError("invalid preview variant")
+    return os.path.join(preview_dir(sha256), f"{variant}.jpg")
+
+
+def public_url(sha256: str, variant: str = THUMB_VARIANT) -> str:
+    return f"/previews/{sha256}/{variant}.jpg"
+
+
+def page_variant(page_number: int) -> str:
+    return f"page-{page_number}"
+
+
+def read_meta(sha256: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(preview_dir(sha256), _META_NAME), "r", encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as handle:
+        handle.write(data)
+    os.replace(tmp_path, path)
+
+
+def _render_page(doc, index: int, width: int) -> bytes:
+    page = doc[index]
+    zoom = min(_MAX_ZOOM, width / max(1.0, page.rect.width))
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    return pix.tobytes("jpg", jpg_quality=_JPEG_QUALITY)
+
+
+def render(sha256: str, source_path: str, variants: List[str]) -> Dict[str, str]:
+    """
+    Render the requested variants that are not cached yet. Returns
+    {variant: path} for those that exist afterwards; pages past the end are skipped.
+    """
+    folder = preview_dir(sha256)
+    wanted = {variant: preview_path(sha256, variant) for variant in variants}
+    done = {variant: path for variant, path in wanted.items() if os.path.isfile(path)}
+    missing = [variant for variant in wanted if variant not in done]
+    if not missing and os.path.isfile(os.path.join(folder, _META_NAME)):
+        return done
+    if fitz is None:
+        return done
+
+    os.makedirs(folder, exist_ok=True)
+    # Shared with OCR rasterizing: PyMuPDF must only run on one thread at a time.
+    with MUPDF_LOCK:
+        with fitz.open(source_path) as doc:
+            page_count = doc.page_count
+            for variant in missing:
+                if variant == THUMB_VARIANT:
+                    index, width = 0, Config.PREVIEW_THUMB_WIDTH
+                else:
+                    index, width = int(variant[5:]) - 1, Config.PREVIEW_PAGE_WIDTH
+                if index >= page_count:
+                    continue
+                _write_atomic(wanted[variant], _render_page(doc, index, max(16, width)))
+                done[variant] = wanted[variant]
+    _write_atomic(
+        os.path.join(folder, _META_NAME),
+        json.dumps({"page_count": page_count, "rendered_at": int(time.time())}).encode("utf-8"),
+    )
+    return done
+
+
+def upload_variants() -> List[str]:
+    """What is rendered ahead of time for every stored file."""
+    return [THUMB_VARIANT] + [page_variant(n) for n in range(1, max(0, Config.PREVIEW_PAGES) + 1)]
+
+
+def render_upload(sha256: str, source_path: str) -> None:
+    try:
+        render(sha256, source_path, upload_variants())
+    except Exception as exc:
+        print(f"[previews] Rendering {sha256[:12]} failed: {exc}")
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=max(1, Config.PREVIEW_WORKERS), thread_name_prefix="previews"
+                )
+    return _executor
+
+
+def schedule(sha256: str, source_path: str) -> None:
+    """Render a new upload's previews off the request thread."""
+    if fitz is None or not _SHA_RE.match(sha256 or ""):
+        return
+    _get_executor().submit(render_upload, sha256, source_path)
+
+
+def source_for_sha(sha256: str) -> Optional[str]:
+    """A stored PDF with this content: the blob, or a library file with that hash."""
+    path = blob_store.blob_path(sha256)
+    if os.path.isfile(path):
+        return path
+    from app.services.upload_catalog import file_with_sha256
+    name = file_with_sha256(sha256)
+    if name:
+        path = os.path.join(Config.UPLOAD_FOLDER, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def source_for_file_path(file_path: Optional[str]) -> Optional[Tuple[str, str]]:
+    """(sha256, path) for a Documents.File_Path, or None if the file is missing."""
+    if not file_path:
+        return None
+    sha256 = blob_store.sha_from_url(file_path)
+    if sha256:
+        path = blob_store.blob_path(sha256)
+        return (sha256, path) if os.path.isfile(path) else None
+    prefix = "/uploads/"
+    if file_path.startswith(prefix) and "/" not in file_path[len(prefix):]:
+        path = os.path.join(Config.UPLOAD_FOLDER, file_path[len(prefix):])
+        if os.path.isfile(path):
+            from app.services.file_serving import content_etag
+            return content_etag(path), path
+    return None
+
+
+def backfill(limit: Optional[int] = None) -> Dict[str, int]:
+    """Scheduled job: render missing previews and drop those of deleted files."""
+    limit = Config.PREVIEW_BACKFILL_BATCH if limit is None else limit
+    from app.services.upload_catalog import library_hashes
+    blob_shas = blob_store.live_hashes()
+    library = library_hashes()
+
+    rendered = failed = 0
+    if fitz is not None:
+        for sha256 in sorted(blob_shas | set(library)):
+            if rendered + failed >= limit:
+                break
+            if read_meta(sha256) is not None:
+                continue
+            if sha256 in blob_shas:
+                path = blob_store.blob_path(sha256)
+            else:
+                path = os.path.join(Config.UPLOAD_FOLDER, library[sha256])
+            if not os.path.isfile(path):
+                continue
+            try:
+                render(sha256, path, upload_variants())
+                rendered += 1
+            except Exception as exc:
+                failed += 1
+                print(f"[previews] Backfill of {sha256[:12]} failed: {exc}")
+
+    # Previews of files that are gone, once they are past the blob grace period.
+    removed = 0
+    known = blob_shas | set(library)
+    cutoff = time.time() - max(0, Config.BLOB_GC_GRACE_HOURS) * 3600
+    root = _root()
+    if os.path.isdir(root):
+        for shard in os.scandir(root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    if entry.name in known or entry.stat().st_mtime >= cutoff:
+                        continue
+                    if os.path.isfile(blob_store.blob_path(entry.name)):
+                        continue
+                except (OSError, ValueError):
+                    pass
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+    if rendered or failed or removed:
+        print(f"[previews] Backfill rendered {rendered}, failed {failed}, removed {removed}")
+    return {"rendered": rendered, "failed": failed, "removed": removed}
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.services.previews")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("backfill", help="render missing previews now")
+    run.add_argument("--limit", type=int, default=1_000_000)
+    args = parser.parse_args(list(argv) if argv is not None else None)
+
+    if fitz is None:
+        print("PyMuPDF is not installed; previews cannot be rendered.")
+        return 1
+    if args.command == "backfill":
+        print(backfill(limit=args.limit))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,440 @@
+"""
+Background job scheduler.
+
+One thread per worker process plans every registered job from the current
+settings and sleeps until the earliest next fire time, or until
+request_replan() wakes it after a settings change. Each fire ("slot") is
+claimed by a leased update of the job's ScheduledJobs row and recorded there,
+so a job runs once per slot across all gunicorn workers and hosts sharing the
+database. No connection is held while the job runs, and at most
+SCHEDULER_MAX_CONCURRENT_JOBS jobs run at once per process, so jobs that fall
+due together do not exhaust the background pool.
+
+A job that could not do its work (for example because the database was
+unavailable) returns SKIPPED; its slot is then retried instead of recorded.
+A job that raises is recorded as failed and its slot is retried after
+RETRY_SECONDS.
+"""
+from __future__ import annotations
+
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from datetime import time as dt_time
+from threading import BoundedSemaphore, Event, Lock, Thread
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.config import Config
+from app.db import BACKGROUND_POOL, DatabaseUnavailable, get_db_connection, use_pool
+from app.services.settings import load_settings
+
+# Upper bound on a single sleep so changes saved by another worker (which
+# cannot wake this process) are picked up quickly.
+MAX_SLEEP_SECONDS = 30
+# A claim lapses this long after its last renewal, so a crashed worker's
+# slot is picked up again; running jobs renew it every third of that.
+CLAIM_LEASE_SECONDS = 900
+# A failed slot stays due and is retried this long after the failure.
+RETRY_SECONDS = 300
+ALL_DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+SCHEDULED_JOBS_DDL = """
+CREATE TABLE IF NOT EXISTS ScheduledJobs (
+    JobName VARCHAR(64) NOT NULL PRIMARY KEY,
+    LastSlot DATETIME DEFAULT NULL,
+    LastStartedAt DATETIME DEFAULT NULL,
+    LastFinishedAt DATETIME DEFAULT NULL,
+    LastStatus VARCHAR(16) DEFAULT NULL,
+    LastError TEXT DEFAULT NULL,
+    LastDurationMs INT DEFAULT NULL,
+    RunBy VARCHAR(128) DEFAULT NULL,
+    ClaimedBy VARCHAR(128) DEFAULT NULL,
+    ClaimedUntil DATETIME DEFAULT NULL
+)
+"""
+# Tables created before claims replaced GET_LOCK.
+_CLAIM_COLUMNS_DDL = """
+ALTER TABLE ScheduledJobs
+    ADD COLUMN IF NOT EXISTS ClaimedBy VARCHAR(128) DEFAULT NULL,
+    ADD COLUMN IF NOT EXISTS ClaimedUntil DATETIME DEFAULT NULL
+"""
+
+# Returned by a job that did no work; the slot stays due.
+SKIPPED = object()
+
+
+def next_daily_run(now: datetime, hour: int, minute: int, days: Iterable[str]) -> Optional[datetime]:
+    """First HH:MM strictly after `now` that falls on one of `days`."""
+    allowed = set(days) or set(ALL_DAYS)
+    for offset in range(8):
+        candidate = datetime.combine(now.date() + timedelta(days=offset), dt_time(hour, minute))
+        if candidate > now and candidate.strftime("%a") in allowed:
+            return candidate
+    return None
+
+
+class IntervalSchedule:
+    """Fires every `seconds`, aligned to the epoch so all workers agree on slots."""
+
+    def __init__(self, seconds: int):
+        self.seconds = max(1, int(seconds))
+
+    def current_slot(self, settings: Dict[str, Any], now: datetime) -> Optional[datetime]:
+        ts = int(now.timestamp())
+        return datetime.fromtimestamp(ts - ts % self.seconds)
+
+    def next_fire(self, settings: Dict[str, Any], now: datetime) -> Optional[datetime]:
+        return self.current_slot(settings, now) + timedelta(seconds=self.seconds)
+
+    def describe(self, settings: Dict[str, Any]) -> str:
+        return f"every {self.seconds}s"
+
+
+class DailySchedule:
+    """Fires at `<prefix>_time` on `<prefix>_days` while `<prefix>_enabled` is set."""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+
+    def _parse(self, settings: Dict[str, Any]) -> Tuple[bool, int, int, List[str]]:
+        enabled = bool(settings.get(f"{self.prefix}_enabled", False))
+        hour, minute = 0, 0
+        try:
+            parts = str(settings.get(f"{self.prefix}_time") or "00:00").split(":")
+            hour = max(0, min(23, int(parts[0])))
+            minute = max(0, min(59, int(parts[1])))
+        except Exception:
+            enabled = False
+        days = [str(d)[:3].title() for d in (settings.get(f"{self.prefix}_days") or []) if d]
+        return enabled, hour, minute, days or list(ALL_DAYS)
+
+    def current_slot(self, settings: Dict[str, Any], now: datetime) -> Optional[datetime]:
+        # Today's run stays due until midnight, so a worker that was down at
+        # the scheduled time still catches up; ScheduledJobs keeps it single.
+        enabled, hour, minute, days = self._parse(settings)
+        if not enabled or now.strftime("%a") not in days:
+            return None
+        slot = datetime.combine(now.date(), dt_time(hour, minute))
+        return slot if now >= slot else None
+
+    def next_fire(self, settings: Dict[str, Any], now: datetime) -> Optional[datetime]:
+        enabled, hour, minute, days = self._parse(settings)
+        if not enabled:
+            return None
+        return next_daily_run(now, hour, minute, days)
+
+    def describe(self, settings: Dict[str, Any]) -> str:
+        enabled, hour, minute, days = self._parse(settings)
+        if not enabled:
+            return "disabled"
+        return f"daily at {hour:02d}:{minute:02d} on {','.join(days)}"
+
+
+class Job:
+    def __init__(self, name: str, func: Callable[[], Any], schedule):
+        self.name = name
+        self.func = func
+        self.schedule = schedule
+        self.last_slot: Optional[datetime] = None
+        self.next_run: Optional[datetime] = None
+        self.running = False
+        self.last_result: Optional[Dict[str, Any]] = None
+
+
+_jobs: Dict[str, Job] = {}
+_jobs_lock = Lock()
+_wake = Event()
+_stop_event: Optional[Event] = None
+_thread: Optional[Thread] = None
+_table_ready = False
+_launch_slots: Optional[BoundedSemaphore] = None
+_run_by = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def register_job(name: str, func: Callable[[], Any], schedule) -> Job:
+    with _jobs_lock:
+        job = Job(name, func, schedule)
+        _jobs[name] = job
+    request_replan()
+    return job
+
+
+def request_replan() -> None:
+    """Wake the scheduler so it recomputes fire times from fresh settings."""
+    _wake.set()
+
+
+def _register_builtin_jobs() -> None:
+    from app.services.analysis_jobs import purge_finished_jobs
+    from app.services.auto_backup import run_auto_backup
+    from app.services.auto_overdue import run_overdue_scan
+    from app.services.auto_return import AUTO_RETURN_INTERVAL_SECONDS, run_auto_return
+    from app.services.blob_store import collect_garbage
+    from app.services.login_lockout import sweep as sweep_login_lockouts
+    from app.services.password_reset import purge_expired_codes
+    from app.services.previews import backfill as backfill_previews
+    from app.services.upload_catalog import reconcile as reconcile_upload_catalog
+    from app.services.uploads import purge_stale_sessions
+
+    register_job("auto_return", run_auto_return, IntervalSchedule(AUTO_RETURN_INTERVAL_SECONDS))
+    register_job("auto_overdue", run_overdue_scan, DailySchedule("auto_overdue"))
+    register_job("auto_backup", run_auto_backup, DailySchedule("auto_backup"))
+    register_job("analysis_jobs_purge", purge_finished_jobs, IntervalSchedule(3600))
+    register_job("upload_sessions_purge", purge_stale_sessions, IntervalSchedule(3600))
+    register_job("blob_gc", collect_garbage, IntervalSchedule(6 * 3600))
+    register_job(
+        "upload_catalog_reconcile",
+        reconcile_upload_catalog,
+        IntervalSchedule(max(60, Config.UPLOAD_CATALOG_RESCAN_SECONDS)),
+    )
+    register_job("preview_backfill", backfill_previews, IntervalSchedule(3600))
+    register_job("login_lockout_sweep", sweep_login_lockouts, IntervalSchedule(600))
+    register_job("password_reset_purge", purge_expired_codes, IntervalSchedule(900))
+
+
+def _ensure_table(cursor: Any) -> None:
+    global _table_ready
+    if not _table_ready:
+        cursor.execute(SCHEDULED_JOBS_DDL)
+        cursor.execute(_CLAIM_COLUMNS_DDL)
+        _table_ready = True
+
+
+def _claim(job: Job, slot: datetime) -> Optional[bool]:
+    """Claim `slot` for this process. None if the database is unavailable."""
+    try:
+        conn = get_db_connection()
+    except DatabaseUnavailable:
+        return None
+    cursor = conn.cursor()
+    try:
+        _ensure_table(cursor)
+        cursor.execute("INSERT IGNORE INTO ScheduledJobs (JobName) VALUES (%s)", (job.name,))
+        # Fails if the slot is already recorded or another live claim holds it.
+        cursor.execute(
+            """
+            UPDATE ScheduledJobs
+            SET ClaimedBy=%s, ClaimedUntil=NOW() + INTERVAL %s SECOND
+            WHERE JobName=%s
+              AND (LastSlot IS NULL OR LastSlot < %s)
+              AND (ClaimedUntil IS NULL OR ClaimedUntil < NOW())
+              AND (LastStatus IS NULL OR LastStatus <> 'error'
+                   OR LastFinishedAt < NOW() - INTERVAL %s SECOND)
+            """,
+            (_run_by, CLAIM_LEASE_SECONDS, job.name, slot, RETRY_SECONDS),
+        )
+        claimed = cursor.rowcount == 1
+        conn.commit()
+        return claimed
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _renew_claim(job: Job, done: Event) -> None:
+    use_pool(BACKGROUND_POOL)
+    while not done.wait(CLAIM_LEASE_SECONDS / 3):
+        try:
+            conn = get_db_connection()
+        except DatabaseUnavailable:
+            continue
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """
+                UPDATE ScheduledJobs SET ClaimedUntil=NOW() + INTERVAL %s SECOND
+                WHERE JobName=%s AND ClaimedBy=%s
+                """,
+                (CLAIM_LEASE_SECONDS, job.name, _run_by),
+            )
+            conn.commit()
+        except Exception as exc:
+            print(f"[scheduler] Could not renew claim on {job.name}: {exc}")
+        finally:
+            cursor.close()
+            conn.close()
+
+
+def _finish(job: Job, slot: datetime, started_at: datetime, result: Optional[Dict[str, Any]]) -> None:
+    """
+    Record the run and drop the claim. A None result (skipped) or a failed
+    run leaves the slot due.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        if result is None:
+            cursor.execute(
+                """
+                UPDATE ScheduledJobs SET ClaimedBy=NULL, ClaimedUntil=NULL
+                WHERE JobName=%s AND ClaimedBy=%s
+                """,
+                (job.name, _run_by),
+            )
+        else:
+            cursor.execute(
+                """
+                UPDATE ScheduledJobs
+                SET LastSlot=COALESCE(%s, LastSlot), LastStartedAt=%s, LastFinishedAt=%s, LastStatus=%s,
+                    LastError=%s, LastDurationMs=%s, RunBy=%s,
+                    ClaimedBy=NULL, ClaimedUntil=NULL
+                WHERE JobName=%s
+                """,
+                (slot if result["status"] == "ok" else None, started_at, datetime.now(), result["status"], result["error"],
+                 result["duration_ms"], _run_by, job.name),
+            )
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _run_claimed(job: Job, slot: datetime) -> None:
+    try:
+        claimed = _claim(job, slot)
+    except Exception as exc:
+        print(f"[scheduler] Could not claim {job.name}: {exc}")
+        return
+    if claimed is None:
+        print(f"[scheduler] Database unavailable, deferring {job.name}")
+        job.last_slot = None
+        return
+    if not claimed:
+        return  # already run for this slot, or running elsewhere
+
+    done = Event()
+    Thread(target=_renew_claim, args=(job, done), name=f"claim-{job.name}", daemon=True).start()
+    started_at = datetime.now()
+    started = time.monotonic()
+    status, error, skipped = "ok", None, False
+    try:
+        skipped = job.func() is SKIPPED
+    except DatabaseUnavailable:
+        skipped = True
+    except Exception as exc:
+        status, error = "error", str(exc)
+        print(f"[scheduler] Job {job.name} failed: {exc}")
+    finally:
+        done.set()
+    duration_ms = int((time.monotonic() - started) * 1000)
+
+    result = None
+    if skipped:
+        print(f"[scheduler] {job.name} skipped, will retry")
+        job.last_slot = None
+    else:
+        result = {
+            "slot": slot.isoformat(),
+            "started_at": started_at.isoformat(),
+            "status": status,
+            "error": error,
+            "duration_ms": duration_ms,
+        }
+        job.last_result = result
+        if status != "ok":
+            # Keep trying; the claim holds other attempts off for RETRY_SECONDS.
+            job.last_slot = None
+    try:
+        _finish(job, slot, started_at, result)
+    except Exception as exc:
+        # The claim lapses on its own and the slot is run again.
+        print(f"[scheduler] Could not record {job.name}: {exc}")
+
+
+def _get_launch_slots() -> BoundedSemaphore:
+    global _launch_slots
+    if _launch_slots is None:
+        _launch_slots = BoundedSemaphore(max(1, Config.SCHEDULER_MAX_CONCURRENT_JOBS))
+    return _launch_slots
+
+
+def _launch(app, job: Job, slot: datetime) -> bool:
+    """Start the job unless the concurrency cap is reached."""
+    slots = _get_launch_slots()
+    if not slots.acquire(blocking=False):
+        return False
+
+    def _target():
+        use_pool(BACKGROUND_POOL)
+        try:
+            with app.app_context():
+                _run_claimed(job, slot)
+        finally:
+            job.running = False
+            slots.release()
+            # Lets jobs that were held back by the cap start now.
+            request_replan()
+
+    job.running = True
+    job.last_slot = slot
+    Thread(target=_target, name=f"job-{job.name}", daemon=True).start()
+    return True
+
+
+def _tick(app, now: datetime) -> float:
+    """Launch due jobs, refresh next fire times, and return seconds to sleep."""
+    settings = load_settings()
+    with _jobs_lock:
+        jobs = list(_jobs.values())
+    wait_for = float(MAX_SLEEP_SECONDS)
+    for job in jobs:
+        slot = job.schedule.current_slot(settings, now)
+        if slot is not None and slot != job.last_slot and not job.running:
+            _launch(app, job, slot)
+        job.next_run = job.schedule.next_fire(settings, now)
+        if job.next_run is not None:
+            wait_for = min(wait_for, (job.next_run - now).total_seconds())
+    return max(0.5, wait_for)
+
+
+def start_scheduler(app) -> None:
+    global _stop_event, _thread
+    if _thread and _thread.is_alive():
+        return
+    if not _jobs:
+        _register_builtin_jobs()
+    _stop_event = Event()
+    stop_event = _stop_event
+
+    def _runner():
+        use_pool(BACKGROUND_POOL)
+        with app.app_context():
+            while not stop_event.is_set():
+                _wake.clear()
+                try:
+                    wait_for = _tick(app, datetime.now())
+                except Exception as exc:  # pragma: no cover - background worker
+                    print(f"[scheduler] Error: {exc}")
+                    wait_for = MAX_SLEEP_SECONDS
+                _wake.wait(wait_for)
+
+    _thread = Thread(target=_runner, name="scheduler", daemon=True)
+    _thread.start()
+
+
+def stop_scheduler() -> None:
+    global _stop_event, _thread
+    if _stop_event:
+        _stop_event.set()
+    _wake.set()
+    _thread = None
+
+
+def get_scheduler_status() -> List[Dict[str, Any]]:
+    settings = load_settings()
+    with _jobs_lock:
+        jobs = list(_jobs.values())
+    return [
+        {
+            "name": job.name,
+            "schedule": job.schedule.describe(settings),
+            "next_run": job.next_run.isoformat() if job.next_run else None,
+            "running": job.running,
+            "last_result": job.last_result,
+        }
+        for job in jobs
+    ]
@@ -1,5 +1,6 @@
-import json, os, tempfile
-from typing import Dict, Any, Iterable
+import json, os, tempfile, time
+from threading import Lock
+from typing import Dict, Any, Iterable, Optional, Tuple
 
 def _server_dir():
     return os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
@@ -111,8 +112,59 @@ def _normalize_days(value: Any, default: Iterable[str]) -> list[str]:
         return list(default)
     return normalized
 
+# Parsed settings are cached per process. The file is stat()ed at most once per
+# SETTINGS_STAT_INTERVAL and re-read only when its mtime, inode or size changes,
+# so a save in another worker is picked up within about a second.
+SETTINGS_STAT_INTERVAL = 1.0
+
+_cache_lock = Lock()
+_cache: Dict[str, Any] = {"stamp": None, "data": None, "checked": 0.0}
+_version = 0
+
+
+def _file_stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+
+def _refresh_cache(force: bool = False) -> Dict[str, Any]:
+    global _version
+    now = time.monotonic()
+    data = _cache["data"]
+    if not force and data is not None and now - _cache["checked"] < SETTINGS_STAT_INTERVAL:
+        return data
+    with _cache_lock:
+        data = _cache["data"]
+        if not force and data is not None and now - _cache["checked"] < SETTINGS_STAT_INTERVAL:
+            return data
+        path = get_settings_path()
+        stamp = _file_stamp(path)
+        if force or data is None or stamp != _cache["stamp"]:
+            fresh = _read_settings(path)
+            if fresh != data:
+                _version += 1
+            data = fresh
+            _cache["stamp"] = stamp
+            _cache["data"] = data
+        _cache["checked"] = time.monotonic()
+        return data
+
+
+def get_settings_version() -> int:
+    """Counter bumped whenever the cached settings change; cheap to poll."""
+    _refresh_cache()
+    return _version
+
+
 def load_settings() -> Dict[str, Any]:
-    path = get_settings_path()
+    # Shallow copy so callers can't mutate the shared cache.
+    return dict(_refresh_cache())
+
+
+def _read_settings(path: str) -> Dict[str, Any]:
     if not os.path.exists(path):
         return DEFAULTS.copy()
     try:
@@ -161,7 +213,7 @@ def load_settings() -> Dict[str, Any]:
     return out
 
 def save_settings(partial: Dict[str, Any]) -> Dict[str, Any]:
-    current = load_settings()
+    current = dict(_refresh_cache(force=True))
     if "fine" in partial:
         try:
             current["fine"] = int(partial["fine"])
@@ -218,4 +270,8 @@ def save_settings(partial: Dict[str, Any]) -> Dict[str, Any]:
                 os.remove(tmp_path)
         except:
             pass
+    _refresh_cache(force=True)
+    # Lazy import: the scheduler itself reads settings from this module.
+    from app.services.scheduler import request_replan
+    request_replan()
     return current
\ No newline at end of file
@@ -0,0 +1,305 @@
+"""
+Catalog of the shared uploads library (the top level of UPLOAD_FOLDER).
+
+GET /documents/uploads used to scandir and stat the whole folder and sort it
+on every request. The UploadedFiles table now records each file's size,
+mtime, SHA-256 and the document that links to it. Paging, filtering and
+sorting run as indexed queries against it. The upload and delete routes keep
+it current. A scheduled re-scan reconciles it with the disk and picks up
+files copied in by hand, files removed outside the app and document links.
+"""
+from __future__ import annotations
+
+import os
+import time
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import Config
+from app.db import get_db_connection
+from app.services.uploads import hash_file
+
+UPLOADED_FILES_DDL = """
+CREATE TABLE IF NOT EXISTS UploadedFiles (
+    FileName VARCHAR(255) NOT NULL PRIMARY KEY,
+    SizeBytes BIGINT NOT NULL,
+    MTime BIGINT NOT NULL,
+    SHA256 CHAR(64) DEFAULT NULL,
+    Document_ID INT DEFAULT NULL,
+    ScannedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_uploadedfiles_mtime (MTime),
+    INDEX idx_uploadedfiles_size (SizeBytes),
+    INDEX idx_uploadedfiles_document (Document_ID),
+    INDEX idx_uploadedfiles_sha (SHA256)
+)
+"""
+
+SORT_COLUMNS = {"mtime": "MTime", "name": "FileName", "size": "SizeBytes"}
+_BATCH = 500
+
+_table_ready = False
+_table_lock = Lock()
+_initial_scan_lock = Lock()
+_initial_scan_done = False
+
+
+def ensure_table() -> None:
+    """Create UploadedFiles once per process."""
+    global _table_ready
+    if _table_ready:
+        return
+    with _table_lock:
+        if _table_ready:
+            return
+        # DDL commits implicitly, so it runs on its own connection rather
+        # than inside a route's transaction.
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(UPLOADED_FILES_DDL)
+            _table_ready = True
+        finally:
+            cursor.close()
+            conn.close()
+
+
+def _listable(entry: os.DirEntry) -> bool:
+    # Dotfiles are session data and in-flight uploads; blobs/ is a directory.
+    return not entry.name.startswith(".") and not entry.name.endswith(".tmp") and entry.is_file()
+
+
+def record_file(cursor: Any, name: str, size: int, mtime: int, sha256: Optional[str] = None) -> None:
+    ensure_table()
+    cursor.execute(
+        """
+        INSERT INTO UploadedFiles (FileName, SizeBytes, MTime, SHA256)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE SizeBytes=VALUES(SizeBytes), MTime=VALUES(MTime),
+            SHA256=COALESCE(VALUES(SHA256), SHA256), ScannedAt=NOW()
+        """,
+        (name, size, mtime, sha256),
+    )
+
+
+def remove_file(cursor: Any, name: str) -> None:
+    ensure_table()
+    cursor.execute("DELETE FROM UploadedFiles WHERE FileName=%s", (name,))
+
+
+def linked_document(cursor: Any, name: str) -> Optional[int]:
+    cursor.execute(
+        "SELECT Document_ID FROM Documents WHERE File_Path=%s LIMIT 1", (f"/uploads/{name}",)
+    )
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return row["Document_ID"] if isinstance(row, dict) else row[0]
+
+
+def catalog_entry(name: str) -> Optional[Dict[str, Any]]:
+    ensure_table()
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            "SELECT SizeBytes, MTime, SHA256, Document_ID FROM UploadedFiles WHERE FileName=%s", (name,)
+        )
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def file_with_sha256(sha256: str) -> Optional[str]:
+    ensure_table()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT FileName FROM UploadedFiles WHERE SHA256=%s LIMIT 1", (sha256,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def library_hashes() -> Dict[str, str]:
+    """{sha256: file name} for every hashed library file."""
+    ensure_table()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT SHA256, FileName FROM UploadedFiles WHERE SHA256 IS NOT NULL")
+        return {row[0]: row[1] for row in cursor.fetchall() or []}
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def link_document(cursor: Any, doc_id: int, old_path: Optional[str], new_path: Optional[str]) -> None:
+    """Keep Document_ID in step when a document's File_Path moves to or from a library file."""
+    if old_path == new_path:
+        return
+    ensure_table()
+    if old_path and old_path.startswith("/uploads/"):
+        cursor.execute(
+            "UPDATE UploadedFiles SET Document_ID=NULL WHERE FileName=%s AND Document_ID=%s",
+            (old_path[len("/uploads/"):], doc_id),
+        )
+    if new_path and new_path.startswith("/uploads/"):
+        cursor.execute(
+            "UPDATE UploadedFiles SET Document_ID=%s WHERE FileName=%s",
+            (doc_id, new_path[len("/uploads/"):]),
+        )
+
+
+def list_files(page: int, per_page: int, q: Optional[str] = None, sort: str = "mtime",
+               order: str = "desc", linked: Optional[bool] = None) -> Tuple[List[Dict[str, Any]], int]:
+    """One page of the catalog and the total matching count."""
+    _ensure_initial_scan()
+    column = SORT_COLUMNS.get(sort, "MTime")
+    direction = "ASC" if str(order).lower() == "asc" else "DESC"
+    where, params = [], []
+    if q:
+        where.append("FileName LIKE %s")
+        params.append("%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+    if linked is not None:
+        where.append("Document_ID IS NOT NULL" if linked else "Document_ID IS NULL")
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+    ensure_table()
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(f"SELECT COUNT(*) AS total FROM UploadedFiles {where_sql}", params)
+        total = int((cursor.fetchone() or {}).get("total") or 0)
+        # FileName breaks ties so pages never overlap.
+        cursor.execute(
+            f"""
+            SELECT FileName, SizeBytes, MTime, SHA256, Document_ID
+            FROM UploadedFiles {where_sql}
+            ORDER BY {column} {direction}, FileName {direction}
+            LIMIT %s OFFSET %s
+            """,
+            params + [per_page, (page - 1) * per_page],
+        )
+        rows = cursor.fetchall() or []
+    finally:
+        cursor.close()
+        conn.close()
+    files = [
+        {
+            "file": row["FileName"],
+            "size": int(row["SizeBytes"]),
+            "mtime": int(row["MTime"]),
+            "sha256": row["SHA256"],
+            "document_id": row["Document_ID"],
+            "url": f"/uploads/{row['FileName']}",
+        }
+        for row in rows
+    ]
+    return files, total
+
+
+def _ensure_initial_scan() -> None:
+    # A fresh install has an empty table until the first scheduled re-scan;
+    # fill it once inline so the first listing is complete.
+    global _initial_scan_done
+    if _initial_scan_done:
+        return
+    with _initial_scan_lock:
+        if _initial_scan_done:
+            return
+        ensure_table()
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT 1 FROM UploadedFiles LIMIT 1")
+            empty = cursor.fetchone() is None
+        finally:
+            cursor.close()
+            conn.close()
+        if empty:
+            reconcile()
+        _initial_scan_done = True
+
+
+def reconcile() -> Dict[str, int]:
+    """Scheduled job: bring the catalog in line with the folder and with Documents."""
+    folder = Config.UPLOAD_FOLDER
+    started = time.monotonic()
+    on_disk: Dict[str, Tuple[int, int]] = {}
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                try:
+                    if _listable(entry):
+                        stat = entry.stat()
+                        on_disk[entry.name] = (stat.st_size, int(stat.st_mtime))
+                except OSError:
+                    continue
+    except FileNotFoundError:
+        pass
+
+    ensure_table()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    stats = {"added": 0, "updated": 0, "removed": 0}
+    try:
+        cursor.execute("SELECT FileName, SizeBytes, MTime FROM UploadedFiles")
+        known = {name: (int(size), int(mtime)) for name, size, mtime in cursor.fetchall() or []}
+
+        upserts = []
+        for name, (size, mtime) in on_disk.items():
+            current = known.get(name)
+            if current == (size, mtime):
+                continue
+            try:
+                sha256 = hash_file(os.path.join(folder, name))
+            except OSError:
+                continue
+            upserts.append((name, size, mtime, sha256))
+            stats["added" if current is None else "updated"] += 1
+        for i in range(0, len(upserts), _BATCH):
+            cursor.executemany(
+                """
+                INSERT INTO UploadedFiles (FileName, SizeBytes, MTime, SHA256)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE SizeBytes=VALUES(SizeBytes), MTime=VALUES(MTime),
+                    SHA256=VALUES(SHA256), ScannedAt=NOW()
+                """,
+                upserts[i:i + _BATCH],
+            )
+            conn.commit()
+
+        gone = [(name,) for name in known if name not in on_disk]
+        for i in range(0, len(gone), _BATCH):
+            cursor.executemany("DELETE FROM UploadedFiles WHERE FileName=%s", gone[i:i + _BATCH])
+            conn.commit()
+        stats["removed"] = len(gone)
+
+        # Document links: drop stale ones, then set from Documents.File_Path.
+        cursor.execute(
+            """
+            UPDATE UploadedFiles uf
+            LEFT JOIN Documents d
+                ON d.Document_ID = uf.Document_ID AND d.File_Path = CONCAT('/uploads/', uf.FileName)
+            SET uf.Document_ID = NULL
+            WHERE uf.Document_ID IS NOT NULL AND d.Document_ID IS NULL
+            """
+        )
+        cursor.execute(
+            """
+            UPDATE Documents d
+            JOIN UploadedFiles uf ON uf.FileName = SUBSTRING(d.File_Path, 10)
+            SET uf.Document_ID = d.Document_ID
+            WHERE d.File_Path LIKE '/uploads/%' AND uf.Document_ID IS NULL
+            """
+        )
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    if any(stats.values()):
+        print(f"[upload_catalog] Reconciled in {time.monotonic() - started:.1f}s: {stats}")
+    return stats
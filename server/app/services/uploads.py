@@ -0,0 +1,351 @@
+"""
+Streaming upload storage.
+
+save_upload() copies an upload to its destination in fixed-size chunks,
+checking the PDF signature, the size limit and the SHA-256 as it writes.
+Memory stays constant whatever the file size, and an oversize or non-PDF
+upload is abandoned as soon as it is detected instead of after a full save.
+
+Large scanned archives can use resumable upload sessions instead of a single
+multipart request. The client declares the size, sends the file as ordered
+chunks with their byte offset, and can ask for the current offset after a
+dropped connection and continue from there. Session state lives in
+UPLOAD_FOLDER/.sessions (a .part file plus a small JSON record), so any
+worker on the host can take the next chunk. Each process keeps a running
+SHA-256 of the sessions whose chunks it received in order. On finish only the
+bytes that arrived through other processes are read back. With a single
+worker, or sticky routing, that is none of them.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+from app.config import Config
+
+CHUNK_SIZE = 1024 * 1024
+PDF_SIGNATURE = b"%PDF-"
+# The PDF header may be preceded by junk bytes; readers accept it within 1 KiB.
+_SIGNATURE_WINDOW = 1024
+_SESSION_DIR = ".sessions"
+SESSION_MAX_AGE_SECONDS = 24 * 3600
+_DIGEST_CACHE_SIZE = 256
+
+# upload_id -> (bytes covered, running sha256) for sessions fed by this process.
+_session_digests: "OrderedDict[str, Tuple[int, Any]]" = OrderedDict()
+_session_digests_lock = Lock()
+
+
+class UploadError(Exception):
+    """An upload was rejected; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status: int = 400, offset: Optional[int] = None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.offset = offset
+
+
+class StoredUpload:
+    def __init__(self, path: str, size: int, sha256: str):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"file": self.name, "size": self.size, "sha256": self.sha256}
+
+
+def max_upload_bytes() -> int:
+    return max(1, Config.UPLOAD_MAX_BYTES)
+
+
+def _too_large(limit: int) -> UploadError:
+    if limit >= 1024 * 1024:
+        return UploadError(f"File exceeds the {limit // (1024 * 1024)} MB limit.", 413)
+    return UploadError(f"File exceeds the {limit} byte limit.", 413)
+
+
+def check_declared_size(size: Optional[int]) -> None:
+    """Reject early from a Content-Length or declared size, before reading the body."""
+    if size is not None and size > max_upload_bytes():
+        raise _too_large(max_upload_bytes())
+
+
+def _check_signature(head: bytes) -> None:
+    if PDF_SIGNATURE not in head[:_SIGNATURE_WINDOW]:
+        raise UploadError("File is not a PDF.", 415)
+
+
+def _copy_stream(source: BinaryIO, target: BinaryIO, digest, written: int, limit: int,
+                 max_read: Optional[int] = None, check_signature: bool = True) -> int:
+    """Copy `source` into `target`, updating `digest`. Returns the new total written."""
+    head = b""
+    remaining = max_read
+    while remaining is None or remaining > 0:
+        chunk = source.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        written += len(chunk)
+        if written > limit:
+            raise _too_large(limit)
+        if check_signature:
+            head += chunk[:_SIGNATURE_WINDOW - len(head)]
+            if len(head) >= _SIGNATURE_WINDOW:
+                _check_signature(head)
+                check_signature = False
+        if digest is not None:
+            digest.update(chunk)
+        target.write(chunk)
+        if remaining is not None:
+            remaining -= len(chunk)
+    if check_signature:
+        # Shorter than the signature window: check what arrived.
+        _check_signature(head)
+    return written
+
+
+def save_upload(stream: BinaryIO, dest_path: str) -> StoredUpload:
+    """
+    Stream `stream` to `dest_path` while hashing and validating it.
+    The file appears at dest_path only once it is complete and valid.
+    """
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    tmp_path = f"{dest_path}.{uuid.uuid4().hex}.tmp"
+    digest = hashlib.sha256()
+    try:
+        with open(tmp_path, "wb") as target:
+            size = _copy_stream(stream, target, digest, 0, max_upload_bytes())
+        if size == 0:
+            raise UploadError("File is empty.")
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return StoredUpload(dest_path, size, digest.hexdigest())
+
+
+def save_file_storage(file_storage, dest_path: str) -> StoredUpload:
+    """save_upload() for a werkzeug FileStorage from request.files."""
+    file_storage.stream.seek(0)
+    return save_upload(file_storage.stream, dest_path)
+
+
+def _hash_from(path: str, start: int, digest) -> None:
+    with open(path, "rb") as handle:
+        handle.seek(start)
+        for chunk in iter(lambda: handle.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    _hash_from(path, 0, digest)
+    return digest.hexdigest()
+
+
+def place_unique(stored: StoredUpload, folder: str, name: str) -> tuple:
+    """
+    Move a stored upload to `name` in `folder` without replacing a different
+    file of the same name: a clash gets a numbered name instead. Returns
+    (final_name, duplicate); duplicate means an identical file already had the
+    name, so the new copy was dropped.
+    """
+    stem, ext = os.path.splitext(name)
+    counter = 1
+    while True:
+        candidate = name if counter == 1 else f"{stem}_{counter}{ext}"
+        dest = os.path.join(folder, candidate)
+        try:
+            # O_EXCL reserves the name atomically against concurrent uploads.
+            os.close(os.open(dest, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+        except FileExistsError:
+            try:
+                same = os.path.getsize(dest) == stored.size and hash_file(dest) == stored.sha256
+            except OSError:
+                same = False
+            if same:
+                os.remove(stored.path)
+                return candidate, True
+            counter += 1
+            continue
+        os.replace(stored.path, dest)
+        return candidate, False
+
+
+# ---------------- resumable sessions ----------------
+
+def _session_dir() -> str:
+    return os.path.join(Config.UPLOAD_FOLDER, _SESSION_DIR)
+
+
+def _session_paths(upload_id: str) -> tuple:
+    if not upload_id or not all(c in "0123456789abcdef" for c in upload_id) or len(upload_id) != 32:
+        raise UploadError("Unknown upload session.", 404)
+    base = os.path.join(_session_dir(), upload_id)
+    return f"{base}.json", f"{base}.part"
+
+
+def _session_view(record: Dict[str, Any], offset: int) -> Dict[str, Any]:
+    return {
+        "upload_id": record["upload_id"],
+        "filename": record["filename"],
+        "size": record["size"],
+        "offset": offset,
+        "complete": offset >= record["size"],
+        "chunk_size": Config.UPLOAD_CHUNK_BYTES,
+    }
+
+
+def create_session(filename: str, size: int) -> Dict[str, Any]:
+    if size <= 0:
+        raise UploadError("Declared size must be positive.")
+    check_declared_size(size)
+    upload_id = uuid.uuid4().hex
+    meta_path, part_path = _session_paths(upload_id)
+    os.makedirs(_session_dir(), exist_ok=True)
+    record = {"upload_id": upload_id, "filename": filename, "size": int(size), "created_at": time.time()}
+    open(part_path, "wb").close()
+    with open(meta_path, "w", encoding="utf-8") as handle:
+        json.dump(record, handle)
+    return _session_view(record, 0)
+
+
+def _load_session(upload_id: str) -> tuple:
+    meta_path, part_path = _session_paths(upload_id)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as handle:
+            record = json.load(handle)
+        offset = os.path.getsize(part_path)
+    except (OSError, ValueError):
+        raise UploadError("Unknown upload session.", 404)
+    return record, part_path, offset
+
+
+def get_session(upload_id: str) -> Dict[str, Any]:
+    record, _, offset = _load_session(upload_id)
+    return _session_view(record, offset)
+
+
+def append_chunk(upload_id: str, offset: int, stream: BinaryIO, length: Optional[int]) -> Dict[str, Any]:
+    """
+    Append one chunk at `offset`. A mismatched offset (a retried or
+    out-of-order chunk) is answered with 409 and the current offset is
+    reported, so the client can resume from there.
+    """
+    record, part_path, current = _load_session(upload_id)
+    if offset != current:
+        raise UploadError(f"Expected offset {current}.", 409, offset=current)
+    if length is not None and length > Config.UPLOAD_CHUNK_BYTES:
+        raise UploadError(f"Chunks are limited to {Config.UPLOAD_CHUNK_BYTES} bytes.", 413)
+    remaining = record["size"] - current
+    if length is not None and length > remaining:
+        raise UploadError("Chunk runs past the declared size.", 413)
+    entry = _pop_digest(upload_id)
+    if current == 0:
+        entry = (0, hashlib.sha256())
+    digest = entry[1] if entry and entry[0] == current else None
+    with open(part_path, "r+b") as target:
+        target.seek(current)
+        try:
+            # The signature is checked on the first chunk only.
+            written = _copy_stream(
+                stream, target, digest, current, record["size"],
+                max_read=min(remaining, Config.UPLOAD_CHUNK_BYTES),
+                check_signature=current == 0,
+            )
+        except UploadError:
+            # Drop the partial chunk so the session stays resumable. A digest
+            # that saw part of it is useless; one that was behind still counts.
+            target.truncate(current)
+            if entry and digest is None:
+                _keep_digest(upload_id, *entry)
+            raise
+    if digest is not None:
+        _keep_digest(upload_id, written, digest)
+    elif entry:
+        # Chunks went to another worker meanwhile; finish reads only the gap.
+        _keep_digest(upload_id, *entry)
+    return _session_view(record, written)
+
+
+def _pop_digest(upload_id: str) -> Optional[Tuple[int, Any]]:
+    with _session_digests_lock:
+        return _session_digests.pop(upload_id, None)
+
+
+def _keep_digest(upload_id: str, covered: int, digest) -> None:
+    with _session_digests_lock:
+        _session_digests[upload_id] = (covered, digest)
+        while len(_session_digests) > _DIGEST_CACHE_SIZE:
+            _session_digests.popitem(last=False)
+
+
+def finish_session(upload_id: str, dest_path: str) -> StoredUpload:
+    """
+    Move a completed session's file to dest_path. Only the bytes this
+    process has not already hashed are read.
+    """
+    record, part_path, offset = _load_session(upload_id)
+    if offset < record["size"]:
+        raise UploadError(f"Upload incomplete ({offset} of {record['size']} bytes).", 409)
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    entry = _pop_digest(upload_id)
+    covered, digest = entry if entry and entry[0] <= offset else (0, hashlib.sha256())
+    if covered < offset:
+        _hash_from(part_path, covered, digest)
+    sha256 = digest.hexdigest()
+    os.replace(part_path, dest_path)
+    abort_session(upload_id)
+    return StoredUpload(dest_path, offset, sha256)
+
+
+def session_filename(upload_id: str) -> str:
+    record, _, _ = _load_session(upload_id)
+    return record["filename"]
+
+
+def abort_session(upload_id: str) -> None:
+    paths = _session_paths(upload_id)
+    _pop_digest(upload_id)
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def purge_stale_sessions() -> int:
+    """Scheduled clean-up of sessions abandoned for SESSION_MAX_AGE_SECONDS."""
+    directory = _session_dir()
+    if not os.path.isdir(directory):
+        return 0
+    cutoff = time.time() - SESSION_MAX_AGE_SECONDS
+    removed = 0
+    for entry in os.scandir(directory):
+        if not entry.name.endswith(".json"):
+            continue
+        upload_id = entry.name[:-5]
+        try:
+            part_mtime = os.path.getmtime(os.path.join(directory, f"{upload_id}.part"))
+        except OSError:
+            part_mtime = 0
+        if max(entry.stat().st_mtime, part_mtime) < cutoff:
+            abort_session(upload_id)
+            removed += 1
+    if removed:
+        print(f"[uploads] Purged {removed} abandoned upload sessions")
+    return removed
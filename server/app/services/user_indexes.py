@@ -0,0 +1,48 @@
+"""
+Indexes behind GET /api/users filtering, search and name paging.
+
+schema/kcls_db.sql declares them for new installs. Existing databases get
+them here, once per process, with CREATE INDEX IF NOT EXISTS (MariaDB), so
+they are in place before the first list query relies on them.
+"""
+from __future__ import annotations
+
+from threading import Lock
+
+from app.db import get_db_connection
+
+USER_LIST_INDEXES = (
+    ("Users", "idx_users_role", "Role"),
+    ("UserDetails", "idx_userdetails_name", "Lastname, Firstname"),
+    ("UserDetails", "idx_userdetails_firstname", "Firstname"),
+    ("UserDetails", "idx_userdetails_email", "Email"),
+    ("Borrowers", "idx_borrowers_status", "AccountStatus, Type"),
+    ("Borrowers", "idx_borrowers_type", "Type"),
+)
+
+_ready = False
+_ready_lock = Lock()
+
+
+def ensure_indexes() -> bool:
+    """Create any missing user-list index once per process."""
+    global _ready
+    if _ready:
+        return True
+    with _ready_lock:
+        if _ready:
+            return True
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            # DDL commits implicitly, so it runs on its own connection rather
+            # than inside a route's transaction.
+            for table, name, columns in USER_LIST_INDEXES:
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+            _ready = True
+        except Exception as exc:
+            print(f"[user_indexes] Setup failed: {exc}")
+        finally:
+            cursor.close()
+            conn.close()
+    return _ready
@@ -23,6 +23,22 @@ SET time_zone = "+00:00";
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `ActiveLoans`
+--
+
+CREATE TABLE `ActiveLoans` (
+  `BorrowID` int(11) NOT NULL,
+  `BorrowerID` int(11) NOT NULL,
+  `ApprovalStatus` enum('Pending','Approved') NOT NULL,
+  `DueDate` date DEFAULT NULL,
+  `IsDigital` tinyint(1) NOT NULL DEFAULT 0,
+  `Route` enum('librarian','admin') NOT NULL,
+  `UpdatedAt` datetime NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp()
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_uca1400_ai_ci;
+
+-- --------------------------------------------------------
+
 --
 -- Table structure for table `ActionTypes`
 --
@@ -34,6 +50,37 @@ CREATE TABLE `ActionTypes` (
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `AnalysisJobs`
+--
+
+CREATE TABLE `AnalysisJobs` (
+  `JobID` char(32) NOT NULL,
+  `Status` enum('queued','running','done','failed','cancelled') NOT NULL DEFAULT 'queued',
+  `FileName` varchar(255) NOT NULL,
+  `SaveOriginal` tinyint(1) NOT NULL DEFAULT 0,
+  `Result` longtext DEFAULT NULL,
+  `Error` text DEFAULT NULL,
+  `CreatedAt` datetime NOT NULL DEFAULT current_timestamp(),
+  `StartedAt` datetime DEFAULT NULL,
+  `FinishedAt` datetime DEFAULT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_uca1400_ai_ci;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `AttachmentFiles`
+--
+
+CREATE TABLE `AttachmentFiles` (
+  `Path` varchar(500) NOT NULL,
+  `SizeBytes` bigint(20) NOT NULL,
+  `SHA256` char(64) NOT NULL,
+  `RecordedAt` datetime NOT NULL DEFAULT current_timestamp()
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_uca1400_ai_ci;
+
+-- --------------------------------------------------------
+
 --
 -- Table structure for table `AuditLog`
 --
@@ -173,6 +220,33 @@ CREATE TABLE `Document_Inventory` (
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `FileBlobs`
+--
+
+CREATE TABLE `FileBlobs` (
+  `SHA256` char(64) NOT NULL,
+  `SizeBytes` bigint(20) NOT NULL,
+  `RefCount` int(11) NOT NULL DEFAULT 0,
+  `CreatedAt` datetime NOT NULL DEFAULT current_timestamp(),
+  `UpdatedAt` datetime NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp()
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_uca1400_ai_ci;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `LoginLockouts`
+--
+
+CREATE TABLE `LoginLockouts` (
+  `LockKey` varchar(191) NOT NULL,
+  `Failures` text NOT NULL,
+  `LockedUntil` double DEFAULT NULL,
+  `ExpiresAt` double NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_uca1400_ai_ci;
+
+-- --------------------------------------------------------
+
 --
 -- Table structure for table `Notifications`
 --
@@ -223,9 +297,9 @@ CREATE TABLE `Notification_Types` (
 CREATE TABLE `PasswordResetCodes` (
   `ResetID` int(11) NOT NULL,
   `UserID` int(11) NOT NULL,
-  `CodeHash` varchar(255) NOT NULL,
+  `CodeDigest` char(64) NOT NULL,
   `ExpiresAt` datetime NOT NULL,
-  `Consumed` tinyint(1) NOT NULL DEFAULT 0,
+  `Attempts` int(11) NOT NULL DEFAULT 0,
   `CreatedAt` datetime NOT NULL DEFAULT current_timestamp()
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_uca1400_ai_ci;
 
@@ -260,6 +334,25 @@ CREATE TABLE `ReturnTransactions` (
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `ScheduledJobs`
+--
+
+CREATE TABLE `ScheduledJobs` (
+  `JobName` varchar(64) NOT NULL,
+  `LastSlot` datetime DEFAULT NULL,
+  `LastStartedAt` datetime DEFAULT NULL,
+  `LastFinishedAt` datetime DEFAULT NULL,
+  `LastStatus` varchar(16) DEFAULT NULL,
+  `LastError` text DEFAULT NULL,
+  `LastDurationMs` int(11) DEFAULT NULL,
+  `RunBy` varchar(128) DEFAULT NULL,
+  `ClaimedBy` varchar(128) DEFAULT NULL,
+  `ClaimedUntil` datetime DEFAULT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_uca1400_ai_ci;
+
+-- --------------------------------------------------------
+
 --
 -- Table structure for table `Staff`
 --
@@ -295,6 +388,21 @@ CREATE TABLE `TargetTypes` (
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `UploadedFiles`
+--
+
+CREATE TABLE `UploadedFiles` (
+  `FileName` varchar(255) NOT NULL,
+  `SizeBytes` bigint(20) NOT NULL,
+  `MTime` bigint(20) NOT NULL,
+  `SHA256` char(64) DEFAULT NULL,
+  `Document_ID` int(11) DEFAULT NULL,
+  `ScannedAt` datetime NOT NULL DEFAULT current_timestamp()
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_uca1400_ai_ci;
+
+-- --------------------------------------------------------
+
 --
 -- Table structure for table `UserDetails`
 --
@@ -330,12 +438,34 @@ CREATE TABLE `Users` (
 -- Indexes for dumped tables
 --
 
+--
+-- Indexes for table `ActiveLoans`
+--
+ALTER TABLE `ActiveLoans`
+  ADD PRIMARY KEY (`BorrowID`),
+  ADD KEY `idx_activeloans_due` (`ApprovalStatus`,`DueDate`),
+  ADD KEY `idx_activeloans_digital_due` (`IsDigital`,`ApprovalStatus`,`DueDate`),
+  ADD KEY `idx_activeloans_borrower` (`BorrowerID`);
+
 --
 -- Indexes for table `ActionTypes`
 --
 ALTER TABLE `ActionTypes`
   ADD PRIMARY KEY (`ActionCode`);
 
+--
+-- Indexes for table `AnalysisJobs`
+--
+ALTER TABLE `AnalysisJobs`
+  ADD PRIMARY KEY (`JobID`),
+  ADD KEY `idx_analysisjobs_status` (`Status`,`CreatedAt`);
+
+--
+-- Indexes for table `AttachmentFiles`
+--
+ALTER TABLE `AttachmentFiles`
+  ADD PRIMARY KEY (`Path`);
+
 --
 -- Indexes for table `AuditLog`
 --
@@ -367,7 +497,7 @@ ALTER TABLE `Book_Inventory`
 --
 ALTER TABLE `BorrowedItems`
   ADD PRIMARY KEY (`BorrowedItemID`),
-  ADD KEY `idx_borroweditems_borrow` (`BorrowID`),
+  ADD KEY `idx_borroweditems_borrow` (`BorrowID`,`ItemType`),
   ADD KEY `idx_borroweditems_bookcopy` (`BookCopyID`),
   ADD KEY `idx_borroweditems_docstorage` (`DocumentStorageID`),
   ADD KEY `idx_borroweditems_document` (`Document_ID`);
@@ -377,7 +507,9 @@ ALTER TABLE `BorrowedItems`
 --
 ALTER TABLE `Borrowers`
   ADD PRIMARY KEY (`BorrowerID`),
-  ADD UNIQUE KEY `ux_borrowers_user` (`UserID`);
+  ADD UNIQUE KEY `ux_borrowers_user` (`UserID`),
+  ADD KEY `idx_borrowers_status` (`AccountStatus`,`Type`),
+  ADD KEY `idx_borrowers_type` (`Type`);
 
 --
 -- Indexes for table `BorrowTransactions`
@@ -385,7 +517,9 @@ ALTER TABLE `Borrowers`
 ALTER TABLE `BorrowTransactions`
   ADD PRIMARY KEY (`BorrowID`),
   ADD KEY `idx_borrow_borrower` (`BorrowerID`),
-  ADD KEY `idx_borrow_staff` (`ApprovedByStaffID`);
+  ADD KEY `idx_borrow_staff` (`ApprovedByStaffID`),
+  ADD KEY `idx_borrow_approval` (`ApprovalStatus`),
+  ADD KEY `idx_borrow_date` (`BorrowDate`);
 
 --
 -- Indexes for table `Documents`
@@ -401,13 +535,28 @@ ALTER TABLE `Document_Inventory`
   ADD KEY `idx_docinv_document` (`Document_ID`),
   ADD KEY `idx_docinv_storage` (`StorageLocation`);
 
+--
+-- Indexes for table `FileBlobs`
+--
+ALTER TABLE `FileBlobs`
+  ADD PRIMARY KEY (`SHA256`),
+  ADD KEY `idx_fileblobs_gc` (`RefCount`,`UpdatedAt`);
+
+--
+-- Indexes for table `LoginLockouts`
+--
+ALTER TABLE `LoginLockouts`
+  ADD PRIMARY KEY (`LockKey`),
+  ADD KEY `idx_loginlockouts_expires` (`ExpiresAt`);
+
 --
 -- Indexes for table `Notifications`
 --
 ALTER TABLE `Notifications`
   ADD PRIMARY KEY (`NotificationID`),
   ADD KEY `idx_notifications_type` (`Type`),
-  ADD KEY `idx_notifications_created` (`CreatedAt`);
+  ADD KEY `idx_notifications_created` (`CreatedAt`),
+  ADD KEY `idx_notifications_related` (`RelatedType`,`RelatedID`,`Type`,`CreatedAt`);
 
 --
 -- Indexes for table `Notification_Recipients`
@@ -428,7 +577,9 @@ ALTER TABLE `Notification_Types`
 --
 ALTER TABLE `PasswordResetCodes`
   ADD PRIMARY KEY (`ResetID`),
-  ADD KEY `idx_user_expires` (`UserID`,`ExpiresAt`);
+  ADD UNIQUE KEY `uq_reset_user` (`UserID`),
+  ADD UNIQUE KEY `uq_reset_digest` (`CodeDigest`),
+  ADD KEY `idx_reset_expires` (`ExpiresAt`);
 
 --
 -- Indexes for table `ReturnedItems`
@@ -443,9 +594,15 @@ ALTER TABLE `ReturnedItems`
 --
 ALTER TABLE `ReturnTransactions`
   ADD PRIMARY KEY (`ReturnID`),
-  ADD KEY `idx_return_borrow` (`BorrowID`),
+  ADD KEY `idx_return_borrow` (`BorrowID`,`ReturnDate`),
   ADD KEY `idx_return_staff` (`ReceivedByStaffID`);
 
+--
+-- Indexes for table `ScheduledJobs`
+--
+ALTER TABLE `ScheduledJobs`
+  ADD PRIMARY KEY (`JobName`);
+
 --
 -- Indexes for table `Staff`
 --
@@ -465,18 +622,32 @@ ALTER TABLE `Storages`
 ALTER TABLE `TargetTypes`
   ADD PRIMARY KEY (`TargetTypeCode`);
 
+--
+-- Indexes for table `UploadedFiles`
+--
+ALTER TABLE `UploadedFiles`
+  ADD PRIMARY KEY (`FileName`),
+  ADD KEY `idx_uploadedfiles_mtime` (`MTime`),
+  ADD KEY `idx_uploadedfiles_size` (`SizeBytes`),
+  ADD KEY `idx_uploadedfiles_document` (`Document_ID`),
+  ADD KEY `idx_uploadedfiles_sha` (`SHA256`);
+
 --
 -- Indexes for table `UserDetails`
 --
 ALTER TABLE `UserDetails`
-  ADD PRIMARY KEY (`UserID`);
+  ADD PRIMARY KEY (`UserID`),
+  ADD KEY `idx_userdetails_name` (`Lastname`,`Firstname`),
+  ADD KEY `idx_userdetails_firstname` (`Firstname`),
+  ADD KEY `idx_userdetails_email` (`Email`);
 
 --
 -- Indexes for table `Users`
 --
 ALTER TABLE `Users`
   ADD PRIMARY KEY (`UserID`),
-  ADD UNIQUE KEY `ux_users_username` (`Username`);
+  ADD UNIQUE KEY `ux_users_username` (`Username`),
+  ADD KEY `idx_users_role` (`Role`);
 
 --
 -- AUTO_INCREMENT for dumped tables
@@ -582,6 +753,12 @@ ALTER TABLE `Users`
 -- Constraints for dumped tables
 --
 
+--
+-- Constraints for table `ActiveLoans`
+--
+ALTER TABLE `ActiveLoans`
+  ADD CONSTRAINT `fk_activeloans_borrow` FOREIGN KEY (`BorrowID`) REFERENCES `BorrowTransactions` (`BorrowID`) ON DELETE CASCADE;
+
 --
 -- Constraints for table `AuditLog`
 --